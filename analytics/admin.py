@@ -0,0 +1,14 @@
+from django.contrib import admin
+from .models import PropertyDailyStats, PropertyMonthlyStats
+
+@admin.register(PropertyDailyStats)
+class PropertyDailyStatsAdmin(admin.ModelAdmin):
+    """Read-mostly view of the daily rollups."""
+    list_display = ('property', 'date', 'booked_nights', 'booking_revenue', 'payment_revenue', 'review_count')
+    list_filter = ('date',)
+
+@admin.register(PropertyMonthlyStats)
+class PropertyMonthlyStatsAdmin(admin.ModelAdmin):
+    """Read-mostly view of the monthly rollups."""
+    list_display = ('property', 'month', 'booked_nights', 'booking_revenue', 'payment_revenue', 'review_count')
+    list_filter = ('month',)
@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class AnalyticsConfig(AppConfig):
+    """
+    Configuration class for the analytics app.
+    """
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'analytics'
+    verbose_name = 'Host Analytics'
+
+    def ready(self):
+        # Import signals here to avoid circular imports
+        import analytics.signals  # noqa
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from analytics.rollups import rebuild_property
+from core.models import Property
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily and monthly host analytics rollups from bookings, payments and reviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--property', type=int, help='Only rebuild this property id.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Rebuilding analytics rollups...'))
+
+        property_ids = Property.objects.values_list('property_id', flat=True)
+        if options['property']:
+            property_ids = property_ids.filter(property_id=options['property'])
+
+        count = 0
+        for property_id in property_ids.iterator():
+            rebuild_property(property_id)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rollups of {count} properties.'))
@@ -0,0 +1,43 @@
+from django.db import models
+
+
+class PropertyDailyStats(models.Model):
+    """
+    Per-property figures for one day, maintained by analytics.rollups.
+    Days without any activity have no row.
+    """
+    property = models.ForeignKey('core.Property', on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    booked_nights = models.PositiveIntegerField(default=0)
+    booking_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    payment_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('property', 'date')
+        verbose_name_plural = 'Property daily stats'
+
+    def __str__(self):
+        return f"{self.property_id} on {self.date}"
+
+
+class PropertyMonthlyStats(models.Model):
+    """
+    Per-property totals for one calendar month, summed from the daily rows.
+    """
+    property = models.ForeignKey('core.Property', on_delete=models.CASCADE, related_name='monthly_stats')
+    month = models.DateField(help_text='First day of the month')
+    days = models.PositiveIntegerField(help_text='Days in the month')
+    booked_nights = models.PositiveIntegerField(default=0)
+    booking_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    payment_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('property', 'month')
+        verbose_name_plural = 'Property monthly stats'
+
+    def __str__(self):
+        return f"{self.property_id} in {self.month:%Y-%m}"
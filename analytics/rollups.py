@@ -0,0 +1,211 @@
+"""
+Incremental maintenance of the per-property daily and monthly rollups.
+
+``refresh_days`` recomputes the daily rows of one property over a date range
+from bookings, payments and reviews, then re-sums the months that range
+touches. The signal handlers call it with just the days a change affects, so
+the dashboard never aggregates raw bookings, payments or reviews.
+
+Figures per day:
+
+* ``booked_nights`` / ``booking_revenue``: nights of paid or confirmed
+  bookings, each night carrying an equal share of the booking's total price.
+* ``payment_revenue``: successful ``financial.Payment`` amounts recorded for
+  the property that day.
+* ``review_count`` / ``rating_sum``: reviews posted that day.
+"""
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from core.models import Booking, Property, Review
+from financial.models import Payment
+from .models import PropertyDailyStats, PropertyMonthlyStats
+
+# Bookings that occupy nights and earn revenue
+REVENUE_BOOKING_STATUSES = ('paid', 'confirmed')
+CENT = Decimal('0.01')
+METRICS = ('booked_nights', 'booking_revenue', 'payment_revenue', 'review_count', 'rating_sum')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def months_between(first, last):
+    """First days of the months containing days ``[first, last)``."""
+    month = month_start(first)
+    while month < last:
+        yield month
+        month = (month + timedelta(days=32)).replace(day=1)
+
+
+def _daily_figures(property_id, first, last):
+    days = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+
+    bookings = Booking.objects.filter(
+        property_id=property_id, status__in=REVENUE_BOOKING_STATUSES,
+        check_in_date__lt=last, check_out_date__gt=first,
+    ).values_list('check_in_date', 'check_out_date', 'total_price')
+    for check_in_date, check_out_date, total_price in bookings:
+        nights = (check_out_date - check_in_date).days
+        nightly = (total_price or Decimal(0)) / nights
+        for offset in range(max((first - check_in_date).days, 0), min((last - check_in_date).days, nights)):
+            day = days[check_in_date + timedelta(days=offset)]
+            day['booked_nights'] += 1
+            day['booking_revenue'] += nightly
+
+    payments = Payment.objects.filter(
+        property_id=str(property_id), status=Payment.StatusChoices.SUCCESS,
+        created_at__date__gte=first, created_at__date__lt=last,
+    ).values_list('created_at', 'amount')
+    for created_at, amount in payments:
+        days[timezone.localdate(created_at)]['payment_revenue'] += amount
+
+    reviews = Review.objects.filter(
+        property_id=property_id, created_at__date__gte=first, created_at__date__lt=last,
+    ).values_list('created_at', 'rating')
+    for created_at, rating in reviews:
+        day = days[timezone.localdate(created_at)]
+        day['review_count'] += 1
+        day['rating_sum'] += rating
+
+    return days
+
+
+def refresh_days(property_id, first, last):
+    """Recompute the rollups of days ``[first, last)`` of one property."""
+    if first >= last:
+        return
+    days = _daily_figures(property_id, first, last)
+    with transaction.atomic():
+        PropertyDailyStats.objects.filter(property_id=property_id, date__gte=first, date__lt=last).delete()
+        rows = []
+        for day, figures in sorted(days.items()):
+            # Nightly shares are exact fractions until stored
+            figures['booking_revenue'] = Decimal(figures['booking_revenue']).quantize(CENT)
+            rows.append(PropertyDailyStats(property_id=property_id, date=day, **figures))
+        PropertyDailyStats.objects.bulk_create(rows)
+        for month in months_between(first, last):
+            refresh_month(property_id, month)
+
+
+def refresh_month(property_id, month):
+    """Re-sum one month from its (at most 31) daily rows."""
+    days_in_month = monthrange(month.year, month.month)[1]
+    totals = PropertyDailyStats.objects.filter(
+        property_id=property_id, date__gte=month, date__lt=month + timedelta(days=days_in_month)
+    ).aggregate(**{metric: Sum(metric) for metric in METRICS})
+    if not any(totals.values()):
+        PropertyMonthlyStats.objects.filter(property_id=property_id, month=month).delete()
+        return
+    PropertyMonthlyStats.objects.update_or_create(
+        property_id=property_id, month=month,
+        defaults={'days': days_in_month, **{metric: totals[metric] or 0 for metric in METRICS}},
+    )
+
+
+def rebuild_property(property_id):
+    """Recompute every rollup of a property from scratch."""
+    bounds = [
+        Booking.objects.filter(property_id=property_id).aggregate(first=Min('check_in_date'), last=Max('check_out_date')),
+        Review.objects.filter(property_id=property_id).aggregate(first=Min('created_at__date'), last=Max('created_at__date')),
+        Payment.objects.filter(property_id=str(property_id)).aggregate(
+            first=Min('created_at__date'), last=Max('created_at__date')
+        ),
+    ]
+    firsts = [bound['first'] for bound in bounds if bound['first']]
+    lasts = [bound['last'] for bound in bounds if bound['last']]
+    with transaction.atomic():
+        PropertyDailyStats.objects.filter(property_id=property_id).delete()
+        PropertyMonthlyStats.objects.filter(property_id=property_id).delete()
+        if firsts:
+            refresh_days(property_id, month_start(min(firsts)), max(lasts) + timedelta(days=1))
+
+
+def spans(instance):
+    """The ``(property_id, first, last)`` day ranges a booking, payment or review contributes to."""
+    if isinstance(instance, Booking):
+        return [(instance.property_id, instance.check_in_date, instance.check_out_date)]
+    if isinstance(instance, Payment):
+        if not (instance.property_id or '').isdigit() or instance.created_at is None:
+            return []
+        day = timezone.localdate(instance.created_at)
+        return [(int(instance.property_id), day, day + timedelta(days=1))]
+    if instance.created_at is None:
+        return []
+    day = timezone.localdate(instance.created_at)
+    return [(instance.property_id, day, day + timedelta(days=1))]
+
+
+def refresh_spans(changed):
+    """
+    Refresh each property once over the union of its changed ranges, skipping
+    properties that do not exist (payments only name them by id).
+    """
+    ranges = {}
+    for property_id, first, last in changed:
+        if property_id in ranges:
+            first, last = min(first, ranges[property_id][0]), max(last, ranges[property_id][1])
+        ranges[property_id] = (first, last)
+    if not ranges:
+        return
+    existing = set(Property.objects.filter(pk__in=ranges).values_list('pk', flat=True))
+    for property_id, (first, last) in ranges.items():
+        if property_id in existing:
+            refresh_days(property_id, first, last)
+
+
+def schedule_refresh(changed):
+    """
+    ``refresh_spans`` once the surrounding transaction commits. Deletions use
+    it: when a property is deleted, its bookings and reviews go first, and
+    refreshing then would recreate rollups of the property being deleted.
+    """
+    changed = list(changed)
+    if changed:
+        transaction.on_commit(lambda: refresh_spans(changed))
+
+
+def monthly_rows(properties, first_month, last_month):
+    """Dashboard read: monthly rollups of ``properties`` between two months (inclusive)."""
+    return PropertyMonthlyStats.objects.filter(
+        property__in=properties, month__gte=first_month, month__lte=last_month
+    ).order_by('property_id', 'month')
+
+
+def daily_rows(properties, first_day, last_day):
+    """Dashboard read: daily rollups of ``properties`` between two days (inclusive)."""
+    return PropertyDailyStats.objects.filter(
+        property__in=properties, date__gte=first_day, date__lte=last_day
+    ).order_by('property_id', 'date')
+
+
+def current_month():
+    return month_start(timezone.localdate())
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def period_metrics(figures, days):
+    """Dashboard metrics of one period from its summed figures."""
+    booked_nights = figures.get('booked_nights') or 0
+    booking_revenue = Decimal(figures.get('booking_revenue') or 0)
+    review_count = figures.get('review_count') or 0
+    return {
+        'booked_nights': booked_nights,
+        'occupancy_rate': round(booked_nights / days, 4) if days else 0,
+        'average_daily_rate': (booking_revenue / booked_nights).quantize(CENT) if booked_nights else None,
+        'booking_revenue': booking_revenue.quantize(CENT),
+        'payment_revenue': Decimal(figures.get('payment_revenue') or 0).quantize(CENT),
+        'review_count': review_count,
+        'review_score': round((figures.get('rating_sum') or 0) / review_count, 2) if review_count else None,
+    }
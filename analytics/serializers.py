@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.utils import timezone
+from rest_framework import serializers
+
+from .rollups import add_months, current_month, month_start
+
+MAX_MONTHS = 36
+MAX_DAYS = 366
+
+
+class DashboardQuerySerializer(serializers.Serializer):
+    """Query parameters of the host dashboard."""
+    granularity = serializers.ChoiceField(choices=('month', 'day'), required=False, default='month')
+    start = serializers.DateField(required=False, help_text='First month or day (defaults to 11 months or 29 days before end)')
+    end = serializers.DateField(required=False, help_text='Last month or day (defaults to this month or today)')
+    property_id = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if data['granularity'] == 'month':
+            data['end'] = month_start(data.get('end') or current_month())
+            data['start'] = month_start(data.get('start') or add_months(data['end'], -11))
+            too_long = add_months(data['start'], MAX_MONTHS) <= data['end']
+        else:
+            data['end'] = data.get('end') or timezone.localdate()
+            data['start'] = data.get('start') or data['end'] - timedelta(days=29)
+            too_long = (data['end'] - data['start']).days >= MAX_DAYS
+        if data['start'] > data['end']:
+            raise serializers.ValidationError({'end': 'End must not be before start'})
+        if too_long:
+            raise serializers.ValidationError(
+                f'At most {MAX_MONTHS} months or {MAX_DAYS} days can be requested at once'
+            )
+        return data
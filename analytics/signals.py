@@ -0,0 +1,41 @@
+"""
+Signal handlers keeping the analytics rollups current.
+"""
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from core.models import Booking, Review
+from financial.models import Payment
+from .rollups import refresh_spans, schedule_refresh, spans
+
+
+@receiver(pre_save, sender=Booking)
+@receiver(pre_save, sender=Payment)
+@receiver(pre_save, sender=Review)
+def remember_stats_spans(sender, instance, **kwargs):
+    """
+    Keep the days a row counted towards before this save, in case it moves.
+    """
+    stored = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+    instance._stored_stats_spans = spans(stored) if stored is not None else []
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Review)
+def refresh_saved_stats(sender, instance, **kwargs):
+    """
+    Recompute the rollup days a saved booking, payment or review touches.
+    """
+    refresh_spans(getattr(instance, '_stored_stats_spans', []) + spans(instance))
+
+
+@receiver(post_delete, sender=Booking)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Review)
+def refresh_deleted_stats(sender, instance, **kwargs):
+    """
+    Remove a deleted booking, payment or review from the rollups, once the
+    deletion commits.
+    """
+    schedule_refresh(spans(instance))
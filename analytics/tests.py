@@ -0,0 +1,167 @@
+from datetime import date, datetime
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from account.models import User
+from core.models import Property, Booking, Review
+from financial.models import Payment, PaymentMethod, PaymentCategory
+from .models import PropertyDailyStats, PropertyMonthlyStats
+
+
+def create_property(host, **kwargs):
+    data = {
+        'host': host,
+        'title': 'Seaside flat',
+        'description': 'Two rooms with a view',
+        'address_street': '1 Beach Road',
+        'address_city': 'Lisbon',
+        'address_state': 'Lisbon',
+        'address_zip_code': '1000',
+        'address_country': 'Portugal',
+        'property_type': 'apartment',
+        'room_category': 'entire_place',
+        'price_per_night': 100,
+        'max_guests': 4,
+    }
+    data.update(kwargs)
+    return Property.objects.create(**data)
+
+
+class RollupTests(APITestCase):
+    """Bookings, payments and reviews keep the daily and monthly rollups current."""
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.guest = User.objects.create_user(username='guest', email='guest@example.com', password='pass')
+        self.property = create_property(self.host)
+
+    def book(self, check_in_date, check_out_date, total_price, status='confirmed'):
+        return Booking.objects.create(
+            guest=self.guest, property=self.property, num_guests=2, status=status,
+            check_in_date=check_in_date, check_out_date=check_out_date, total_price=total_price,
+        )
+
+    def month(self, month):
+        return PropertyMonthlyStats.objects.get(property=self.property, month=month)
+
+    def test_booking_spread_over_months(self):
+        # Three nights in June, two in July
+        self.book(date(2030, 6, 28), date(2030, 7, 3), 500)
+        self.assertEqual(PropertyDailyStats.objects.filter(property=self.property).count(), 5)
+        self.assertEqual(self.month(date(2030, 6, 1)).booked_nights, 3)
+        self.assertEqual(self.month(date(2030, 6, 1)).booking_revenue, Decimal('300.00'))
+        self.assertEqual(self.month(date(2030, 7, 1)).booked_nights, 2)
+
+    def test_unpaid_bookings_do_not_count(self):
+        booking = self.book(date(2030, 6, 1), date(2030, 6, 3), 200, status='pending')
+        self.assertFalse(PropertyMonthlyStats.objects.exists())
+        booking.status = 'confirmed'
+        booking.save()
+        self.assertEqual(self.month(date(2030, 6, 1)).booked_nights, 2)
+
+    def test_moved_and_deleted_bookings(self):
+        booking = self.book(date(2030, 6, 1), date(2030, 6, 3), 200)
+        booking.check_in_date, booking.check_out_date = date(2030, 8, 1), date(2030, 8, 4)
+        booking.save()
+        self.assertFalse(PropertyMonthlyStats.objects.filter(month=date(2030, 6, 1)).exists())
+        self.assertEqual(self.month(date(2030, 8, 1)).booked_nights, 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        self.assertFalse(PropertyDailyStats.objects.exists())
+        self.assertFalse(PropertyMonthlyStats.objects.exists())
+
+    def test_reviews(self):
+        booking = self.book(date(2030, 6, 1), date(2030, 6, 3), 200)
+        Review.objects.create(guest=self.guest, property=self.property, booking=booking, rating=4, comment='Nice')
+        stats = self.month(timezone.localdate().replace(day=1))
+        self.assertEqual((stats.review_count, stats.rating_sum), (1, 4))
+
+    def test_deleting_a_property_with_bookings_and_payments(self):
+        booking = self.book(date(2030, 6, 1), date(2030, 6, 3), 200)
+        Payment.objects.create(
+            transaction_id='tx-1', amount=Decimal('200.00'), status=Payment.StatusChoices.SUCCESS,
+            payment_method=PaymentMethod.objects.create(name='Card', code='card'),
+            payment_category=PaymentCategory.objects.create(name='Rent'),
+            payer_id=str(self.guest.pk), property_id=str(self.property.pk),
+            created_at=timezone.make_aware(datetime(2030, 6, 1, 12)),
+        )
+        Review.objects.create(guest=self.guest, property=self.property, booking=booking, rating=5, comment='Great')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.property.delete()
+        self.assertFalse(PropertyDailyStats.objects.exists())
+        self.assertFalse(PropertyMonthlyStats.objects.exists())
+
+    def test_payments_for_unknown_properties_are_skipped(self):
+        Payment.objects.create(
+            transaction_id='tx-1', amount=Decimal('200.00'), status=Payment.StatusChoices.SUCCESS,
+            payment_method=PaymentMethod.objects.create(name='Card', code='card'),
+            payment_category=PaymentCategory.objects.create(name='Rent'),
+            payer_id=str(self.guest.pk), property_id=str(self.property.pk + 100),
+        )
+        self.assertFalse(PropertyDailyStats.objects.exists())
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.book(date(2030, 6, 28), date(2030, 7, 3), 500)
+        self.book(date(2030, 7, 10), date(2030, 7, 12), 300)
+        before = list(PropertyMonthlyStats.objects.order_by('month').values())
+        # bulk_create skips the signals, like payments imported from elsewhere
+        Payment.objects.bulk_create([Payment(
+            transaction_id='tx-1', amount=Decimal('250.00'), status=Payment.StatusChoices.SUCCESS,
+            payment_method=PaymentMethod.objects.create(name='Card', code='card'),
+            payment_category=PaymentCategory.objects.create(name='Rent'),
+            payer_id=str(self.guest.pk), property_id=str(self.property.pk),
+            created_at=timezone.make_aware(datetime(2030, 7, 15, 12)),
+        )])
+        PropertyMonthlyStats.objects.all().delete()
+
+        call_command('rebuild_stats', stdout=StringIO())
+
+        after = list(PropertyMonthlyStats.objects.order_by('month').values())
+        self.assertEqual([row['booked_nights'] for row in after], [row['booked_nights'] for row in before])
+        self.assertEqual(after[1]['payment_revenue'], Decimal('250.00'))
+
+
+class HostDashboardTests(APITestCase):
+    """The dashboard reads only the rollups."""
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.guest = User.objects.create_user(username='guest', email='guest@example.com', password='pass')
+        self.properties = [create_property(self.host, title=f'Flat {number}') for number in range(3)]
+        create_property(self.guest, title='Not mine')
+        for prop in self.properties:
+            Booking.objects.create(
+                guest=self.guest, property=prop, num_guests=2, status='paid',
+                check_in_date=date(2030, 6, 1), check_out_date=date(2030, 6, 7), total_price=600,
+            )
+        self.client.force_authenticate(self.host)
+
+    def test_monthly_dashboard(self):
+        # Properties, then their monthly rollups
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/analytics/dashboard/', {'start': '2030-05-01', 'end': '2030-07-31'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['title'] for item in response.data['properties']], ['Flat 0', 'Flat 1', 'Flat 2'])
+        may, june, july = response.data['properties'][0]['periods']
+        self.assertEqual(may['booked_nights'], 0)
+        self.assertEqual(june['booked_nights'], 6)
+        self.assertEqual(june['occupancy_rate'], 0.2)
+        self.assertEqual(june['average_daily_rate'], Decimal('100.00'))
+        self.assertEqual(response.data['properties'][0]['totals']['booking_revenue'], Decimal('600.00'))
+
+    def test_daily_dashboard_for_one_property(self):
+        response = self.client.get('/api/analytics/dashboard/', {
+            'granularity': 'day', 'start': '2030-06-05', 'end': '2030-06-08',
+            'property_id': self.properties[1].pk,
+        })
+        (item,) = response.data['properties']
+        self.assertEqual([period['booked_nights'] for period in item['periods']], [1, 1, 0, 0])
+        self.assertEqual(item['totals']['occupancy_rate'], 0.5)
+
+    def test_range_is_limited(self):
+        response = self.client.get('/api/analytics/dashboard/', {'start': '2020-01-01', 'end': '2030-01-01'})
+        self.assertEqual(response.status_code, 400)
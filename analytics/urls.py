@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('analytics/dashboard/', views.HostDashboardView.as_view(), name='host-dashboard'),
+]
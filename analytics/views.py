@@ -0,0 +1,67 @@
+from calendar import monthrange
+from datetime import timedelta
+
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.models import Property
+from .rollups import METRICS, add_months, daily_rows, monthly_rows, period_metrics
+from .serializers import DashboardQuerySerializer
+
+
+class HostDashboardView(APIView):
+    """
+    Occupancy, average daily rate, revenue and review score per property and
+    per month (or day) for the requesting host, read from the rollup tables.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request):
+        params = DashboardQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        start, end = query['start'], query['end']
+
+        properties = Property.objects.filter(host=request.user).order_by('property_id')
+        if query.get('property_id'):
+            properties = properties.filter(property_id=query['property_id'])
+        properties = list(properties.values_list('property_id', 'title'))
+
+        # Every period is listed, including those without activity
+        if query['granularity'] == 'month':
+            periods, month = [], start
+            while month <= end:
+                periods.append((month, monthrange(month.year, month.month)[1]))
+                month = add_months(month, 1)
+            rows = monthly_rows([pk for pk, _ in properties], start, end)
+            key = 'month'
+        else:
+            periods = [(start + timedelta(days=offset), 1) for offset in range((end - start).days + 1)]
+            rows = daily_rows([pk for pk, _ in properties], start, end)
+            key = 'date'
+
+        figures = {(row.property_id, getattr(row, key)): row for row in rows}
+        results = []
+        for property_id, title in properties:
+            totals = dict.fromkeys(METRICS, 0)
+            series = []
+            for period, days in periods:
+                row = figures.get((property_id, period))
+                values = {metric: getattr(row, metric) for metric in METRICS} if row else {}
+                for metric, value in values.items():
+                    totals[metric] += value
+                series.append({'period': period, **period_metrics(values, days)})
+            results.append({
+                'property_id': property_id,
+                'title': title,
+                'periods': series,
+                'totals': period_metrics(totals, sum(days for _, days in periods)),
+            })
+
+        return Response({
+            'granularity': query['granularity'],
+            'start': start,
+            'end': end,
+            'properties': results,
+        })
@@ -1,6 +1,7 @@
 from django.shortcuts import render
 from rest_framework import viewsets, filters
 from rest_framework.permissions import IsAuthenticated
+from core.pagination import KeysetOrPageNumberPagination
 from .models import Contact
 from .serializers import ContactSerializer
 
@@ -13,3 +14,5 @@ class ContactViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'email', 'phone_number', 'contact_type']
     ordering_fields = ['name', 'created_at', 'contact_type']
+    ordering = ['-created_at', '-id']
+    pagination_class = KeysetOrPageNumberPagination
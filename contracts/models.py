@@ -2,6 +2,8 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 
+from core.storage import media_storage
+
 class Contract(models.Model):
     STATUS_CHOICES = [
         ('draft', 'Draft'),
@@ -22,7 +24,7 @@ class Contract(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     sent_at = models.DateTimeField(null=True, blank=True)
     signed_at = models.DateTimeField(null=True, blank=True)
-    signed_document = models.FileField(upload_to='signed_contracts/', null=True, blank=True)
+    signed_document = models.FileField(upload_to='signed_contracts/', storage=media_storage, null=True, blank=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     expiration_date = models.DateTimeField(null=True, blank=True)
 
@@ -0,0 +1,5 @@
+from core.storage import track_file_references
+from .models import Contract
+
+# Release the stored signed document when it is replaced or its contract deleted.
+track_file_references(Contract, 'signed_document')
@@ -3,7 +3,8 @@ from django.contrib import admin
 from .models import (
     Property, Amenity, PropertyAmenity, Facility, PropertyFacility,
     HouseRule, PropertyHouseRule, Booking, Review, Conversation,
-    ConversationParticipant, Message, Photo, Availability
+    ConversationParticipant, Message, Photo, Availability,
+    SeasonalRate, LengthOfStayDiscount, PropertyFee
 )
 
 admin.site.register(Property)
@@ -20,3 +21,6 @@ admin.site.register(ConversationParticipant)
 admin.site.register(Message)
 admin.site.register(Photo)
 admin.site.register(Availability)
+admin.site.register(SeasonalRate)
+admin.site.register(LengthOfStayDiscount)
+admin.site.register(PropertyFee)
@@ -0,0 +1,63 @@
+"""
+Date-range availability lookups shared by property search and booking creation.
+
+A stay occupies the nights ``[check_in_date, check_out_date)``. A property is
+bookable for a stay when no confirmed booking overlaps those nights and no
+blocked ``Availability`` range (``is_available=False``, both ends inclusive)
+touches them. Every helper here is expressed as a single indexed query so that
+callers never have to check candidate properties one by one.
+"""
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Availability, Booking
+
+# Booking statuses that hold a property's nights. Pending bookings hold them
+# while the guest pays, until their ``held_until`` (see core.reservations).
+BLOCKING_BOOKING_STATUSES = ('pending', 'paid', 'confirmed')
+# How long an unpaid booking holds its nights before another guest may take them
+BOOKING_HOLD_MINUTES = getattr(settings, 'BOOKING_HOLD_MINUTES', 30)
+# How long the nights stay held once checkout starts; the Stripe session expires with the hold
+CHECKOUT_HOLD_MINUTES = getattr(settings, 'BOOKING_CHECKOUT_HOLD_MINUTES', 35)
+
+
+def overlapping_bookings(check_in_date, check_out_date):
+    """
+    Bookings holding at least one night of the stay. Expired holds are left
+    out even before ``release_expired_holds`` marks them expired.
+    """
+    return Booking.objects.filter(
+        status__in=BLOCKING_BOOKING_STATUSES,
+        check_in_date__lt=check_out_date,
+        check_out_date__gt=check_in_date,
+    ).exclude(status='pending', held_until__lt=timezone.now())
+
+
+def blocked_ranges(check_in_date, check_out_date):
+    """Blocked availability ranges touching at least one night of the stay."""
+    return Availability.objects.filter(
+        is_available=False,
+        start_date__lt=check_out_date,
+        end_date__gte=check_in_date,
+    )
+
+
+def filter_bookable(queryset, check_in_date, check_out_date):
+    """
+    Narrow a ``Property`` queryset to the properties bookable for the stay.
+
+    Both conditions are correlated ``NOT EXISTS`` probes against the
+    ``(property, ...)`` composite indexes on ``Booking`` and ``Availability``,
+    so the whole check runs inside one query regardless of result size.
+    """
+    booked = overlapping_bookings(check_in_date, check_out_date).filter(property=OuterRef('pk'))
+    blocked = blocked_ranges(check_in_date, check_out_date).filter(property=OuterRef('pk'))
+    return queryset.filter(~Exists(booked), ~Exists(blocked))
+
+
+def is_bookable(property_id, check_in_date, check_out_date):
+    """Return True when the property has no conflicting booking or block for the stay."""
+    if overlapping_bookings(check_in_date, check_out_date).filter(property_id=property_id).exists():
+        return False
+    return not blocked_ranges(check_in_date, check_out_date).filter(property_id=property_id).exists()
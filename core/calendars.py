@@ -0,0 +1,146 @@
+"""
+Day-level availability calendars stored as bitmaps.
+
+Each property has at most one ``PropertyCalendar`` row holding two bitmaps,
+one bit per day from ``origin``: days covered by a blocked ``Availability``
+range and nights held by a booking in ``BLOCKING_BOOKING_STATUSES``. The row
+is created lazily on first read and patched in place by ``core.signals``
+whenever a booking or availability range changes, recomputing only the
+affected days, so serving 18 months of calendar is a single primary-key read
+plus one indexed lookup of holds that lapsed since.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .availability import BLOCKING_BOOKING_STATUSES
+from .models import Availability, Booking, PropertyCalendar
+
+AVAILABLE, BLOCKED, BOOKED = 'available', 'blocked', 'booked'
+
+
+def is_set(bitmap, day):
+    return day < len(bitmap) * 8 and bool(bitmap[day >> 3] & (1 << (day & 7)))
+
+
+def set_bits(bitmap, first, last, value):
+    """Set or clear days ``first..last`` (exclusive) of a bytearray, growing it as needed."""
+    if value and last > len(bitmap) * 8:
+        bitmap.extend(bytes((last + 7) // 8 - len(bitmap)))
+    for day in range(first, min(last, len(bitmap) * 8)):
+        if value:
+            bitmap[day >> 3] |= 1 << (day & 7)
+        else:
+            bitmap[day >> 3] &= ~(1 << (day & 7))
+
+
+def day_states(calendar, start, end):
+    """Yield ``(date, state)`` for each day in ``[start, end)``; days before the origin are unknown."""
+    for offset in range((end - start).days):
+        day = start + timedelta(days=offset)
+        index = (day - calendar.origin).days
+        if index < 0:
+            state = None
+        elif is_set(calendar.booked_days, index):
+            state = BOOKED
+        elif is_set(calendar.blocked_days, index):
+            state = BLOCKED
+        else:
+            state = AVAILABLE
+        yield day, state
+
+
+def runs(calendar, start, end):
+    """Run-length form of the calendar: ``[{'start', 'end', 'state'}]`` with ``end`` exclusive."""
+    result = []
+    for day, state in day_states(calendar, start, end):
+        if result and result[-1]['state'] == state:
+            result[-1]['end'] = day + timedelta(days=1)
+        else:
+            result.append({'start': day, 'end': day + timedelta(days=1), 'state': state})
+    return result
+
+
+def without_lapsed_holds(calendar, start, end):
+    """
+    The calendar as of now for ``[start, end)``: nights of pending bookings
+    whose hold lapsed are free even before ``release_expired_holds`` expires
+    them. Returns an unsaved copy; reading never writes.
+    """
+    lapsed = Booking.objects.filter(
+        property_id=calendar.property_id, status='pending', held_until__lt=timezone.now(),
+        check_in_date__lt=end, check_out_date__gt=start,
+    ).values_list('check_in_date', 'check_out_date')
+    booked = bytearray(calendar.booked_days)
+    for check_in_date, check_out_date in lapsed:
+        set_bits(booked, max((check_in_date - calendar.origin).days, 0), (check_out_date - calendar.origin).days, False)
+    return PropertyCalendar(
+        property_id=calendar.property_id, origin=calendar.origin,
+        blocked_days=calendar.blocked_days, booked_days=bytes(booked),
+    )
+
+
+def window_bits(bitmap, origin, start, end):
+    """Re-base a stored bitmap on ``start`` covering ``[start, end)``."""
+    window = bytearray(((end - start).days + 7) // 8)
+    for offset in range((end - start).days):
+        index = (start - origin).days + offset
+        if index >= 0 and is_set(bitmap, index):
+            window[offset >> 3] |= 1 << (offset & 7)
+    return bytes(window)
+
+
+def _fill(calendar, first, last):
+    """Recompute the bits of days ``[first, last)`` from the bookings and blocks touching them."""
+    origin = calendar.origin
+    first = max(first, origin)
+    if first >= last:
+        return
+    blocked, booked = bytearray(calendar.blocked_days), bytearray(calendar.booked_days)
+    lo, hi = (first - origin).days, (last - origin).days
+    set_bits(blocked, lo, hi, False)
+    set_bits(booked, lo, hi, False)
+
+    blocks = Availability.objects.filter(
+        property_id=calendar.property_id, is_available=False, start_date__lt=last, end_date__gte=first,
+    ).values_list('start_date', 'end_date')
+    for start_date, end_date in blocks:
+        # Availability ranges include their end date
+        set_bits(blocked, max((start_date - origin).days, lo), min((end_date - origin).days + 1, hi), True)
+
+    stays = Booking.objects.filter(
+        property_id=calendar.property_id, status__in=BLOCKING_BOOKING_STATUSES,
+        check_in_date__lt=last, check_out_date__gt=first,
+    ).values_list('check_in_date', 'check_out_date')
+    for check_in_date, check_out_date in stays:
+        set_bits(booked, max((check_in_date - origin).days, lo), min((check_out_date - origin).days, hi), True)
+
+    calendar.blocked_days, calendar.booked_days = bytes(blocked), bytes(booked)
+
+
+def build_calendar(property_id):
+    """Create or rebuild a property's calendar from today's month onwards."""
+    origin = timezone.localdate().replace(day=1)
+    with transaction.atomic():
+        calendar, _ = PropertyCalendar.objects.select_for_update().get_or_create(
+            property_id=property_id, defaults={'origin': origin}
+        )
+        calendar.origin, calendar.blocked_days, calendar.booked_days = origin, b'', b''
+        last_block = Availability.objects.filter(property_id=property_id).aggregate(last=Max('end_date'))['last']
+        last_stay = Booking.objects.filter(property_id=property_id).aggregate(last=Max('check_out_date'))['last']
+        horizon = max(day for day in (origin, last_block, last_stay) if day is not None)
+        _fill(calendar, origin, horizon + timedelta(days=1))
+        calendar.save()
+    return calendar
+
+
+def patch_calendar(property_id, first, last):
+    """Recompute days ``[first, last)`` of an existing calendar; missing calendars are built lazily."""
+    with transaction.atomic():
+        calendar = PropertyCalendar.objects.select_for_update().filter(property_id=property_id).first()
+        if calendar is None:
+            return
+        _fill(calendar, first, last)
+        calendar.save(update_fields=['blocked_days', 'booked_days', 'updated_at'])
@@ -0,0 +1,137 @@
+"""
+Versioned caching for the amenity, facility and house-rule catalogs.
+
+Each catalog has a version token in the Django cache, replaced by
+``core.signals`` whenever a row is saved or deleted and by ``populate_data``.
+Rendered responses are kept per (catalog, version, normalized query) in
+process memory and in the Django cache, and the version doubles as the ETag,
+so a revalidation with a matching ``If-None-Match`` is answered with a 304
+from a single cache read, without any database access.
+
+A missing token (first request, eviction, cache restart) is derived from the
+database: the catalog's row count and latest ``updated_at``. Bumps only reach
+other workers through a cache they share, so production must configure a
+shared ``CACHES`` backend (Redis, Memcached); with the default per-process
+local memory, other workers keep serving their cached catalog until it
+expires.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework import permissions
+from rest_framework.filters import OrderingFilter
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60 * 24)
+CATALOG_CACHE_MAX_AGE = getattr(settings, 'CATALOG_CACHE_MAX_AGE', 300)
+LOCAL_CACHE_SIZE = 256
+
+_local_cache = {}
+
+
+def _version_key(catalog):
+    return f'catalog:{catalog}:version'
+
+
+def database_version(model):
+    """Version derived from the rows: changes whenever one of them is saved or deleted."""
+    state = model.objects.aggregate(rows=Count('pk'), changed=Max('updated_at'))
+    changed = int(state['changed'].timestamp() * 1000000) if state['changed'] else 0
+    return f"{state['rows']}-{changed:x}"
+
+
+def catalog_version(catalog, model):
+    """Return the current version token of a catalog, deriving one from the database if the cache lost it."""
+    version = cache.get(_version_key(catalog))
+    if version is None:
+        cache.add(_version_key(catalog), database_version(model), timeout=None)
+        version = cache.get(_version_key(catalog))
+    return version
+
+
+def bump_catalog_version(catalog):
+    """Invalidate every cached response of a catalog in all processes sharing the cache."""
+    cache.set(_version_key(catalog), uuid.uuid4().hex[:12], timeout=None)
+
+
+def get_cached_data(catalog, version, path):
+    key = f'catalog:{catalog}:{version}:{path}'
+    data = _local_cache.get(key)
+    if data is None:
+        data = cache.get(key)
+        if data is not None:
+            _remember(key, data)
+    return data
+
+
+def set_cached_data(catalog, version, path, data):
+    key = f'catalog:{catalog}:{version}:{path}'
+    cache.set(key, data, CATALOG_CACHE_TIMEOUT)
+    _remember(key, data)
+
+
+def _remember(key, data):
+    if len(_local_cache) >= LOCAL_CACHE_SIZE:
+        # Entries of superseded versions are never read again
+        _local_cache.clear()
+    _local_cache[key] = data
+
+
+class CachedCatalogMixin:
+    """
+    Serve ``list``/``retrieve`` of a reference catalog from the versioned
+    cache with ``ETag`` and ``Cache-Control`` headers.
+    """
+    catalog_name = None
+
+    def get_authenticators(self):
+        # Reads are public; a stateless token check keeps them off the user table
+        if self.request.method in permissions.SAFE_METHODS:
+            return [JWTStatelessUserAuthentication()]
+        return super().get_authenticators()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedCatalogMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedCatalogMixin, self).retrieve(request, *args, **kwargs))
+
+    def cache_path(self, request):
+        """
+        The request as far as it affects the response: the path plus the
+        ordering and page the list actually uses, so unrelated or invalid
+        query parameters share one entry.
+        """
+        if self.action != 'list':
+            return request.path
+        ordering = OrderingFilter().get_ordering(request, self.get_queryset(), self) or ()
+        page = request.query_params.get(self.paginator.page_query_param, '1') if self.paginator else ''
+        if page.isdigit():
+            page = str(int(page))
+        return f"{request.path}?ordering={','.join(ordering)}&page={page}"
+
+    def cached_response(self, request, render):
+        version = catalog_version(self.catalog_name, self.queryset.model)
+        etag = f'"{self.catalog_name}-{version}"'
+
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            response = Response(status=not_modified.status_code)
+        else:
+            path = self.cache_path(request)
+            data = get_cached_data(self.catalog_name, version, path)
+            if data is None:
+                response = render()
+                if response.status_code != 200:
+                    return response
+                data = response.data
+                set_cached_data(self.catalog_name, version, path, data)
+            response = Response(data)
+
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=CATALOG_CACHE_MAX_AGE)
+        return response
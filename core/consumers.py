@@ -0,0 +1,96 @@
+"""
+WebSocket consumers for conversations.
+
+``ws/conversations/<id>/`` streams one conversation to its participants: new
+messages and read receipts as they are committed. Clients reconnecting with
+``?after=<message_id>`` first receive what they missed. Sending
+``{"type": "read", "message_id": <id>}`` marks messages up to that id as read,
+like ``POST /conversations/<id>/read/``.
+
+``ws/conversations/`` streams the same events for all of the user's
+conversations, for inbox views.
+"""
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .models import ConversationParticipant, Message
+from .serializers import MessageSerializer
+from .realtime import MESSAGE_NEW, conversation_group, mark_read, render, user_group
+
+# Most missed messages replayed on connect; older ones are fetched over HTTP
+CATCH_UP_LIMIT = 100
+# Close codes sent before accepting
+UNAUTHORIZED, FORBIDDEN = 4401, 4403
+
+
+class ConversationEventsMixin:
+    """Forward events published by ``core.realtime`` to the socket."""
+
+    async def conversation_event(self, event):
+        await self.send(text_data=event['text'])
+
+    async def disconnect(self, code):
+        if getattr(self, 'group_name', None):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    @property
+    def user(self):
+        user = self.scope.get('user')
+        return user if user is not None and user.is_authenticated else None
+
+
+class InboxConsumer(ConversationEventsMixin, AsyncJsonWebsocketConsumer):
+
+    async def connect(self):
+        if self.user is None:
+            await self.close(code=UNAUTHORIZED)
+            return
+        self.group_name = user_group(self.user.pk)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+
+class ConversationConsumer(ConversationEventsMixin, AsyncJsonWebsocketConsumer):
+
+    async def connect(self):
+        self.conversation_id = int(self.scope['url_route']['kwargs']['conversation_id'])
+        if self.user is None:
+            await self.close(code=UNAUTHORIZED)
+            return
+        if not await self.is_participant():
+            await self.close(code=FORBIDDEN)
+            return
+        # Join before catching up, so nothing committed in between is lost
+        self.group_name = conversation_group(self.conversation_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        after = parse_qs(self.scope.get('query_string', b'').decode()).get('after', [''])[0]
+        if after.isdigit():
+            for text in await self.missed_messages(int(after)):
+                await self.send(text_data=text)
+
+    async def receive_json(self, content, **kwargs):
+        if content.get('type') == 'read':
+            message_id = content.get('message_id')
+            if message_id is not None and not isinstance(message_id, int):
+                await self.send_json({'type': 'error', 'detail': 'message_id must be an integer'})
+                return
+            await database_sync_to_async(mark_read)(self.conversation_id, self.user.pk, message_id)
+        else:
+            await self.send_json({'type': 'error', 'detail': 'Unknown command'})
+
+    @database_sync_to_async
+    def is_participant(self):
+        return ConversationParticipant.objects.filter(
+            conversation_id=self.conversation_id, user_id=self.user.pk
+        ).exists()
+
+    @database_sync_to_async
+    def missed_messages(self, after):
+        messages = Message.objects.filter(
+            conversation_id=self.conversation_id, message_id__gt=after
+        ).select_related('sender').order_by('message_id')[:CATCH_UP_LIMIT]
+        return [render({'type': MESSAGE_NEW, 'message': MessageSerializer(message).data}) for message in messages]
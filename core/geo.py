@@ -0,0 +1,132 @@
+"""
+Geohash helpers backing the ``Property.geohash`` index column.
+
+A geohash interleaves longitude and latitude bits into a base-32 string, so
+nearby points share a prefix. A bounding box is covered by a handful of
+geohash cells, and each cell becomes an indexed range scan on the column
+instead of a trigonometric scan over every property.
+"""
+import math
+
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # ~5m cells, well below any useful search radius
+MAX_COVER_CELLS = 32
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, interval = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Return the (height, width) of a geohash cell in degrees."""
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = math.floor(precision * 5 / 2)
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def radius_bounds(latitude, longitude, radius_km):
+    """Return the (south, west, north, east) box enclosing a circle."""
+    latitude, longitude = float(latitude), float(longitude)
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    south, north = max(-90.0, latitude - dlat), min(90.0, latitude + dlat)
+    if south == -90.0 or north == 90.0:
+        # The circle reaches a pole, so it spans every longitude
+        return south, -180.0, north, 180.0
+    dlng = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(latitude))))
+    if dlng >= 180.0:
+        return south, -180.0, north, 180.0
+    west = (longitude - dlng + 540.0) % 360.0 - 180.0
+    east = (longitude + dlng + 540.0) % 360.0 - 180.0
+    return south, west, north, east
+
+
+def split_bounds(south, west, north, east):
+    """Split a box crossing the antimeridian (west > east) into two boxes."""
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
+
+
+def cover(south, west, north, east):
+    """
+    Return the geohash prefixes covering a box that does not cross the antimeridian.
+
+    Uses the finest precision whose cells still cover the box with at most
+    ``MAX_COVER_CELLS`` prefixes, so the query stays a short list of range scans.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor((north + 90.0) / height) - math.floor((south + 90.0) / height) + 1
+        columns = math.floor((east + 180.0) / width) - math.floor((west + 180.0) / width) + 1
+        if rows * columns <= MAX_COVER_CELLS:
+            break
+
+    first_row = math.floor((south + 90.0) / height)
+    first_column = math.floor((west + 180.0) / width)
+    prefixes = set()
+    for row in range(rows):
+        cell_lat = min(89.999999, -90.0 + (first_row + row + 0.5) * height)
+        for column in range(columns):
+            cell_lng = min(179.999999, -180.0 + (first_column + column + 0.5) * width)
+            prefixes.add(encode(cell_lat, cell_lng, precision))
+    return sorted(prefixes)
+
+
+def within_bounds_q(south, west, north, east, field='geohash'):
+    """
+    Build a filter matching rows inside a box.
+
+    Each covering prefix becomes a ``BETWEEN`` on the geohash column, which
+    uses the index on both SQLite and MySQL (unlike ``LIKE 'prefix%'``), and
+    the exact coordinate bounds then trim the cell edges.
+    """
+    query = Q()
+    for box in split_bounds(south, west, north, east):
+        cells = Q()
+        for prefix in cover(*box):
+            padding = BASE32[-1] * (GEOHASH_PRECISION - len(prefix))
+            cells |= Q(**{f'{field}__range': (prefix, prefix + padding)})
+        query |= cells & Q(
+            latitude__gte=box[0], latitude__lte=box[2],
+            longitude__gte=box[1], longitude__lte=box[3],
+        )
+    return query
+
+
+def distance_km_expression(latitude, longitude):
+    """Haversine distance from a point, as a database expression on ``latitude``/``longitude``."""
+    lat1 = Value(math.radians(float(latitude)), output_field=FloatField())
+    lng1 = Value(math.radians(float(longitude)), output_field=FloatField())
+    lat2 = Radians(Cast('latitude', FloatField()))
+    lng2 = Radians(Cast('longitude', FloatField()))
+    a = (
+        Power(Sin((lat2 - lat1) / 2), 2)
+        + Cos(lat1) * Cos(lat2) * Power(Sin((lng2 - lng1) / 2), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM, output_field=FloatField()) * ASin(Sqrt(a))
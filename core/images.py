@@ -0,0 +1,130 @@
+"""
+Resized WebP/JPEG variants of property photos.
+
+Uploads are stored untouched; once the upload is committed the variants are
+rendered on a small thread pool and recorded on ``Photo.variants``::
+
+    {"source": "property_photos/a.jpg",
+     "thumb": {"width": 320, "height": 213,
+               "webp": "property_photos/variants/7/thumb.webp",
+               "jpeg": "property_photos/variants/7/thumb.jpg"}, ...}
+
+``source`` is the image the variants were made from, so a replaced image is
+reprocessed and an unchanged one is not.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from .models import Photo
+
+logger = logging.getLogger(__name__)
+
+# name -> longest edge in pixels; originals are never upscaled
+VARIANT_SIZES = getattr(settings, 'PHOTO_VARIANT_SIZES', {'thumb': 320, 'medium': 960, 'large': 1920})
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+VARIANT_WORKERS = getattr(settings, 'PHOTO_VARIANT_WORKERS', 2)
+
+_executor = None
+
+
+def needs_variants(photo):
+    return bool(photo.image) and photo.variants.get('source') != photo.image.name
+
+
+def variant_url(variants, size, fmt='webp'):
+    """Storage URL of one variant, or None if it hasn't been generated."""
+    path = (variants or {}).get(size, {}).get(fmt)
+    return Photo._meta.get_field('image').storage.url(path) if path else None
+
+
+def render_variants(photo):
+    """Write every variant of ``photo`` to storage and return the ``variants`` mapping."""
+    storage = photo.image.storage
+    with photo.image.open('rb') as source:
+        original = Image.open(source)
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+    variants = {'source': photo.image.name}
+    for size, edge in VARIANT_SIZES.items():
+        image = original.copy()
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        variant = {'width': image.width, 'height': image.height}
+        for fmt, (pil_format, extension, options) in VARIANT_FORMATS.items():
+            encoded = image.convert('RGB') if pil_format == 'JPEG' else image
+            buffer = BytesIO()
+            encoded.save(buffer, pil_format, **options)
+            # Stored under a name derived from the content; only the extension is kept
+            variant[fmt] = storage.save(f'{size}.{extension}', ContentFile(buffer.getvalue()))
+        variants[size] = variant
+    return variants
+
+
+def variant_paths(variants):
+    """Stored names of the variants, once per reference: identical renderings share a name."""
+    return [
+        path for key, variant in (variants or {}).items() if key != 'source'
+        for path in variant.values() if isinstance(path, str)
+    ]
+
+
+def delete_variants(variants):
+    """Release every stored reference held by ``variants``."""
+    storage = Photo._meta.get_field('image').storage
+    for path in variant_paths(variants):
+        storage.delete(path)
+
+
+def process_photo(photo_id, force=False):
+    """
+    Generate the missing variants of one photo, or all of them again with
+    ``force``; safe to call repeatedly.
+    """
+    photo = Photo.objects.filter(pk=photo_id).first()
+    if photo is None or not (needs_variants(photo) or (force and photo.image)):
+        return
+    try:
+        variants = render_variants(photo)
+    except (OSError, Image.DecompressionBombError):
+        logger.exception('Could not generate variants for photo %s', photo_id)
+        return
+    stale = photo.variants
+    photo.variants = variants
+    # update_fields keeps concurrent description edits; post_save bumps the property's ETag
+    photo.save(update_fields=['variants'])
+    # Each save above took its own reference, even to an unchanged name
+    delete_variants(stale)
+
+
+def _run(photo_id):
+    try:
+        process_photo(photo_id)
+    except Exception:
+        logger.exception('Photo variant job %s failed', photo_id)
+    finally:
+        # Worker threads own their connections
+        connections.close_all()
+
+
+def schedule_variants(photo_id):
+    """Render variants once the current transaction commits, off the request thread."""
+    def submit():
+        global _executor
+        if not getattr(settings, 'PHOTO_VARIANTS_ASYNC', True):
+            process_photo(photo_id)
+            return
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=VARIANT_WORKERS, thread_name_prefix='photo-variants')
+        _executor.submit(_run, photo_id)
+    transaction.on_commit(submit)
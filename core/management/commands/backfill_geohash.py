@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from core import geo
+from core.models import Property
+
+class Command(BaseCommand):
+    help = 'Recomputes the geohash index column for every property with coordinates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        self.stdout.write(self.style.SUCCESS('Backfilling property geohashes...'))
+
+        batch = []
+        updated = 0
+        properties = Property.objects.only('property_id', 'latitude', 'longitude', 'geohash')
+        for prop in properties.iterator(chunk_size=batch_size):
+            if prop.latitude is not None and prop.longitude is not None:
+                geohash = geo.encode(prop.latitude, prop.longitude)
+            else:
+                geohash = ''
+            if geohash != prop.geohash:
+                prop.geohash = geohash
+                batch.append(prop)
+            if len(batch) >= batch_size:
+                updated += Property.objects.bulk_update(batch, ['geohash'])
+                batch = []
+        if batch:
+            updated += Property.objects.bulk_update(batch, ['geohash'])
+
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} properties.'))
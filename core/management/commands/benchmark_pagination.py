@@ -0,0 +1,81 @@
+import statistics
+import time
+from base64 import b64encode
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from contacts.models import Contact
+from contacts.views import ContactViewSet
+from core.pagination import KeysetPagination
+
+class Command(BaseCommand):
+    help = (
+        'Times page-number against keyset pagination at increasing depths of a '
+        'large contacts table. The rows are inserted inside a transaction that is '
+        'rolled back, so the database is left untouched.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows, page_size, repeat = options['rows'], options['page_size'], options['repeat']
+        with transaction.atomic():
+            self.populate(rows)
+            self.report(rows, page_size, repeat)
+            transaction.set_rollback(True)
+
+    def populate(self, rows, batch_size=10_000):
+        self.stdout.write(f'Inserting {rows:,} contacts...')
+        for start in range(0, rows, batch_size):
+            Contact.objects.bulk_create(
+                Contact(name=f'Benchmark contact {index}', contact_type='lead')
+                for index in range(start, min(start + batch_size, rows))
+            )
+
+    def report(self, rows, page_size, repeat):
+        view = ContactViewSet()
+        queryset = Contact.objects.order_by(*view.ordering)
+        factory = APIRequestFactory()
+        last_page = max(1, -(-rows // page_size))
+
+        self.stdout.write(f'\n{"depth":>10} {"page-number":>14} {"keyset":>10}')
+        for fraction in (0, 0.01, 0.1, 0.5, 1):
+            page = max(1, round(last_page * fraction))
+            offset = (page - 1) * page_size
+
+            page_number = PageNumberPagination()
+            page_number.page_size = page_size
+            page_request = Request(factory.get('/api/contacts/', {'page': page}))
+            page_ms = self.time_ms(repeat, lambda: page_number.paginate_queryset(queryset, page_request, view))
+
+            keyset = KeysetPagination()
+            keyset.page_size = page_size
+            cursor = self.cursor_at(keyset, queryset, offset, view)
+            cursor_request = Request(factory.get('/api/contacts/', {'cursor': cursor} if cursor else {}))
+            keyset_ms = self.time_ms(repeat, lambda: keyset.paginate_queryset(queryset, cursor_request, view))
+
+            self.stdout.write(f'{offset:>10,} {page_ms:>11.2f} ms {keyset_ms:>7.2f} ms')
+
+    def cursor_at(self, paginator, queryset, offset, view):
+        """Encode the cursor a client would hold after paging down to ``offset``."""
+        if offset == 0:
+            return None
+        previous = queryset[offset - 1]
+        position = paginator._get_position_from_instance(previous, view.ordering)
+        return b64encode(urlencode({'p': position}).encode('ascii')).decode('ascii')
+
+    def time_ms(self, repeat, fetch):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(fetch())
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
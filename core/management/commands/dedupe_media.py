@@ -0,0 +1,39 @@
+import os
+
+from django.core.management.base import BaseCommand
+from contracts.models import Contract
+from core.models import Photo
+from core.storage import CAS_PREFIX, media_storage
+from regulations.models import Regulation
+
+FILE_FIELDS = (
+    (Photo, 'image'),
+    (Regulation, 'document'),
+    (Contract, 'signed_document'),
+)
+
+class Command(BaseCommand):
+    help = 'Moves media uploaded before content addressing into the deduplicated storage.'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write(self.style.SUCCESS('Deduplicating media files...'))
+
+        moved = missing = 0
+        for model, field_name in FILE_FIELDS:
+            rows = (
+                model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .exclude(**{f'{field_name}__startswith': f'{CAS_PREFIX}/'})
+                .values_list('pk', field_name)
+            )
+            for pk, name in rows.iterator():
+                if not media_storage.exists(name):
+                    missing += 1
+                    continue
+                with media_storage.open(name, 'rb') as legacy:
+                    stored = media_storage.save(os.path.basename(name), legacy)
+                # A queryset update skips the reference tracking signals
+                model.objects.filter(pk=pk).update(**{field_name: stored})
+                media_storage.delete(name)
+                moved += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} files ({missing} missing on disk).'))
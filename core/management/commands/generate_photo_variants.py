@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from core.images import process_photo
+from core.models import Photo
+
+class Command(BaseCommand):
+    help = 'Renders the resized WebP/JPEG variants of property photos that lack them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Re-render variants of every photo.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Generating photo variants...'))
+
+        count = 0
+        for photo_id in Photo.objects.values_list('photo_id', flat=True).iterator():
+            # Forced renders release the variants they replace
+            process_photo(photo_id, force=options['force'])
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {count} photos.'))
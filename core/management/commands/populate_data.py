@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from core.catalog_cache import bump_catalog_version
 from core.models import Amenity, Facility, HouseRule
 
 class Command(BaseCommand):
@@ -87,4 +88,6 @@ class Command(BaseCommand):
             else:
                 self.stdout.write(self.style.WARNING(f'House Rule already exists: {rule.name}'))
 
+        for catalog in ('amenities', 'facilities', 'house_rules'):
+            bump_catalog_version(catalog)
         self.stdout.write(self.style.SUCCESS('Data population complete.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from core.calendars import build_calendar
+from core.models import Property
+
+class Command(BaseCommand):
+    help = 'Rebuilds the availability calendar bitmaps, moving their origin to the current month.'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write(self.style.SUCCESS('Rebuilding property calendars...'))
+
+        count = 0
+        for property_id in Property.objects.values_list('property_id', flat=True).iterator():
+            build_calendar(property_id)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} calendars.'))
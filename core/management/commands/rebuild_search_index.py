@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from core.models import Property
+from core.search import index_property
+
+class Command(BaseCommand):
+    help = 'Rebuilds the property search tokens and facets from scratch.'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write(self.style.SUCCESS('Rebuilding property search index...'))
+
+        count = 0
+        for property_id in Property.objects.values_list('property_id', flat=True).iterator():
+            index_property(property_id)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} properties.'))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from core.reservations import BOOKING_HOLD_MINUTES, release_expired_holds
+
+class Command(BaseCommand):
+    help = f'Expires pending bookings whose hold ({BOOKING_HOLD_MINUTES} minutes) lapsed, freeing their nights.'
+
+    def handle(self, *args, **kwargs):
+        count = release_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f'Released {count} expired booking holds.'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from core.ratings import repair_ratings
+
+class Command(BaseCommand):
+    help = 'Recomputes the rating aggregates of every property from its reviews, fixing any drift.'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write(self.style.SUCCESS('Checking property rating aggregates...'))
+
+        repaired = repair_ratings()
+
+        self.stdout.write(self.style.SUCCESS(f'Repaired {len(repaired)} properties.'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+from core.models import Booking
+from core.reservations import sync_nights
+
+class Command(BaseCommand):
+    help = 'Creates the night slots of existing bookings and reports bookings that already overlap.'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write(self.style.SUCCESS('Syncing booked nights...'))
+
+        count = 0
+        for booking in Booking.objects.order_by('booking_id').iterator():
+            try:
+                with transaction.atomic():
+                    sync_nights(booking)
+                count += 1
+            except IntegrityError:
+                self.stdout.write(self.style.WARNING(
+                    f'Booking {booking.booking_id} overlaps an earlier booking of property {booking.property_id}'
+                ))
+
+        self.stdout.write(self.style.SUCCESS(f'Synced {count} bookings.'))
@@ -0,0 +1,37 @@
+"""
+ASGI middleware authenticating WebSocket connections.
+"""
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+
+@database_sync_to_async
+def get_jwt_user(raw_token):
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+class JWTAuthMiddleware:
+    """
+    Authenticate a socket from the ``?token=<access token>`` query parameter,
+    since browsers cannot set an Authorization header on WebSocket requests.
+    Without a token the session user set by ``AuthMiddlewareStack`` is kept.
+    """
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        if token:
+            # An invalid token never falls back to the session
+            user = await get_jwt_user(token[0])
+            scope = dict(scope, user=user if user is not None else AnonymousUser())
+        return await self.inner(scope, receive, send)
@@ -1,5 +1,11 @@
-from django.db import models
+from datetime import timedelta
+
+from django.db import models, transaction
 from django.conf import settings
+from django.utils import timezone
+
+from . import geo
+from .storage import media_storage
 
 class Property(models.Model):
     property_id = models.AutoField(primary_key=True)
@@ -13,25 +19,55 @@ class Property(models.Model):
     address_country = models.CharField(max_length=100)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False)
     property_type = models.CharField(max_length=50)
     room_category = models.CharField(max_length=50)
     price_per_night = models.DecimalField(max_digits=10, decimal_places=2)
+    weekend_price_per_night = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True) # Friday and Saturday nights
     max_guests = models.IntegerField()
     num_bedrooms = models.IntegerField(null=True, blank=True)
     num_beds = models.IntegerField(null=True, blank=True)
     num_bathrooms = models.DecimalField(max_digits=3, decimal_places=1, null=True, blank=True)
     # photos field moved to Photo model
     # availability field moved to Availability model
+    # Review aggregates, maintained by core.ratings
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['address_city', 'max_guests']),
+            models.Index(fields=['rating_avg', 'rating_count']),
+        ]
+
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Keep the spatial index column in sync with the coordinates
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
 class Amenity(models.Model):
     amenity_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100, unique=True)
     icon = models.CharField(max_length=100, blank=True, null=True)
+    # Catalog cache version (core.catalog_cache)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -50,6 +86,8 @@ class Facility(models.Model):
     facility_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100, unique=True)
     icon = models.CharField(max_length=100, blank=True, null=True)
+    # Catalog cache version (core.catalog_cache)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -68,6 +106,8 @@ class HouseRule(models.Model):
     rule_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
+    # Catalog cache version (core.catalog_cache)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -84,6 +124,10 @@ class PropertyHouseRule(models.Model):
     def __str__(self):
         return f"{self.property.title} - {self.rule.name}"
 
+def booking_hold_expiry():
+    """When the hold of a booking made now lapses if it is not paid."""
+    return timezone.now() + timedelta(minutes=getattr(settings, 'BOOKING_HOLD_MINUTES', 30))
+
 class Booking(models.Model):
     booking_id = models.AutoField(primary_key=True)
     guest = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='bookings')
@@ -92,14 +136,43 @@ class Booking(models.Model):
     check_out_date = models.DateField()
     num_guests = models.IntegerField()
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
-    status = models.CharField(max_length=50, default='Pending')
+    status = models.CharField(max_length=50, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
+    held_until = models.DateTimeField(default=booking_hold_expiry) # End of the unpaid hold, extended when checkout starts
     updated_at = models.DateTimeField(auto_now=True)
     payment_session = models.CharField(max_length=256, default='')
 
+    class Meta:
+        indexes = [
+            # Interval lookups: overlapping stays for a property
+            models.Index(fields=['property', 'status', 'check_in_date', 'check_out_date']),
+        ]
+
     def __str__(self):
         return f"Booking {self.booking_id} by {self.guest.email} for {self.property.title}"
 
+    def save(self, *args, **kwargs):
+        # The booking and the nights it holds are written together; a night
+        # already held by another booking raises IntegrityError and rolls both back
+        from .reservations import sync_nights
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            sync_nights(self)
+
+class BookingNight(models.Model):
+    """One night of a property held by a booking; the unique key makes double bookings impossible."""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='booked_nights')
+    date = models.DateField()
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='nights')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'date'], name='unique_booked_night'),
+        ]
+
+    def __str__(self):
+        return f"{self.property_id} on {self.date} (booking {self.booking_id})"
+
 class Review(models.Model):
     review_id = models.AutoField(primary_key=True)
     guest = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='reviews')
@@ -116,7 +189,7 @@ class Conversation(models.Model):
     conversation_id = models.AutoField(primary_key=True)
     property = models.ForeignKey(Property, on_delete=models.SET_NULL, null=True, blank=True, related_name='conversations')
     booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name='conversations')
-    last_message_at = models.DateTimeField(auto_now=True)
+    last_message_at = models.DateTimeField(default=timezone.now, db_index=True) # Sent time of the latest message, set by core.signals
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -141,15 +214,25 @@ class Message(models.Model):
     sent_at = models.DateTimeField(auto_now_add=True)
     read_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Unread counts of the inbox
+            models.Index(fields=['conversation', 'read_at']),
+            # Keyset pages of a conversation's history
+            models.Index(fields=['conversation', 'sent_at', 'message_id']),
+        ]
+
     def __str__(self):
         return f"Message {self.message_id} from {self.sender.email}"
 
 class Photo(models.Model):
     photo_id = models.AutoField(primary_key=True)
     property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='photos')
-    image = models.ImageField(upload_to='property_photos/')
+    image = models.ImageField(upload_to='property_photos/', storage=media_storage)
     description = models.CharField(max_length=255, blank=True, null=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Resized WebP/JPEG renditions, filled in by core.images
+    variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"Photo for {self.property.title} ({self.photo_id})"
@@ -164,6 +247,110 @@ class Availability(models.Model):
     class Meta:
         verbose_name_plural = "Availabilities"
         unique_together = ('property', 'start_date', 'end_date')
+        indexes = [
+            # Interval lookups: blocked ranges for a property
+            models.Index(fields=['property', 'is_available', 'start_date', 'end_date']),
+        ]
 
     def __str__(self):
         return f"Availability for {self.property.title} from {self.start_date} to {self.end_date}"
+
+class PropertySearchToken(models.Model):
+    """Inverted index entry: a token of a property's searchable text and its weight."""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=64)
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('property', 'token')
+        indexes = [
+            # Covers term lookups and relevance sums without touching the table
+            models.Index(fields=['token', 'property', 'weight']),
+        ]
+
+    def __str__(self):
+        return f"{self.token} ({self.weight}) for property {self.property_id}"
+
+class PropertyFacet(models.Model):
+    """
+    Denormalized facet membership of a property, e.g. ``amenity:3``,
+    ``facility:7`` or ``rule:2``, kept in sync with the join tables.
+    """
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='facets')
+    facet = models.CharField(max_length=32)
+
+    class Meta:
+        unique_together = ('property', 'facet')
+        indexes = [
+            models.Index(fields=['facet', 'property']),
+        ]
+
+    def __str__(self):
+        return f"{self.facet} for property {self.property_id}"
+
+
+class SeasonalRate(models.Model):
+    """Nightly price of a property between two dates (inclusive); later seasons override earlier ones."""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='seasonal_rates')
+    name = models.CharField(max_length=100, blank=True)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    price_per_night = models.DecimalField(max_digits=10, decimal_places=2)
+    weekend_price_per_night = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['property', 'start_date', 'end_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.property.title} {self.start_date} to {self.end_date}: {self.price_per_night}"
+
+class LengthOfStayDiscount(models.Model):
+    """Percentage off the nightly subtotal for stays of at least ``min_nights``."""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='stay_discounts')
+    min_nights = models.PositiveIntegerField()
+    percent = models.DecimalField(max_digits=5, decimal_places=2)
+
+    class Meta:
+        unique_together = ('property', 'min_nights')
+
+    def __str__(self):
+        return f"{self.property.title}: {self.percent}% off {self.min_nights}+ nights"
+
+class PropertyFee(models.Model):
+    FEE_TYPES = [
+        ('per_stay', 'Per stay'),
+        ('per_night', 'Per night'),
+        ('per_guest', 'Per guest'),
+    ]
+
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='fees')
+    name = models.CharField(max_length=100) # e.g. Cleaning fee
+    fee_type = models.CharField(max_length=20, choices=FEE_TYPES, default='per_stay')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.property.title} - {self.name}"
+
+class PropertyCalendar(models.Model):
+    """Day bitmaps of a property's blocked and booked days, maintained by core.calendars."""
+    property = models.OneToOneField(Property, on_delete=models.CASCADE, related_name='calendar')
+    origin = models.DateField() # Day of bit 0
+    blocked_days = models.BinaryField(default=b'')
+    booked_days = models.BinaryField(default=b'')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Calendar for {self.property_id} from {self.origin}"
+
+class MediaBlob(models.Model):
+    """One stored file of the content-addressed media storage and how many fields reference it."""
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64)
+    size = models.BigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
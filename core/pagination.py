@@ -0,0 +1,69 @@
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination: each page is a ``WHERE key < last_seen ORDER BY key
+    LIMIT n`` on an indexed column, so page 10,000 costs the same as page 1
+    and no ``COUNT(*)`` is issued. The ordering comes from the view's
+    ``ordering`` attribute (or ``?ordering=`` when the view allows it), with
+    the primary key appended as a tie-breaker when it is missing, so rows
+    sharing a timestamp keep a stable order across pages.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if any(name.lstrip('-') in ('pk', queryset.model._meta.pk.name) for name in ordering):
+            return ordering
+        return ordering + (('-pk' if ordering[0].startswith('-') else 'pk'),)
+
+
+class KeysetOrPageNumberPagination(BasePagination):
+    """
+    Page-number pagination by default, so existing clients keep ``count`` and
+    the page links; keyset pagination when the client asks for it with
+    ``?pagination=cursor`` or follows a ``?cursor=`` link.
+    """
+    keyset_pagination_class = KeysetPagination
+    page_number_pagination_class = PageNumberPagination
+
+    def use_keyset(self, request):
+        return (
+            request.query_params.get('pagination') == 'cursor'
+            or self.keyset_pagination_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.paginator = self.keyset_pagination_class()
+        else:
+            self.paginator = self.page_number_pagination_class()
+        return self.paginator.paginate_queryset(queryset, request, view=view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return self.page_number_pagination_class().get_paginated_response_schema(schema)
+
+    def get_schema_fields(self, view):
+        return (
+            self.page_number_pagination_class().get_schema_fields(view)
+            + self.keyset_pagination_class().get_schema_fields(view)
+        )
+
+    def get_schema_operation_parameters(self, view):
+        return (
+            self.page_number_pagination_class().get_schema_operation_parameters(view)
+            + self.keyset_pagination_class().get_schema_operation_parameters(view)
+        )
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+    @property
+    def display_page_controls(self):
+        paginator = getattr(self, 'paginator', None)
+        return getattr(paginator, 'display_page_controls', False)
@@ -0,0 +1,93 @@
+"""
+Stay pricing shared by booking creation, payment and search.
+
+A stay is priced night by night: the property's weekday or weekend rate,
+replaced by the seasonal rate covering that night if any (later seasons win),
+then reduced by the best length-of-stay discount and increased by the
+property's fees. ``quote_many`` prices one stay for any number of properties
+in a single pass over three queries (seasons, discounts, fees), so search
+pages can show totals without per-result lookups.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from .models import SeasonalRate, LengthOfStayDiscount, PropertyFee
+
+CENT = Decimal('0.01')
+# date.weekday() of the nights charged at the weekend rate: Friday and Saturday
+WEEKEND_NIGHTS = (4, 5)
+
+
+def money(value):
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def to_minor_units(amount):
+    """Cents for payment providers."""
+    return int(money(amount) * 100)
+
+
+def quote_many(properties, check_in_date, check_out_date, guests=1):
+    """
+    Price the stay for each property; returns ``{property_id: quote}``.
+
+    Only ``pk``, ``price_per_night`` and ``weekend_price_per_night`` of the
+    given properties are read.
+    """
+    properties = list(properties)
+    property_ids = [prop.pk for prop in properties]
+    nights = (check_out_date - check_in_date).days
+    weekend = [(check_in_date + timedelta(days=night)).weekday() in WEEKEND_NIGHTS for night in range(nights)]
+
+    seasons = defaultdict(list)
+    for season in SeasonalRate.objects.filter(
+        property_id__in=property_ids, start_date__lt=check_out_date, end_date__gte=check_in_date
+    ).order_by('start_date', 'pk'):
+        seasons[season.property_id].append(season)
+
+    # Ordered by threshold, so the deepest applicable discount is kept
+    discounts = dict(
+        LengthOfStayDiscount.objects.filter(property_id__in=property_ids, min_nights__lte=nights)
+        .order_by('min_nights').values_list('property_id', 'percent')
+    )
+
+    fees = defaultdict(list)
+    for fee in PropertyFee.objects.filter(property_id__in=property_ids).order_by('pk'):
+        fees[fee.property_id].append(fee)
+    fee_units = {'per_stay': 1, 'per_night': nights, 'per_guest': guests}
+
+    quotes = {}
+    for prop in properties:
+        weekend_rate = prop.weekend_price_per_night or prop.price_per_night
+        rates = [weekend_rate if is_weekend else prop.price_per_night for is_weekend in weekend]
+        for season in seasons[prop.pk]:
+            season_weekend_rate = season.weekend_price_per_night or season.price_per_night
+            first = max((season.start_date - check_in_date).days, 0)
+            last = min((season.end_date - check_in_date).days + 1, nights)
+            for night in range(first, last):
+                rates[night] = season_weekend_rate if weekend[night] else season.price_per_night
+
+        subtotal = money(sum(rates, Decimal(0)))
+        discount = money(subtotal * discounts.get(prop.pk, 0) / 100)
+        fee_lines = [
+            {'name': fee.name, 'amount': money(fee.amount * fee_units[fee.fee_type])}
+            for fee in fees[prop.pk]
+        ]
+        quotes[prop.pk] = {
+            'property_id': prop.pk,
+            'check_in_date': check_in_date,
+            'check_out_date': check_out_date,
+            'nights': nights,
+            'guests': guests,
+            'subtotal': subtotal,
+            'discount': discount,
+            'fees': fee_lines,
+            'total': subtotal - discount + sum((line['amount'] for line in fee_lines), Decimal(0)),
+        }
+    return quotes
+
+
+def quote(prop, check_in_date, check_out_date, guests=1):
+    """Price one stay at one property."""
+    return quote_many([prop], check_in_date, check_out_date, guests)[prop.pk]
@@ -0,0 +1,82 @@
+"""
+Review aggregates stored on ``Property``.
+
+``rating_count``, ``rating_sum``, ``rating_avg`` and one count column per star
+are adjusted by a single ``UPDATE`` whenever a review is added, removed or
+re-rated, in the transaction that changes the review, so listing cards,
+search filters and ordering never aggregate over ``Review``.
+``repair_ratings`` recomputes them from the reviews.
+"""
+from collections import defaultdict
+
+from django.db.models import Case, Count, F, FloatField, Value, When
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+
+from .models import Property, Review
+
+STARS = (1, 2, 3, 4, 5)
+HISTOGRAM_FIELDS = tuple(f'rating_{star}_count' for star in STARS)
+
+
+def histogram_field(rating):
+    return f'rating_{rating}_count' if rating in STARS else None
+
+
+def apply_rating(property_id, rating, sign):
+    """Add (``sign=1``) or remove (``sign=-1``) one review's rating."""
+    count = F('rating_count') + sign
+    total = F('rating_sum') + sign * rating
+    changes = {
+        # Listed first: MySQL evaluates SET assignments left to right, so the
+        # average must be computed before the count and sum change.
+        'rating_avg': Case(
+            When(rating_count=-sign, then=Value(None)),
+            default=Round(Cast(total, FloatField()) / count, 2),
+            output_field=Property._meta.get_field('rating_avg'),
+        ),
+        'rating_count': count,
+        'rating_sum': total,
+    }
+    bucket = histogram_field(rating)
+    if bucket:
+        changes[bucket] = F(bucket) + sign
+    # Cached property responses are validated against updated_at
+    Property.objects.filter(pk=property_id).update(updated_at=timezone.now(), **changes)
+
+
+def aggregates(counts):
+    """Column values from ``{rating: number of reviews}``."""
+    rating_count = sum(counts.values())
+    rating_sum = sum(rating * number for rating, number in counts.items())
+    values = {
+        'rating_count': rating_count,
+        'rating_sum': rating_sum,
+        'rating_avg': round(rating_sum / rating_count, 2) if rating_count else None,
+    }
+    for star, field in zip(STARS, HISTOGRAM_FIELDS):
+        values[field] = counts.get(star, 0)
+    return values
+
+
+def repair_ratings(property_ids=None):
+    """Recompute the aggregates from the reviews; returns the ids of properties that were wrong."""
+    counts = defaultdict(dict)
+    reviews = Review.objects.all()
+    properties = Property.objects.only('pk', 'rating_count', 'rating_sum', 'rating_avg', *HISTOGRAM_FIELDS)
+    if property_ids is not None:
+        reviews = reviews.filter(property_id__in=property_ids)
+        properties = properties.filter(pk__in=property_ids)
+    for property_id, rating, number in reviews.values_list('property_id', 'rating').annotate(number=Count('pk')):
+        counts[property_id][rating] = number
+
+    repaired = []
+    for prop in properties.iterator():
+        values = aggregates(counts.get(prop.pk, {}))
+        stored = {field: getattr(prop, field) for field in values}
+        if stored['rating_avg'] is not None:
+            stored['rating_avg'] = round(float(stored['rating_avg']), 2)
+        if stored != values:
+            Property.objects.filter(pk=prop.pk).update(updated_at=timezone.now(), **values)
+            repaired.append(prop.pk)
+    return repaired
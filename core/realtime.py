@@ -0,0 +1,85 @@
+"""
+Conversation events pushed to WebSocket clients.
+
+Every event is sent to the conversation's group, joined by
+``ConversationConsumer`` sockets, and to each participant's group, joined by
+``InboxConsumer`` sockets, once the transaction that caused it commits. The
+JSON text is rendered once here rather than per socket, and the channel layer
+only carries that string, so any layer backend can transport it.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .models import ConversationParticipant, Message
+from .serializers import MessageSerializer
+
+MESSAGE_NEW = 'message.new'
+MESSAGE_READ = 'message.read'
+
+
+def conversation_group(conversation_id):
+    return f'conversation.{conversation_id}'
+
+
+def user_group(user_id):
+    return f'user.{user_id}'
+
+
+def render(payload):
+    return JSONRenderer().render(payload).decode()
+
+
+def publish(conversation_id, payload):
+    """Send an event to a conversation and its participants after commit."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    def send():
+        event = {'type': 'conversation.event', 'text': render(payload)}
+        groups = [conversation_group(conversation_id)] + [
+            user_group(user_id) for user_id in
+            ConversationParticipant.objects.filter(conversation_id=conversation_id).values_list('user_id', flat=True)
+        ]
+        for group in groups:
+            async_to_sync(channel_layer.group_send)(group, event)
+
+    transaction.on_commit(send)
+
+
+def publish_message(message):
+    publish(message.conversation_id, {'type': MESSAGE_NEW, 'message': MessageSerializer(message).data})
+
+
+def publish_read(conversation_id, reader_id, read_at, message_ids=None, up_to=None):
+    """
+    Read receipt: either the listed messages, or every message up to ``up_to``
+    (all of them when it is None) that others had sent, were read at ``read_at``.
+    """
+    publish(conversation_id, {
+        'type': MESSAGE_READ,
+        'conversation': conversation_id,
+        'reader': reader_id,
+        'message_ids': message_ids,
+        'up_to': up_to,
+        'read_at': read_at,
+    })
+
+
+def mark_read(conversation_id, reader_id, up_to=None):
+    """
+    Mark the messages other participants sent to a conversation as read, up to
+    message id ``up_to`` if given, in one UPDATE, and send one read receipt.
+    Returns how many messages were marked.
+    """
+    unread = Message.objects.filter(conversation_id=conversation_id, read_at__isnull=True).exclude(sender_id=reader_id)
+    if up_to is not None:
+        unread = unread.filter(message_id__lte=up_to)
+    read_at = timezone.now()
+    count = unread.update(read_at=read_at)
+    if count:
+        publish_read(conversation_id, reader_id, read_at, up_to=up_to)
+    return count
@@ -0,0 +1,96 @@
+"""
+Race-free booking creation.
+
+Every night held by a booking in ``BLOCKING_BOOKING_STATUSES`` is a
+``BookingNight`` row, unique per ``(property, date)``. ``Booking.save`` writes
+the booking and its nights in one transaction, so of two overlapping stays
+only one can commit: the database rejects the other at the unique index.
+Writers only wait on each other for the same property's nights, never
+across listings, and no table or property lock is taken.
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .availability import BLOCKING_BOOKING_STATUSES, BOOKING_HOLD_MINUTES, CHECKOUT_HOLD_MINUTES
+from .models import Booking, BookingNight
+
+
+class DatesUnavailable(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Property is not available for these dates'
+    default_code = 'dates_unavailable'
+
+
+def stay_nights(check_in_date, check_out_date):
+    return [check_in_date + timedelta(days=offset) for offset in range((check_out_date - check_in_date).days)]
+
+
+def sync_nights(booking):
+    """Make the booking's ``BookingNight`` rows match its dates and status; called by ``Booking.save``."""
+    if booking.status in BLOCKING_BOOKING_STATUSES:
+        wanted = stay_nights(booking.check_in_date, booking.check_out_date)
+    else:
+        wanted = []
+    held = set(BookingNight.objects.filter(booking=booking).values_list('property_id', 'date'))
+    if held == {(booking.property_id, night) for night in wanted}:
+        return
+    BookingNight.objects.filter(booking=booking).exclude(property_id=booking.property_id, date__in=wanted).delete()
+    BookingNight.objects.bulk_create([
+        BookingNight(property_id=booking.property_id, date=night, booking=booking)
+        for night in wanted if (booking.property_id, night) not in held
+    ])
+
+
+def release_expired_holds(property_id=None):
+    """Expire pending bookings whose hold lapsed, freeing their nights. Returns how many."""
+    expired = Booking.objects.filter(status='pending', held_until__lt=timezone.now())
+    if property_id is not None:
+        expired = expired.filter(property_id=property_id)
+    count = 0
+    for booking in expired:
+        booking.status = 'expired'
+        booking.save(update_fields=['status', 'updated_at'])
+        count += 1
+    return count
+
+
+def reserve(**fields):
+    """
+    Create a booking holding its nights, or raise ``DatesUnavailable`` (409)
+    when another booking already holds one of them.
+    """
+    try:
+        return Booking.objects.create(**fields)
+    except IntegrityError:
+        pass
+    # The nights may only be held by abandoned payments
+    if release_expired_holds(fields['property'].pk):
+        try:
+            return Booking.objects.create(**fields)
+        except IntegrityError:
+            pass
+    raise DatesUnavailable()
+
+
+def renew_hold(booking):
+    """
+    Hold an unpaid booking's nights for ``CHECKOUT_HOLD_MINUTES`` while the
+    guest pays, re-reserving them if the hold already lapsed. Raises
+    ``DatesUnavailable`` (409) when another booking took them meanwhile.
+    """
+    booking.status = 'pending'
+    booking.held_until = timezone.now() + timedelta(minutes=CHECKOUT_HOLD_MINUTES)
+    try:
+        return booking.save(update_fields=['status', 'held_until', 'updated_at'])
+    except IntegrityError:
+        pass
+    if release_expired_holds(booking.property_id):
+        try:
+            return booking.save(update_fields=['status', 'held_until', 'updated_at'])
+        except IntegrityError:
+            pass
+    raise DatesUnavailable()
@@ -0,0 +1,9 @@
+from django.conf import settings
+from django.urls import path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    path(settings.BASE_URL + 'ws/conversations/', consumers.InboxConsumer.as_asgi()),
+    path(settings.BASE_URL + 'ws/conversations/<int:conversation_id>/', consumers.ConversationConsumer.as_asgi()),
+]
@@ -0,0 +1,157 @@
+"""
+Keyword and faceted search over properties.
+
+Each property's title, description, city, amenity and facility names are
+tokenized into weighted ``PropertySearchToken`` terms, and its amenities,
+facilities and house rules are flattened into ``PropertyFacet`` rows, whenever
+they change (see ``core.signals``). Queries are answered by grouped lookups on
+those two indexes instead of ``icontains`` scans or one join per feature.
+"""
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Sum, Value
+
+from .models import (
+    Property, PropertyAmenity, PropertyFacility, PropertyHouseRule,
+    PropertySearchToken, PropertyFacet
+)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TOKEN_LENGTH = 64
+MAX_QUERY_TERMS = 10
+STOPWORDS = frozenset(
+    'a an and are as at be by for from in into is it of on or the to with'.split()
+)
+
+# Relevance weight of a term by where it appears
+FIELD_WEIGHTS = {
+    'title': 8,
+    'address_city': 5,
+    'amenity': 3,
+    'facility': 3,
+    'description': 1,
+}
+# A term repeated in a long description shouldn't outrank a title match
+MAX_FIELD_OCCURRENCES = 3
+
+# Facet key prefix for each kind of property feature
+FACET_KINDS = {
+    'amenities': 'amenity',
+    'facilities': 'facility',
+    'house_rules': 'rule',
+}
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_RE.findall((text or '').lower()):
+        if len(token) > 1 and token not in STOPWORDS:
+            tokens.append(token[:MAX_TOKEN_LENGTH])
+    return tokens
+
+
+def property_terms(prop, amenity_names=(), facility_names=()):
+    """Return the weighted term map of a property."""
+    sources = [
+        ('title', [prop.title]),
+        ('address_city', [prop.address_city]),
+        ('description', [prop.description]),
+        ('amenity', amenity_names),
+        ('facility', facility_names),
+    ]
+    terms = Counter()
+    for field, texts in sources:
+        occurrences = Counter(token for text in texts for token in tokenize(text))
+        for token, count in occurrences.items():
+            terms[token] += FIELD_WEIGHTS[field] * min(count, MAX_FIELD_OCCURRENCES)
+    return terms
+
+
+def index_property(property_id):
+    """
+    (Re)build the search tokens and facets of one property; removes them if
+    the property no longer exists.
+    """
+    with transaction.atomic():
+        PropertySearchToken.objects.filter(property_id=property_id).delete()
+        PropertyFacet.objects.filter(property_id=property_id).delete()
+        prop = Property.objects.filter(pk=property_id).only(
+            'property_id', 'title', 'description', 'address_city'
+        ).first()
+        if prop is None:
+            return
+
+        amenities = list(PropertyAmenity.objects.filter(property_id=property_id).values_list('amenity_id', 'amenity__name'))
+        facilities = list(PropertyFacility.objects.filter(property_id=property_id).values_list('facility_id', 'facility__name'))
+        # A house rule facet means the rule is in force for the property
+        rule_ids = PropertyHouseRule.objects.filter(property_id=property_id, is_allowed=True).values_list('rule_id', flat=True)
+
+        terms = property_terms(prop, [name for _, name in amenities], [name for _, name in facilities])
+        PropertySearchToken.objects.bulk_create(
+            PropertySearchToken(property_id=property_id, token=token, weight=weight)
+            for token, weight in terms.items()
+        )
+
+        facets = (
+            [facet_key('amenities', pk) for pk, _ in amenities]
+            + [facet_key('facilities', pk) for pk, _ in facilities]
+            + [facet_key('house_rules', pk) for pk in rule_ids]
+        )
+        PropertyFacet.objects.bulk_create(PropertyFacet(property_id=property_id, facet=facet) for facet in facets)
+
+
+def schedule_reindex(property_id):
+    """Reindex a property once the surrounding transaction commits."""
+    transaction.on_commit(lambda: index_property(property_id))
+
+
+def search(queryset, query):
+    """
+    Filter a ``Property`` queryset to those matching every query term and
+    annotate ``search_score`` (summed term weights) for ranking.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return queryset.annotate(search_score=Value(0)).none()
+    return queryset.filter(search_tokens__token__in=terms).annotate(
+        search_score=Sum('search_tokens__weight'),
+        matched_terms=Count('search_tokens'),
+    ).filter(matched_terms=len(terms))
+
+
+def facet_key(kind, pk):
+    return f'{FACET_KINDS[kind]}:{pk}'
+
+
+def filter_facets(queryset, **selected):
+    """
+    Keep properties having every selected feature, e.g.
+    ``filter_facets(qs, amenities=[1, 10], house_rules=[1])``.
+
+    The facet index answers the whole conjunction with one grouped
+    ``IN`` subquery, however many features are selected.
+    """
+    facets = {facet_key(kind, pk) for kind, pks in selected.items() for pk in pks or ()}
+    if not facets:
+        return queryset
+    matching = PropertyFacet.objects.filter(facet__in=facets).values('property').annotate(
+        matched=Count('facet')
+    ).filter(matched=len(facets)).values('property')
+    return queryset.filter(pk__in=matching)
+
+
+def facet_counts(queryset):
+    """
+    Count the properties of a result set having each feature, in one grouped
+    query: ``{'amenities': {id: count}, 'facilities': {...}, 'house_rules': {...}}``.
+    """
+    counts = {kind: {} for kind in FACET_KINDS}
+    prefixes = {prefix: kind for kind, prefix in FACET_KINDS.items()}
+    result_ids = queryset.order_by().values('pk')
+    rows = PropertyFacet.objects.filter(property__in=result_ids).values('facet').annotate(count=Count('property'))
+    for row in rows:
+        prefix, pk = row['facet'].split(':')
+        counts[prefixes[prefix]][int(pk)] = row['count']
+    return counts
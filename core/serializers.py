@@ -1,11 +1,19 @@
+from calendar import monthrange
+
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db import models
+from django.db.models import OuterRef, Subquery
 from django.utils import timezone  # Add this import
 from .models import (
     Property, Amenity, PropertyAmenity, Facility, PropertyFacility,
     HouseRule, PropertyHouseRule, Booking, Review, Conversation,
     ConversationParticipant, Message, Photo, Availability
 )
+from .availability import is_bookable
+from .pricing import quote
+from .images import VARIANT_SIZES, VARIANT_FORMATS, variant_url
+from .ratings import STARS, HISTOGRAM_FIELDS
 
 
 '''
@@ -25,33 +33,147 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class PhotoSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Photo
         fields = '__all__'
 
+    def get_variants(self, obj):
+        # {"thumb": {"width": 320, "height": 213, "webp": url, "jpeg": url}, ...}; empty until processed
+        request = self.context.get('request')
+        variants = {}
+        for size in VARIANT_SIZES:
+            if size not in obj.variants:
+                continue
+            variant = {'width': obj.variants[size]['width'], 'height': obj.variants[size]['height']}
+            for fmt in VARIANT_FORMATS:
+                url = variant_url(obj.variants, size, fmt)
+                if url:
+                    variant[fmt] = request.build_absolute_uri(url) if request else url
+            variants[size] = variant
+        return variants
+
 class AvailabilitySerializer(serializers.ModelSerializer):
     class Meta:
         model = Availability
         fields = '__all__'
 
+def get_current_bookings(property_ids):
+    """
+    Map each property id to its active confirmed booking (or None), using one
+    query for all of them. The guest is joined so rendering needs no extra hits.
+    """
+    today = timezone.localdate()
+    current_bookings = dict.fromkeys(property_ids)
+    bookings = Booking.objects.filter(
+        property_id__in=property_ids,
+        check_in_date__lte=today,
+        check_out_date__gte=today,
+        status='confirmed'
+    ).select_related('guest').order_by('booking_id')
+    for booking in bookings:
+        if current_bookings[booking.property_id] is None:
+            current_bookings[booking.property_id] = booking
+    return current_bookings
+
+
+class CurrentBookingListSerializer(serializers.ListSerializer):
+    """
+    Resolves the current booking of every property on the page in one query
+    and shares the result with nested PropertySerializers via the context.
+    Child serializers list the properties they render in
+    ``current_booking_property_ids``.
+    """
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        property_ids = set()
+        for item in items:
+            property_ids.update(pk for pk in self.child.current_booking_property_ids(item) if pk)
+
+        cache = self.context.setdefault('current_bookings', {})
+        missing = property_ids.difference(cache)
+        if missing:
+            cache.update(get_current_bookings(missing))
+        return super().to_representation(items)
+
+
+def property_field_selection(query_params):
+    """
+    Parse ``?fields=a,b``, ``?expand=photos`` and ``?compact=true`` into the
+    ``fields``/``expand`` arguments of PropertySerializer. Returns an empty
+    dict when the client asked for the full representation.
+    """
+    def split(name):
+        return [part.strip() for part in query_params.get(name, '').split(',') if part.strip()]
+
+    fields = split('fields')
+    if query_params.get('compact') == 'true':
+        fields = list(PropertySerializer.LISTING_FIELDS) + fields
+    if not fields:
+        return {}
+    return {'fields': fields, 'expand': split('expand')}
+
+
 class PropertySerializer(serializers.ModelSerializer):
     host = UserSerializer(read_only=True) # Nested serializer for host
     photos = PhotoSerializer(many=True, read_only=True) # Nested serializer for photos
     availabilities = AvailabilitySerializer(many=True, read_only=True) # Nested serializer for availabilities
     current_booking = serializers.SerializerMethodField()
+    cover_photo = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
+
+    # Map pins and search cards
+    LISTING_FIELDS = (
+        'property_id', 'title', 'price_per_night', 'latitude', 'longitude', 'cover_photo',
+        'rating_avg', 'rating_count',
+    )
+    # Fields kept whatever the client selects
+    REQUIRED_FIELDS = ()
 
     class Meta:
         model = Property
-        fields = '__all__'
+        # The per-star counts are rendered together as rating_histogram
+        exclude = ('rating_sum',) + HISTOGRAM_FIELDS
+        list_serializer_class = CurrentBookingListSerializer
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            # Sparse fieldset: drop everything the client didn't ask for
+            keep = set(fields) | set(expand or ()) | set(self.REQUIRED_FIELDS)
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+
+    @staticmethod
+    def setup_eager_loading(queryset, fields=None, expand=None):
+        """Fetch only the relations the selected fields will render."""
+        selected = None if fields is None else set(fields) | set(expand or ())
+        if selected is None or 'host' in selected:
+            queryset = queryset.select_related('host')
+        if selected is None or 'photos' in selected:
+            queryset = queryset.prefetch_related('photos')
+        elif 'cover_photo' in selected:
+            cover = Photo.objects.filter(property=OuterRef('pk')).order_by('photo_id')
+            queryset = queryset.annotate(
+                cover_photo_path=Subquery(cover.values('image')[:1]),
+                cover_photo_variants=Subquery(cover.values('variants')[:1]),
+            )
+        if selected is None or 'availabilities' in selected:
+            queryset = queryset.prefetch_related('availabilities')
+        return queryset
+
+    def current_booking_property_ids(self, instance):
+        if 'current_booking' not in self.fields:
+            return []
+        return [instance.pk]
 
     def get_current_booking(self, obj):
-        # Get current active booking for this property
-        current_booking = Booking.objects.filter(
-            property=obj,
-            check_in_date__lte=timezone.now(),
-            check_out_date__gte=timezone.now(),
-            status='confirmed'
-        ).first()
+        # Get current active booking for this property, batched per page when listed
+        cache = self.context.setdefault('current_bookings', {})
+        if obj.pk not in cache:
+            cache.update(get_current_bookings([obj.pk]))
+        current_booking = cache[obj.pk]
 
         if current_booking:
             return {
@@ -61,10 +183,35 @@ class PropertySerializer(serializers.ModelSerializer):
             }
         return None
 
+    def get_cover_photo(self, obj):
+        # Annotated by setup_eager_loading when photos themselves aren't rendered
+        if hasattr(obj, 'cover_photo_path'):
+            path, variants = obj.cover_photo_path, obj.cover_photo_variants
+        else:
+            photos = sorted(obj.photos.all(), key=lambda photo: photo.photo_id)
+            path, variants = (photos[0].image.name, photos[0].variants) if photos else (None, None)
+        if not path:
+            return None
+
+        # Listing cards get the thumbnail once it exists, the original until then
+        url = variant_url(variants, 'thumb') or Photo._meta.get_field('image').storage.url(path)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_rating_histogram(self, obj):
+        # Number of reviews per star, {"1": ..., "5": ...}
+        return {str(star): getattr(obj, field) for star, field in zip(STARS, HISTOGRAM_FIELDS)}
+
+class NearbyPropertySerializer(PropertySerializer):
+    distance_km = serializers.FloatField(read_only=True)
+
+    REQUIRED_FIELDS = ('distance_km',)
+
+
 class AmenitySerializer(serializers.ModelSerializer):
     class Meta:
         model = Amenity
-        fields = '__all__'
+        exclude = ('updated_at',)
 
 class PropertyAmenitySerializer(serializers.ModelSerializer):
     amenity = AmenitySerializer(read_only=True) # Nested serializer for amenity
@@ -76,7 +223,7 @@ class PropertyAmenitySerializer(serializers.ModelSerializer):
 class FacilitySerializer(serializers.ModelSerializer):
     class Meta:
         model = Facility
-        fields = '__all__'
+        exclude = ('updated_at',)
 
 class PropertyFacilitySerializer(serializers.ModelSerializer):
     facility = FacilitySerializer(read_only=True) # Nested serializer for facility
@@ -88,7 +235,7 @@ class PropertyFacilitySerializer(serializers.ModelSerializer):
 class HouseRuleSerializer(serializers.ModelSerializer):
     class Meta:
         model = HouseRule
-        fields = '__all__'
+        exclude = ('updated_at',)
 
 class PropertyHouseRuleSerializer(serializers.ModelSerializer):
     rule = HouseRuleSerializer(read_only=True) # Nested serializer for house rule
@@ -104,6 +251,128 @@ class BookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
         fields = '__all__'
+        read_only_fields = ('held_until',)
+        list_serializer_class = CurrentBookingListSerializer
+
+    def current_booking_property_ids(self, instance):
+        return [instance.property_id]
+
+
+class CommaSeparatedIntegersField(serializers.CharField):
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        try:
+            return [int(part) for part in value.split(',') if part.strip()]
+        except ValueError:
+            raise serializers.ValidationError('Must be a comma-separated list of ids')
+
+
+class PropertySearchSerializer(serializers.Serializer):
+    q = serializers.CharField(required=False, help_text='Keywords matched against title, description, city, amenities and facilities')
+    amenities = CommaSeparatedIntegersField(required=False, help_text='Amenity ids the property must all have')
+    facilities = CommaSeparatedIntegersField(required=False, help_text='Facility ids the property must all have')
+    house_rules = CommaSeparatedIntegersField(required=False, help_text='House rule ids the property must all enforce')
+    check_in_date = serializers.DateField(required=False)
+    check_out_date = serializers.DateField(required=False)
+    guests = serializers.IntegerField(required=False, min_value=1)
+    city = serializers.CharField(required=False)
+    min_rating = serializers.DecimalField(
+        required=False, max_digits=3, decimal_places=2, min_value=0, max_value=5,
+        help_text='Lowest average review rating'
+    )
+    min_reviews = serializers.IntegerField(required=False, min_value=1, help_text='Fewest reviews')
+    sort = serializers.ChoiceField(
+        choices=('relevance', 'rating', 'reviews'), required=False, default='relevance',
+        help_text='relevance (keyword score, else id), rating (best rated first) or reviews (most reviewed first)'
+    )
+
+    def validate(self, data):
+        check_in_date = data.get('check_in_date')
+        check_out_date = data.get('check_out_date')
+
+        if bool(check_in_date) != bool(check_out_date):
+            raise serializers.ValidationError('check_in_date and check_out_date must be given together')
+
+        if check_in_date and check_in_date >= check_out_date:
+            raise serializers.ValidationError({'check_out_date': 'Check-out date must be after check-in date'})
+
+        return data
+
+
+class QuoteRequestSerializer(serializers.Serializer):
+    property_ids = CommaSeparatedIntegersField(help_text='Up to 100 property ids to price')
+    check_in_date = serializers.DateField()
+    check_out_date = serializers.DateField()
+    guests = serializers.IntegerField(required=False, default=1, min_value=1)
+
+    def validate_property_ids(self, value):
+        if not value or len(value) > 100:
+            raise serializers.ValidationError('Give between 1 and 100 property ids')
+        return value
+
+    def validate(self, data):
+        if data['check_in_date'] >= data['check_out_date']:
+            raise serializers.ValidationError({'check_out_date': 'Check-out date must be after check-in date'})
+        return data
+
+
+class MessageHistorySerializer(serializers.Serializer):
+    before = serializers.IntegerField(required=False, min_value=1, help_text='Only messages older than this message id')
+    after = serializers.IntegerField(required=False, min_value=1, help_text='Only messages newer than this message id')
+    limit = serializers.IntegerField(required=False, default=50, min_value=1, max_value=100)
+
+    def validate(self, data):
+        if 'before' in data and 'after' in data:
+            raise serializers.ValidationError('Give either before or after, not both')
+        return data
+
+
+class MarkReadSerializer(serializers.Serializer):
+    up_to = serializers.IntegerField(required=False, min_value=1, help_text='Last message id read; all messages when omitted')
+
+
+class CalendarQuerySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    months = serializers.IntegerField(required=False, default=12, min_value=1, max_value=18)
+    encoding = serializers.ChoiceField(choices=('runs', 'bitmap'), required=False, default='runs')
+
+    def validate(self, data):
+        data.setdefault('start', timezone.localdate())
+        start = data['start']
+        month = start.month - 1 + data['months']
+        # Same day-of-month `months` later, clamped to the end of shorter months
+        year, month = start.year + month // 12, month % 12 + 1
+        day = min(start.day, monthrange(year, month)[1])
+        data['end'] = start.replace(year=year, month=month, day=day)
+        return data
+
+class NearbySearchSerializer(serializers.Serializer):
+    lat = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    lng = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    radius_km = serializers.FloatField(required=False, default=10, min_value=0, max_value=500)
+    bbox = serializers.CharField(required=False, help_text='south,west,north,east')
+
+    def validate_bbox(self, value):
+        try:
+            south, west, north, east = (float(part) for part in value.split(','))
+        except ValueError:
+            raise serializers.ValidationError('bbox must be "south,west,north,east"')
+        if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+            raise serializers.ValidationError('bbox is out of range')
+        return south, west, north, east
+
+    def validate(self, data):
+        has_point = 'lat' in data and 'lng' in data
+        if not has_point and 'bbox' not in data:
+            raise serializers.ValidationError('Provide lat and lng, or bbox')
+        if not has_point:
+            # Order bounding-box results by distance from the box centre
+            south, west, north, east = data['bbox']
+            if west > east:
+                east += 360
+            data['lat'] = (south + north) / 2
+            data['lng'] = ((west + east) / 2 + 180) % 360 - 180
+        return data
 
 
 class CreateBookingSerializer(serializers.ModelSerializer):
@@ -131,22 +400,15 @@ class CreateBookingSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({'check_out_date': 'Check-out date must be after check-in date'})
 
         # Check if property is available for these dates
-        overlapping_bookings = Booking.objects.filter(
-            property_id=property_id,
-            check_in_date__lt=check_out_date,
-            check_out_date__gt=check_in_date,
-            status='confirmed'
-        )
-        if overlapping_bookings.exists():
+        if not is_bookable(property_id, check_in_date, check_out_date):
             raise serializers.ValidationError('Property is not available for these dates')
 
         # Check if number of guests is valid
         if num_guests > property_obj.max_guests:
             raise serializers.ValidationError({'num_guests': f'Maximum number of guests allowed is {property_obj.max_guests}'})
 
-        # Calculate total price
-        days = (check_out_date - check_in_date).days
-        total_price = property_obj.price_per_night * days
+        # Seasonal, weekend and length-of-stay rates plus fees
+        total_price = quote(property_obj, check_in_date, check_out_date, num_guests)['total']
 
         # Return validated data with additional fields
         validated_data = {
@@ -166,6 +428,10 @@ class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = '__all__'
+        list_serializer_class = CurrentBookingListSerializer
+
+    def current_booking_property_ids(self, instance):
+        return [instance.property_id, instance.booking.property_id]
 
 class CreateReviewSerializer(serializers.ModelSerializer):
     booking_id = serializers.IntegerField(write_only=True)
@@ -223,6 +489,58 @@ class ConversationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Conversation
         fields = '__all__'
+        list_serializer_class = CurrentBookingListSerializer
+
+    def __init__(self, *args, include_messages=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not include_messages:
+            # Histories are paged through ConversationViewSet.messages instead
+            self.fields.pop('messages')
+
+    def current_booking_property_ids(self, instance):
+        return [instance.property_id, instance.booking.property_id if instance.booking else None]
+
+class InboxParticipantSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'first_name', 'last_name', 'profile_picture_url']
+        ref_name = 'core.InboxParticipantSerializer'
+
+class InboxConversationSerializer(serializers.ModelSerializer):
+    """
+    One inbox row. Expects the annotations of ``ConversationViewSet.get_inbox_queryset``
+    and the page's last messages in ``context['last_messages']``.
+    """
+    property = serializers.SerializerMethodField()
+    participants = serializers.SerializerMethodField()
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Conversation
+        fields = ['conversation_id', 'property', 'booking', 'participants', 'last_message', 'last_message_at', 'unread_count']
+
+    def get_property(self, obj):
+        if obj.property_id is None:
+            return None
+        return {'property_id': obj.property_id, 'title': obj.property_title}
+
+    def get_participants(self, obj):
+        return InboxParticipantSerializer(
+            [participant.user for participant in obj.conversationparticipant_set.all()], many=True
+        ).data
+
+    def get_last_message(self, obj):
+        message = self.context.get('last_messages', {}).get(obj.last_message_id)
+        if message is None:
+            return None
+        return {
+            'message_id': message.message_id,
+            'sender': message.sender_id,
+            'preview': message.preview,
+            'sent_at': message.sent_at,
+            'read_at': message.read_at,
+        }
 
 class ConversationParticipantSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
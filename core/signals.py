@@ -0,0 +1,243 @@
+"""
+Signal handlers for the core app.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (
+    Property, Amenity, PropertyAmenity, Facility, PropertyFacility, HouseRule, PropertyHouseRule,
+    Photo, Availability, Booking, Review, Conversation, Message
+)
+from .calendars import patch_calendar
+from .catalog_cache import bump_catalog_version
+from .storage import track_file_references
+from .images import needs_variants, schedule_variants, delete_variants
+from .search import schedule_reindex
+from .ratings import apply_rating
+from .realtime import publish_message, publish_read
+
+
+@receiver(post_migrate)
+def lowercase_booking_statuses(sender, using, **kwargs):
+    """
+    Data migration run by every ``migrate``: bookings stored before statuses
+    were lowercase ('Pending') would not match ``BLOCKING_BOOKING_STATUSES``.
+    Only rows with capitals are written, so later runs update nothing.
+    """
+    if sender.name != 'core':
+        return
+    Booking.objects.using(using).exclude(status=Lower('status')).update(status=Lower('status'))
+
+
+@receiver(post_save, sender=Property)
+def reindex_saved_property(sender, instance, **kwargs):
+    """
+    Refresh the search index of a property after its text changes.
+    """
+    schedule_reindex(instance.pk)
+
+
+@receiver(post_save, sender=PropertyAmenity)
+@receiver(post_delete, sender=PropertyAmenity)
+@receiver(post_save, sender=PropertyFacility)
+@receiver(post_delete, sender=PropertyFacility)
+@receiver(post_save, sender=PropertyHouseRule)
+@receiver(post_delete, sender=PropertyHouseRule)
+def reindex_property_features(sender, instance, **kwargs):
+    """
+    Refresh the search index and facets when a feature is linked or unlinked.
+    """
+    schedule_reindex(instance.property_id)
+
+
+@receiver(post_save, sender=Amenity)
+def reindex_renamed_amenity(sender, instance, created, **kwargs):
+    """
+    Refresh every property using an amenity whose name may have changed.
+    """
+    if not created:
+        for property_id in PropertyAmenity.objects.filter(amenity=instance).values_list('property_id', flat=True):
+            schedule_reindex(property_id)
+
+
+@receiver(post_save, sender=Facility)
+def reindex_renamed_facility(sender, instance, created, **kwargs):
+    """
+    Refresh every property using a facility whose name may have changed.
+    """
+    if not created:
+        for property_id in PropertyFacility.objects.filter(facility=instance).values_list('property_id', flat=True):
+            schedule_reindex(property_id)
+
+
+@receiver(post_save, sender=Amenity)
+@receiver(post_delete, sender=Amenity)
+@receiver(post_save, sender=Facility)
+@receiver(post_delete, sender=Facility)
+@receiver(post_save, sender=HouseRule)
+@receiver(post_delete, sender=HouseRule)
+def invalidate_catalog(sender, instance, **kwargs):
+    """
+    Drop the cached catalog responses once an admin edit is committed.
+    """
+    catalog = {Amenity: 'amenities', Facility: 'facilities', HouseRule: 'house_rules'}[sender]
+    transaction.on_commit(lambda: bump_catalog_version(catalog))
+
+
+@receiver(post_save, sender=Photo)
+@receiver(post_delete, sender=Photo)
+@receiver(post_save, sender=Availability)
+@receiver(post_delete, sender=Availability)
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def touch_property(sender, instance, **kwargs):
+    """
+    Move the property's updated_at forward when a nested resource changes,
+    so its ETag and Last-Modified validators change with it.
+    """
+    Property.objects.filter(pk=instance.property_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def touch_host_properties(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Hosts are nested in property responses; logins alone don't change them.
+    """
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    Property.objects.filter(host=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Photo)
+def process_uploaded_photo(sender, instance, **kwargs):
+    """
+    Render resized variants of a new or replaced image after commit.
+    """
+    if needs_variants(instance):
+        schedule_variants(instance.pk)
+
+
+@receiver(post_delete, sender=Photo)
+def delete_photo_variants(sender, instance, **kwargs):
+    """
+    Remove the rendered variants of a deleted photo.
+    """
+    variants = instance.variants
+    transaction.on_commit(lambda: delete_variants(variants))
+
+
+# Release the stored image of a replaced or deleted photo
+track_file_references(Photo, 'image')
+
+
+def calendar_span(instance):
+    """The property and days ``[first, last)`` a booking or availability range covers."""
+    if isinstance(instance, Availability):
+        return instance.property_id, instance.start_date, instance.end_date + timedelta(days=1)
+    return instance.property_id, instance.check_in_date, instance.check_out_date
+
+
+@receiver(pre_save, sender=Availability)
+@receiver(pre_save, sender=Booking)
+def remember_calendar_span(sender, instance, update_fields=None, **kwargs):
+    """
+    Keep the days a row covered before this save, to clear them if its dates move.
+    """
+    instance._stored_calendar_span = None
+    if instance.pk is None or (update_fields is not None and not {
+        'property', 'start_date', 'end_date', 'check_in_date', 'check_out_date'
+    } & set(update_fields)):
+        return
+    stored = sender.objects.filter(pk=instance.pk).first()
+    if stored is not None:
+        instance._stored_calendar_span = calendar_span(stored)
+
+
+@receiver(post_save, sender=Availability)
+@receiver(post_save, sender=Booking)
+def patch_saved_calendar_days(sender, instance, **kwargs):
+    """
+    Recompute the calendar days touched by a saved booking or availability range.
+    """
+    property_id, first, last = calendar_span(instance)
+    stored = getattr(instance, '_stored_calendar_span', None)
+    if stored is not None and stored[0] != property_id:
+        patch_calendar(*stored)
+    elif stored is not None:
+        first, last = min(first, stored[1]), max(last, stored[2])
+    patch_calendar(property_id, first, last)
+
+
+@receiver(post_delete, sender=Availability)
+@receiver(post_delete, sender=Booking)
+def patch_deleted_calendar_days(sender, instance, **kwargs):
+    """
+    Free the calendar days of a deleted booking or availability range.
+    """
+    patch_calendar(*calendar_span(instance))
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    """
+    Keep the property and rating a review counted towards before this save.
+    """
+    instance._stored_rating = None
+    if instance.pk is not None:
+        instance._stored_rating = sender.objects.filter(pk=instance.pk).values_list('property_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def count_saved_review(sender, instance, **kwargs):
+    """
+    Move a new or re-rated review into its property's rating aggregates.
+    """
+    current = (instance.property_id, instance.rating)
+    stored = getattr(instance, '_stored_rating', None)
+    if stored == current:
+        return
+    if stored is not None:
+        apply_rating(*stored, sign=-1)
+    apply_rating(*current, sign=1)
+
+
+@receiver(post_delete, sender=Review)
+def uncount_deleted_review(sender, instance, **kwargs):
+    """
+    Remove a deleted review from its property's rating aggregates.
+    """
+    apply_rating(instance.property_id, instance.rating, sign=-1)
+
+
+@receiver(pre_save, sender=Message)
+def remember_message_read_at(sender, instance, update_fields=None, **kwargs):
+    """
+    Keep whether a message was already read, to send a receipt when it becomes read.
+    """
+    instance._was_read = True
+    if instance.pk is not None and instance.read_at is not None and (
+        update_fields is None or 'read_at' in update_fields
+    ):
+        instance._was_read = sender.objects.filter(pk=instance.pk, read_at__isnull=False).exists()
+
+
+@receiver(post_save, sender=Message)
+def push_saved_message(sender, instance, created, **kwargs):
+    """
+    Bump the conversation of a new message and push new messages and read
+    receipts to the conversation's sockets.
+    """
+    if created:
+        # Inboxes are ordered by it; never moves backwards
+        Conversation.objects.filter(
+            pk=instance.conversation_id, last_message_at__lt=instance.sent_at
+        ).update(last_message_at=instance.sent_at)
+        publish_message(instance)
+    elif not getattr(instance, '_was_read', True):
+        publish_read(instance.conversation_id, None, instance.read_at, message_ids=[instance.pk])
@@ -0,0 +1,135 @@
+"""
+Content-addressed, deduplicated media storage.
+
+Files are stored once under ``cas/<aa>/<bb>/<sha256><ext>`` whatever name
+they were uploaded with, so the same photo or document uploaded for many
+listings occupies disk once. Each stored name has a ``core.MediaBlob`` row
+counting the fields that reference it: ``save()`` adds a reference and
+``delete()`` drops one, removing the file with the last. Names never change
+content, so their URLs can be cached for a year (see ``serve_immutable``).
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+
+CAS_PREFIX = getattr(settings, 'CAS_MEDIA_PREFIX', 'cas')
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # Names are derived from content in _save; identical content is meant to collide
+        return name
+
+    def _save(self, name, content):
+        digest, size, staged = self._stage(content)
+        extension = os.path.splitext(name)[1].lower()
+        name = posixpath.join(CAS_PREFIX, digest[:2], digest[2:4], digest + extension)
+
+        MediaBlob = apps.get_model('core', 'MediaBlob')
+        with transaction.atomic():
+            blob, created = MediaBlob.objects.select_for_update().get_or_create(
+                name=name, defaults={'sha256': digest, 'size': size, 'refcount': 0}
+            )
+            path = self.path(name)
+            if os.path.exists(path):
+                os.unlink(staged)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(staged, path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+            MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+        return name
+
+    def _stage(self, content):
+        """Copy the upload next to its destination, hashing it on the way."""
+        staging = self.path(posixpath.join(CAS_PREFIX, 'tmp'))
+        os.makedirs(staging, exist_ok=True)
+        sha256, size = hashlib.sha256(), 0
+        handle, staged = tempfile.mkstemp(dir=staging)
+        try:
+            with os.fdopen(handle, 'wb') as out:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    out.write(chunk)
+        except BaseException:
+            os.unlink(staged)
+            raise
+        return sha256.hexdigest(), size, staged
+
+    def delete(self, name):
+        """Drop one reference to ``name``; the file goes with the last one."""
+        if not name:
+            return
+        MediaBlob = apps.get_model('core', 'MediaBlob')
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                # Uploaded before deduplication: owned by a single field
+                super().delete(name)
+                return
+            if blob.refcount > 1:
+                MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') - 1)
+                return
+            blob.delete()
+            super().delete(name)
+
+
+media_storage = ContentAddressedStorage()
+
+
+def release_file(storage, name):
+    """Drop a field's reference to ``name`` once the current transaction commits."""
+    if name:
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+def track_file_references(model, field_name):
+    """
+    Release the stored file of ``model.field_name`` when it is replaced or
+    its row is deleted. Storage ``save()`` already counts new references.
+    """
+    field = model._meta.get_field(field_name)
+    uid = f'{model._meta.label}.{field_name}'
+
+    def remember_stored_name(sender, instance, update_fields=None, **kwargs):
+        if instance.pk is None or (update_fields is not None and field_name not in update_fields):
+            instance.__dict__.pop(f'_stored_{field_name}', None)
+            return
+        instance.__dict__[f'_stored_{field_name}'] = (
+            model._default_manager.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+        )
+
+    def release_replaced(sender, instance, **kwargs):
+        stored = instance.__dict__.pop(f'_stored_{field_name}', None)
+        if stored and stored != getattr(instance, field_name).name:
+            release_file(field.storage, stored)
+
+    def release_deleted(sender, instance, **kwargs):
+        release_file(field.storage, getattr(instance, field_name).name)
+
+    pre_save.connect(remember_stored_name, sender=model, weak=False, dispatch_uid=f'{uid}.remember')
+    post_save.connect(release_replaced, sender=model, weak=False, dispatch_uid=f'{uid}.replaced')
+    post_delete.connect(release_deleted, sender=model, weak=False, dispatch_uid=f'{uid}.deleted')
+
+
+def serve_immutable(request, path, document_root=None, show_indexes=False):
+    """Serve content-addressed media with year-long, immutable cache headers."""
+    response = serve(request, path, document_root=document_root, show_indexes=show_indexes)
+    patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
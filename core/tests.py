@@ -1,3 +1,1310 @@
-from django.test import TestCase
+import base64
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.conf import settings
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.filters import OrderingFilter
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+
+from account.models import User
+from contacts.models import Contact
+from financial.models import Payment, PaymentCategory, PaymentMethod
+from visitors.models import Visit, Visitor
+from . import catalog_cache
+from .availability import is_bookable
+from .calendars import window_bits
+from .pagination import KeysetPagination
+from .serializers import PropertySerializer
+from .ratings import repair_ratings
+from .reservations import DatesUnavailable, release_expired_holds, reserve
+from .storage import CAS_PREFIX, serve_immutable
+from .models import (
+    Property, Booking, Review, Conversation, ConversationParticipant,
+    Message, Photo, Availability, Amenity, PropertyAmenity, Facility, PropertyFacility, HouseRule, PropertyHouseRule,
+    PropertySearchToken, MediaBlob, SeasonalRate,
+    LengthOfStayDiscount, PropertyFee
+)
+
+logger = logging.getLogger(__name__)
+
+
+def create_property(host, **kwargs):
+    data = {
+        'host': host,
+        'title': 'Seaside flat',
+        'description': 'Two rooms with a view',
+        'address_street': '1 Beach Road',
+        'address_city': 'Lisbon',
+        'address_state': 'Lisbon',
+        'address_zip_code': '1000',
+        'address_country': 'Portugal',
+        'property_type': 'apartment',
+        'room_category': 'entire_place',
+        'price_per_night': 100,
+        'max_guests': 4,
+    }
+    data.update(kwargs)
+    return Property.objects.create(**data)
+
+
+class ListQueryCountTests(APITestCase):
+    """
+    List endpoints nesting PropertySerializer must cost the same number of
+    queries whatever the page size: no per-row booking, guest or photo lookups.
+    """
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.guest = User.objects.create_user(username='guest', email='guest@example.com', password='pass')
+        self.staff = User.objects.create_user(
+            username='staff', email='staff@example.com', password='pass', is_staff=True
+        )
+
+    def add_listings(self, count):
+        today = timezone.localdate()
+        for _ in range(count):
+            prop = create_property(self.host)
+            Photo.objects.create(property=prop, image='property_photos/cover.jpg')
+            Availability.objects.create(
+                property=prop, start_date=today + timedelta(days=30),
+                end_date=today + timedelta(days=31), is_available=False
+            )
+            current = Booking.objects.create(
+                guest=self.guest, property=prop, check_in_date=today - timedelta(days=1),
+                check_out_date=today + timedelta(days=2), num_guests=2, total_price=300,
+                status='confirmed'
+            )
+            past = Booking.objects.create(
+                guest=self.guest, property=prop, check_in_date=today - timedelta(days=10),
+                check_out_date=today - timedelta(days=8), num_guests=2, total_price=200,
+                status='confirmed'
+            )
+            Review.objects.create(guest=self.guest, property=prop, booking=past, rating=5, comment='Great')
+            conversation = Conversation.objects.create(property=prop, booking=current)
+            ConversationParticipant.objects.create(conversation=conversation, user=self.guest)
+            ConversationParticipant.objects.create(conversation=conversation, user=self.host)
+            Message.objects.create(conversation=conversation, sender=self.guest, content='Hello')
+
+    def count_queries(self, url, user):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assert_constant_queries(self, url, user):
+        self.add_listings(2)
+        small = self.count_queries(url, user)
+        self.add_listings(4)
+        large = self.count_queries(url, user)
+        self.assertEqual(small, large)
+
+    def test_property_list(self):
+        self.assert_constant_queries('/api/properties/', self.guest)
+
+    def test_booking_list(self):
+        self.assert_constant_queries('/api/bookings/', self.staff)
+
+    def test_review_list(self):
+        self.assert_constant_queries('/api/reviews/', self.guest)
+
+    def test_conversation_list(self):
+        self.assert_constant_queries('/api/conversations/', self.guest)
+
+    def test_current_booking_is_rendered(self):
+        self.add_listings(1)
+        self.client.force_authenticate(self.guest)
+        response = self.client.get('/api/properties/')
+        current = response.data['results'][0]['current_booking']
+        self.assertEqual(current['guest_email'], self.guest.email)
+
+
+class FieldSelectionTests(APITestCase):
+    """Sparse fieldsets render, and query, only what the client asked for."""
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        today = timezone.localdate()
+        for index in range(3):
+            prop = create_property(self.host, title=f'Flat {index}')
+            Photo.objects.create(property=prop, image=f'property_photos/{index}-b.jpg')
+            Photo.objects.create(property=prop, image=f'property_photos/{index}-a.jpg')
+            Availability.objects.create(property=prop, start_date=today, end_date=today, is_available=False)
+            Booking.objects.create(
+                guest=self.host, property=prop, check_in_date=today - timedelta(days=1),
+                check_out_date=today + timedelta(days=1), num_guests=1, total_price=100, status='confirmed',
+            )
+
+    def test_fields(self):
+        # List validators, count, page: no host, photo, availability or booking lookups
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/properties/', {'fields': 'property_id,title,price_per_night,unknown'})
+        self.assertEqual(set(response.data['results'][0]), {'property_id', 'title', 'price_per_night'})
+
+        prop = Property.objects.first()
+        # Validators, the property, its photos
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/properties/{prop.pk}/', {'fields': 'title', 'expand': 'photos'})
+        self.assertEqual(set(response.data), {'title', 'photos'})
+        self.assertEqual(len(response.data['photos']), 2)
+
+    def test_compact(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/properties/', {'compact': 'true'})
+        item = response.data['results'][0]
+        self.assertEqual(set(item), set(PropertySerializer.LISTING_FIELDS))
+        # The first photo uploaded, read by a subquery instead of prefetching every photo
+        self.assertTrue(item['cover_photo'].endswith('0-b.jpg'))
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/properties/', {'compact': 'true', 'fields': 'host'})
+        self.assertEqual(response.data['results'][0]['host']['email'], 'host@example.com')
+
+    def test_full_representation_by_default(self):
+        response = self.client.get('/api/properties/')
+        item = response.data['results'][0]
+        self.assertTrue({'host', 'photos', 'availabilities', 'current_booking', 'description'} <= set(item))
+        self.assertIsNotNone(item['current_booking'])
+
+
+class AvailabilitySearchTests(APITestCase):
+    """Dated searches return only the properties bookable for the whole stay."""
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.check_in = timezone.localdate() + timedelta(days=20)
+        self.check_out = self.check_in + timedelta(days=3)
+
+    def stay(self, prop, first, last, status='confirmed'):
+        return Booking.objects.create(
+            guest=self.host, property=prop, num_guests=1, total_price=100, status=status,
+            check_in_date=self.check_in + timedelta(days=first), check_out_date=self.check_in + timedelta(days=last),
+        )
+
+    def search(self, **params):
+        dates = {'check_in_date': self.check_in, 'check_out_date': self.check_out}
+        return self.client.get('/api/properties/search/', {**dates, **params})
+
+    def test_only_bookable_properties_are_returned(self):
+        free = create_property(self.host, title='Free')
+        booked = create_property(self.host, title='Booked')
+        self.stay(booked, 2, 5)
+        blocked = create_property(self.host, title='Blocked')
+        # Availability ranges include their end date
+        Availability.objects.create(
+            property=blocked, start_date=self.check_in - timedelta(days=2), end_date=self.check_in, is_available=False,
+        )
+        around = create_property(self.host, title='Booked around the stay')
+        self.stay(around, -2, 0)
+        self.stay(around, 3, 6)
+        cancelled = create_property(self.host, title='Cancelled booking')
+        self.stay(cancelled, 0, 3, status='cancelled')
+        small = create_property(self.host, title='Too small', max_guests=1)
+
+        response = self.search(guests=2)
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([item['property_id'] for item in results], [free.pk, around.pk, cancelled.pk])
+        # Every result is priced for the stay
+        self.assertEqual(results[0]['quote']['nights'], 3)
+        self.assertNotIn(small.pk, [item['property_id'] for item in results])
+
+        undated = self.client.get('/api/properties/search/').data['results']
+        self.assertEqual(len(undated), 6)
+        self.assertNotIn('quote', undated[0])
+
+    def test_invalid_dates(self):
+        self.assertEqual(self.client.get('/api/properties/search/', {'check_in_date': self.check_in}).status_code, 400)
+        self.assertEqual(self.search(check_out_date=self.check_in).status_code, 400)
+
+    def test_bookability_is_one_query(self):
+        for _ in range(3):
+            self.stay(create_property(self.host), 1, 2)
+        create_property(self.host)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.search()
+        self.assertEqual(len(response.data['results']), 1)
+        listed = len(queries.captured_queries)
+        for _ in range(3):
+            self.stay(create_property(self.host), 1, 2)
+        with self.assertNumQueries(listed):
+            self.search()
+
+
+class NearbySearchTests(APITestCase):
+    """Radius and bounding-box searches, nearest first, through the geohash index."""
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+
+    def place(self, title, latitude, longitude):
+        return create_property(self.host, title=title, latitude=Decimal(latitude), longitude=Decimal(longitude))
+
+    def nearby(self, **params):
+        response = self.client.get('/api/properties/nearby/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_radius_search_is_ordered_by_distance(self):
+        lisbon = self.place('Lisbon', '38.722252', '-9.139337')
+        cascais = self.place('Cascais', '38.696900', '-9.420700')
+        self.place('Porto', '41.157944', '-8.629105')
+        create_property(self.host, title='Unplaced')
+
+        results = self.nearby(lat=38.72, lng=-9.14, radius_km=30)
+        self.assertEqual([item['property_id'] for item in results], [lisbon.pk, cascais.pk])
+        self.assertLess(results[0]['distance_km'], 1)
+        self.assertAlmostEqual(results[1]['distance_km'], 24.5, delta=1)
+        self.assertEqual([item['property_id'] for item in self.nearby(lat=38.72, lng=-9.14, radius_km=5)], [lisbon.pk])
+
+    def test_bounding_box(self):
+        lisbon = self.place('Lisbon', '38.722252', '-9.139337')
+        self.place('Porto', '41.157944', '-8.629105')
+        results = self.nearby(bbox='38.5,-9.5,39,-9')
+        self.assertEqual([item['property_id'] for item in results], [lisbon.pk])
+
+    def test_bounding_box_crossing_the_antimeridian(self):
+        east = self.place('Taveuni', '-16.800000', '179.900000')
+        west = self.place('Lau', '-17.200000', '-179.700000')
+        self.place('Suva', '-18.141600', '178.441900')
+        self.place('Apia', '-13.833300', '-171.766700')
+
+        results = self.nearby(bbox='-18,179.5,-16,-179.5')
+        # Nearest the box centre (-17, 180) first
+        self.assertEqual([item['property_id'] for item in results], [east.pk, west.pk])
+        self.assertTrue(all(item['distance_km'] < 50 for item in results))
+
+        # A radius around the antimeridian wraps the same way
+        results = self.nearby(lat=-17, lng=180, radius_km=50)
+        self.assertEqual({item['property_id'] for item in results}, {east.pk, west.pk})
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'lat': 38.7}, {'bbox': '1,2,3'}, {'bbox': '10,0,5,1'}, {'lat': 91, 'lng': 0}):
+            self.assertEqual(self.client.get('/api/properties/nearby/', params).status_code, 400, params)
+
+
+class KeywordSearchTests(APITestCase):
+    """Keyword search ranks by weighted term matches and follows edits through the signals."""
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+
+    def add_property(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_property(self.host, **kwargs)
+
+    def search(self, q):
+        response = self.client.get('/api/properties/search/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [item['property_id'] for item in response.data['results']]
+
+    def test_ranking(self):
+        described = self.add_property(title='Quiet flat', description='Ten minutes from the surf beach')
+        titled = self.add_property(title='Surf house', description='By the sea')
+        in_city = self.add_property(title='Loft', address_city='Surf City')
+        self.add_property(title='Mountain cabin', description='Snow')
+
+        # Title beats city, city beats description
+        self.assertEqual(self.search('surf'), [titled.pk, in_city.pk, described.pk])
+        # Every term must match; case, stopwords and punctuation don't matter
+        self.assertEqual(self.search('The SURF, beach!'), [described.pk])
+        self.assertEqual(self.search('of the'), [])
+
+    def test_index_follows_edits(self):
+        prop = self.add_property(title='Quiet flat')
+        sauna = Amenity.objects.create(name='Sauna')
+        with self.captureOnCommitCallbacks(execute=True):
+            link = PropertyAmenity.objects.create(property=prop, amenity=sauna)
+        self.assertEqual(self.search('sauna'), [prop.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sauna.name = 'Steam room'
+            sauna.save()
+        self.assertEqual(self.search('sauna'), [])
+        self.assertEqual(self.search('steam'), [prop.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            link.delete()
+            prop.title = 'Sunny loft'
+            prop.save()
+        self.assertEqual(self.search('steam'), [])
+        self.assertEqual(self.search('quiet'), [])
+        self.assertEqual(self.search('sunny'), [prop.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            prop.delete()
+        self.assertFalse(PropertySearchToken.objects.exists())
+
+    def test_rebuild_command(self):
+        prop = self.add_property(title='Surf house')
+        PropertySearchToken.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('surf'), [prop.pk])
+
+
+class FacetSearchTests(APITestCase):
+    """Feature filters match every selected feature; counts cover the whole result set."""
+
+    def setUp(self):
+        host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.wifi, self.pool = Amenity.objects.create(name='Wifi'), Amenity.objects.create(name='Pool')
+        self.parking = Facility.objects.create(name='Parking')
+        self.no_smoking = HouseRule.objects.create(name='No smoking')
+        self.properties = []
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(4):
+                prop = create_property(host, title=f'Flat {index}')
+                self.properties.append(prop)
+                PropertyAmenity.objects.create(property=prop, amenity=self.wifi)
+                if index % 2:
+                    PropertyAmenity.objects.create(property=prop, amenity=self.pool)
+                if index >= 2:
+                    PropertyFacility.objects.create(property=prop, facility=self.parking)
+                # Rules that are not in force are not facets
+                PropertyHouseRule.objects.create(property=prop, rule=self.no_smoking, is_allowed=index == 3)
+
+    def search(self, **params):
+        response = self.client.get('/api/properties/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ids(self, data):
+        return [item['property_id'] for item in data['results']]
+
+    def test_filters_require_every_feature(self):
+        flats = self.properties
+        self.assertEqual(self.ids(self.search(amenities=f'{self.wifi.pk},{self.pool.pk}')), [flats[1].pk, flats[3].pk])
+        self.assertEqual(self.ids(self.search(amenities=self.pool.pk, facilities=self.parking.pk)), [flats[3].pk])
+        self.assertEqual(self.ids(self.search(house_rules=self.no_smoking.pk)), [flats[3].pk])
+        self.assertEqual(self.client.get('/api/properties/search/', {'amenities': '1,x'}).status_code, 400)
+
+    def test_counts_cover_the_whole_result_set(self):
+        with mock.patch('rest_framework.pagination.PageNumberPagination.page_size', 1):
+            data = self.search(amenities=self.wifi.pk)
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['facets'], {
+            'amenities': {self.wifi.pk: 4, self.pool.pk: 2},
+            'facilities': {self.parking.pk: 2},
+            'house_rules': {self.no_smoking.pk: 1},
+        })
+        facets = self.search(facilities=self.parking.pk)['facets']
+        self.assertEqual(facets['amenities'], {self.wifi.pk: 2, self.pool.pk: 1})
+
+    def test_counts_follow_unlinking(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            PropertyAmenity.objects.filter(amenity=self.pool).delete()
+        self.assertEqual(self.search()['facets']['amenities'], {self.wifi.pk: 4})
+        self.assertEqual(self.ids(self.search(amenities=self.pool.pk)), [])
+
+
+class CatalogCacheTests(APITestCase):
+    """Catalog reads are served from the versioned cache without touching the database."""
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache._local_cache.clear()
+
+    def add_amenity(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Amenity.objects.create(name=name)
+
+    def test_matching_etag_is_not_modified(self):
+        self.add_amenity('Wifi')
+        response = self.client.get('/api/amenities/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/amenities/')
+        with self.assertNumQueries(0):
+            revalidated = self.client.get('/api/amenities/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.data, response.data)
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_edit_invalidates_catalog(self):
+        amenity = self.add_amenity('Wifi')
+        etag = self.client.get('/api/amenities/')['ETag']
+
+        amenity.name = 'Fast wifi'
+        with self.captureOnCommitCallbacks(execute=True):
+            amenity.save()
+
+        response = self.client.get('/api/amenities/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['name'], 'Fast wifi')
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            amenity.delete()
+        self.assertEqual(self.client.get('/api/amenities/', HTTP_IF_NONE_MATCH=etag).data['results'], [])
+
+    def test_populate_data_invalidates_catalogs(self):
+        etag = self.client.get('/api/facilities/')['ETag']
+        call_command('populate_data', stdout=StringIO())
+        response = self.client.get('/api/facilities/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'])
+
+    def test_lost_version_is_derived_from_the_database(self):
+        amenity = self.add_amenity('Wifi')
+        etag = self.client.get('/api/amenities/')['ETag']
+        # No signal: e.g. a bulk update, with the cache restarted since
+        Amenity.objects.filter(pk=amenity.pk).update(name='Fast wifi', updated_at=timezone.now())
+        cache.clear()
+        revalidated = self.client.get('/api/amenities/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(revalidated.status_code, 200)
+        self.assertEqual(revalidated.data['results'][0]['name'], 'Fast wifi')
+
+    def test_unrelated_query_parameters_share_an_entry(self):
+        self.add_amenity('Wifi')
+        self.client.get('/api/amenities/')
+        with mock.patch('core.catalog_cache.set_cached_data') as store:
+            self.client.get('/api/amenities/', {'utm_source': 'mail', 'page': '01', 'ordering': 'unknown'})
+        store.assert_not_called()
+
+    def test_token_reads_and_admin_writes(self):
+        staff = User.objects.create_user(
+            username='staff', email='staff@example.com', password='pass', is_staff=True
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(staff)}')
+        self.assertEqual(self.client.get('/api/amenities/').status_code, 200)
+        self.assertEqual(self.client.post('/api/amenities/', {'name': 'Pool'}).status_code, 201)
+
+
+class PropertyConditionalRequestTests(APITestCase):
+    """Property reads revalidate with ETags; writes honour If-Match."""
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.property = create_property(self.host)
+        self.url = f'/api/properties/{self.property.pk}/'
+
+    def test_unchanged_property_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+        listing = self.client.get('/api/properties/')
+        revalidated = self.client.get('/api/properties/', HTTP_IF_NONE_MATCH=listing['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_related_changes_update_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        listing_etag = self.client.get('/api/properties/')['ETag']
+        Photo.objects.create(property=self.property, image='property_photos/new.jpg')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['photos']), 1)
+        self.assertEqual(self.client.get('/api/properties/', HTTP_IF_NONE_MATCH=listing_etag).status_code, 200)
+
+    def test_if_match_rejects_stale_update(self):
+        self.client.force_authenticate(self.host)
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.patch(self.url, {'title': 'Renovated flat'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        stale = self.client.patch(self.url, {'title': 'Older edit'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(stale.status_code, 412)
+        self.property.refresh_from_db()
+        self.assertEqual(self.property.title, 'Renovated flat')
+
+
+class PhotoVariantTests(APITestCase):
+    """Uploaded photos get resized variants after commit."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, PHOTO_VARIANTS_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.property = create_property(self.host)
+
+    def upload(self, size=(2400, 1600)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'teal').save(buffer, 'JPEG')
+        self.client.force_authenticate(self.host)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/photos/', {
+                'property': self.property.pk,
+                'image': SimpleUploadedFile('flat.jpg', buffer.getvalue(), content_type='image/jpeg'),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return Photo.objects.get(pk=response.data['photo_id'])
+
+    def test_variants_are_generated_and_exposed(self):
+        photo = self.upload()
+        self.assertEqual(photo.variants['thumb']['width'], 320)
+        self.assertEqual(photo.variants['large']['height'], 1280)
+
+        data = self.client.get(f'/api/photos/{photo.pk}/').data
+        self.assertTrue(data['variants']['medium']['webp'].endswith('.webp'))
+        listing = self.client.get('/api/properties/', {'compact': 'true'}).data['results'][0]
+        self.assertEqual(listing['cover_photo'], data['variants']['thumb']['webp'])
+
+    def test_small_originals_are_not_upscaled(self):
+        photo = self.upload(size=(200, 100))
+        self.assertEqual(photo.variants['large']['width'], 200)
+
+    def test_forced_regeneration_releases_replaced_variants(self):
+        # Small enough for every size to render identically, so blobs are shared
+        photo = self.upload(size=(200, 100))
+        references = dict(MediaBlob.objects.values_list('name', 'refcount'))
+        self.assertEqual(references[photo.variants['large']['webp']], 3)
+
+        call_command('generate_photo_variants', '--force', stdout=StringIO())
+        self.assertEqual(dict(MediaBlob.objects.values_list('name', 'refcount')), references)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.delete()
+        self.assertFalse(MediaBlob.objects.exists())
+
+
+@override_settings(PHOTO_VARIANTS_ASYNC=False)
+class ContentAddressedStorageTests(APITestCase):
+    """Identical uploads share one stored file, released with its last reference."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.properties = [create_property(host), create_property(host)]
+
+    def jpeg(self, color):
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8), color).save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def add_photo(self, prop, color='teal'):
+        return Photo.objects.create(property=prop, image=SimpleUploadedFile('photo.jpg', self.jpeg(color)))
+
+    def test_identical_uploads_are_stored_once(self):
+        first, second = (self.add_photo(prop) for prop in self.properties)
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.startswith('cas/'))
+        self.assertEqual(MediaBlob.objects.get(name=first.image.name).refcount, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(second.image.storage.exists(second.image.name))
+        self.assertEqual(MediaBlob.objects.get(name=second.image.name).refcount, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(second.image.storage.exists(second.image.name))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_replaced_file_is_released(self):
+        photo = self.add_photo(self.properties[0])
+        original = photo.image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.image = SimpleUploadedFile('photo.jpg', self.jpeg('navy'))
+            photo.save()
+        self.assertNotEqual(photo.image.name, original)
+        self.assertFalse(photo.image.storage.exists(original))
+
+    def test_media_urls_are_immutable(self):
+        photo = self.add_photo(self.properties[0])
+        path = photo.image.name[len(CAS_PREFIX) + 1:]
+        response = serve_immutable(
+            RequestFactory().get(photo.image.url), path, document_root=os.path.join(settings.MEDIA_ROOT, CAS_PREFIX)
+        )
+        self.assertIn('immutable', response['Cache-Control'])
+
+
+class PropertyCalendarTests(APITestCase):
+    """The calendar merges blocks and bookings and follows their changes."""
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.property = create_property(self.host)
+        self.today = timezone.localdate()
+        self.url = f'/api/properties/{self.property.pk}/calendar/'
+
+    def day(self, offset):
+        return self.today + timedelta(days=offset)
+
+    def states(self, **params):
+        response = self.client.get(self.url, {'start': self.today, 'months': 1, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(run['start'], run['end'], run['state']) for run in response.data['runs']]
+
+    def test_calendar_merges_and_tracks_changes(self):
+        Availability.objects.create(
+            property=self.property, start_date=self.day(2), end_date=self.day(3), is_available=False
+        )
+        booking = Booking.objects.create(
+            guest=self.host, property=self.property, check_in_date=self.day(5),
+            check_out_date=self.day(7), num_guests=1, total_price=200, status='confirmed'
+        )
+        end = self.states()[-1][1]
+        self.assertEqual(self.states(), [
+            (self.day(0), self.day(2), 'available'),
+            (self.day(2), self.day(4), 'blocked'),
+            (self.day(4), self.day(5), 'available'),
+            (self.day(5), self.day(7), 'booked'),
+            (self.day(7), end, 'available'),
+        ])
+
+        # Patched in place once the calendar exists
+        booking.check_in_date, booking.check_out_date = self.day(10), self.day(11)
+        booking.save()
+        # The calendar row, then lapsed holds in the window
+        with self.assertNumQueries(2):
+            states = self.states()
+        self.assertIn((self.day(4), self.day(10), 'available'), states)
+        self.assertIn((self.day(10), self.day(11), 'booked'), states)
+
+        booking.delete()
+        self.assertNotIn('booked', [state for _, _, state in self.states()])
+
+    def test_bitmap_format(self):
+        Booking.objects.create(
+            guest=self.host, property=self.property, check_in_date=self.day(1),
+            check_out_date=self.day(3), num_guests=1, total_price=200, status='confirmed'
+        )
+        response = self.client.get(self.url, {'start': self.today, 'encoding': 'bitmap'})
+        self.assertEqual(base64.b64decode(response.data['booked'])[0], 0b110)
+
+    def test_window_bits_size(self):
+        origin = date(2024, 1, 1)
+        bitmap = bytes([0xff, 0xff, 0xff])
+        for days, size in ((16, 2), (17, 3), (1, 1)):
+            window = window_bits(bitmap, origin, origin, origin + timedelta(days=days))
+            self.assertEqual(len(window), size)
+        # Re-based windows keep only the days after ``start``
+        self.assertEqual(window_bits(bitmap, origin, origin + timedelta(days=20), origin + timedelta(days=28)), b'\x0f')
+
+    def test_unknown_property(self):
+        self.assertEqual(self.client.get('/api/properties/999/calendar/').status_code, 404)
+
+
+class ReservationTests(APITestCase):
+    """The night slots reject overlapping stays even when validation was raced."""
+
+    def setUp(self):
+        self.guest = User.objects.create_user(username='guest', email='guest@example.com', password='pass')
+        self.property = create_property(self.guest)
+        self.check_in = timezone.localdate() + timedelta(days=5)
+
+    def book(self, nights=3, offset=0):
+        return reserve(
+            guest=self.guest, property=self.property, num_guests=1, total_price=300, status='pending',
+            check_in_date=self.check_in + timedelta(days=offset),
+            check_out_date=self.check_in + timedelta(days=offset + nights),
+        )
+
+    def test_overlapping_stay_is_a_conflict(self):
+        self.book()
+        with self.assertRaises(DatesUnavailable):
+            self.book(offset=2)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.book(offset=3)
+
+    def test_conflict_is_reported_as_409(self):
+        self.book()
+        self.client.force_authenticate(self.guest)
+        data = {
+            'property_id': self.property.pk, 'num_guests': 1,
+            'check_in_date': self.check_in, 'check_out_date': self.check_in + timedelta(days=1),
+        }
+        # Validation passing is what a concurrent request would have seen
+        with mock.patch('core.serializers.is_bookable', return_value=True):
+            response = self.client.post('/api/bookings/create_booking/', data)
+        self.assertEqual(response.status_code, 409)
+
+    def test_expired_hold_is_released(self):
+        stale = self.book()
+        Booking.objects.filter(pk=stale.pk).update(held_until=timezone.now() - timedelta(minutes=1))
+        dates = {'check_in_date': self.check_in + timedelta(days=1), 'check_out_date': self.check_in + timedelta(days=2)}
+
+        # Before anything releases it, search and the calendar already ignore the hold
+        results = self.client.get('/api/properties/search/', dates).data['results']
+        self.assertEqual([item['property_id'] for item in results], [self.property.pk])
+
+        self.client.force_authenticate(self.guest)
+        response = self.client.post('/api/bookings/create_booking/', {
+            'property_id': self.property.pk, 'num_guests': 1, **dates,
+        })
+        self.assertEqual(response.status_code, 201)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'expired')
+        self.assertFalse(stale.nights.exists())
+
+    def test_calendar_hides_lapsed_holds_without_writing(self):
+        stale = self.book()
+        url, params = f'/api/properties/{self.property.pk}/calendar/', {'start': self.check_in, 'months': 1}
+        self.assertEqual(self.client.get(url, params).data['runs'][0]['state'], 'booked')
+        Booking.objects.filter(pk=stale.pk).update(held_until=timezone.now() - timedelta(minutes=1))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, params).data['runs'][0]['state'], 'available')
+            bitmap = self.client.get(url, {**params, 'encoding': 'bitmap'}).data['booked']
+        self.assertFalse(any(base64.b64decode(bitmap)))
+        self.assertTrue(all(query['sql'].startswith('SELECT') for query in queries.captured_queries))
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'pending')
+
+    def pay(self, booking):
+        self.client.force_authenticate(self.guest)
+        session = mock.Mock(id='cs_test', url='https://checkout.stripe.test/cs_test')
+        with mock.patch('core.views.Customer.get_or_create', return_value=(None, False)), \
+                mock.patch('core.views.stripe.checkout.Session.create', return_value=session) as create:
+            response = self.client.get(f'/api/bookings/{booking.pk}/payment/')
+        return response, create
+
+    def test_checkout_renews_a_lapsed_hold(self):
+        booking = self.book()
+        Booking.objects.filter(pk=booking.pk).update(held_until=timezone.now() - timedelta(minutes=1))
+        release_expired_holds()
+
+        response, create = self.pay(booking)
+        self.assertEqual(response.status_code, 200)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'pending')
+        self.assertEqual(booking.nights.count(), 3)
+        self.assertGreater(booking.held_until, timezone.now() + timedelta(minutes=30))
+        # The session cannot be paid once the nights are no longer held
+        self.assertEqual(create.call_args.kwargs['expires_at'], int(booking.held_until.timestamp()))
+
+    def test_checkout_of_taken_nights_is_a_conflict(self):
+        booking = self.book()
+        Booking.objects.filter(pk=booking.pk).update(held_until=timezone.now() - timedelta(minutes=1))
+        self.book(offset=1)
+
+        response, create = self.pay(booking)
+        self.assertEqual(response.status_code, 409)
+        create.assert_not_called()
+
+    def test_paid_booking_is_not_charged_again(self):
+        booking = self.book()
+        booking.status = 'paid'
+        booking.save()
+        response, create = self.pay(booking)
+        self.assertEqual(response.status_code, 400)
+        create.assert_not_called()
+
+    def test_migrate_lowercases_stored_statuses(self):
+        legacy = self.book()
+        Booking.objects.filter(pk=legacy.pk).update(status='Pending')
+        call_command('migrate', verbosity=0)
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.status, 'pending')
+        self.assertFalse(is_bookable(self.property.pk, self.check_in, self.check_in + timedelta(days=1)))
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Concurrent requests for overlapping stays never double-book a property."""
+
+    workers = 4
+    attempts = 5
+
+    def test_concurrent_overlapping_bookings(self):
+        # No passwords: hashing them would dominate the run
+        host = User.objects.create_user(username='host', email='host@example.com')
+        guests = [
+            User.objects.create_user(username=f'guest{index}', email=f'guest{index}@example.com')
+            for index in range(self.workers)
+        ]
+        properties = [create_property(host) for _ in range(3)]
+        start = timezone.localdate() + timedelta(days=10)
+        outcomes, retries = [], []
+
+        def book(guest):
+            client = APIClient()
+            client.force_authenticate(guest)
+            rng = random.Random(guest.pk)
+            try:
+                for _ in range(self.attempts):
+                    check_in = start + timedelta(days=rng.randrange(120))
+                    data = {
+                        'property_id': rng.choice(properties).pk,
+                        'check_in_date': check_in,
+                        'check_out_date': check_in + timedelta(days=rng.randrange(1, 5)),
+                        'num_guests': 1,
+                    }
+                    while True:
+                        try:
+                            outcomes.append(client.post('/api/bookings/create_booking/', data).status_code)
+                            break
+                        except OperationalError:
+                            # SQLite reports writer contention instead of waiting on it
+                            retries.append(1)
+                            time.sleep(0.001)
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=book, args=(guest,)) for guest in guests]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(outcomes), self.workers * self.attempts)
+        self.assertTrue(set(outcomes) <= {201, 400, 409}, set(outcomes))
+        for prop in properties:
+            nights = [
+                night for booking in Booking.objects.filter(property=prop)
+                for night in range(booking.check_in_date.toordinal(), booking.check_out_date.toordinal())
+            ]
+            self.assertEqual(len(nights), len(set(nights)), 'overlapping bookings')
+        # Every accepted request left a booking (a retried request may have committed before SQLite failed it)
+        self.assertGreater(outcomes.count(201), 0)
+        self.assertGreaterEqual(Booking.objects.count(), outcomes.count(201))
+        logger.info(
+            '%d concurrent booking requests in %.2fs (%.0f req/s): %d booked, %d conflicts, '
+            '%d rejected up front, %d lock retries (%s)',
+            len(outcomes), elapsed, len(outcomes) / elapsed, outcomes.count(201), outcomes.count(409),
+            outcomes.count(400), len(retries), connection.vendor,
+        )
+
+
+class PaginationTests(APITestCase):
+    """List endpoints page by number unless the client asks for keyset cursors."""
+
+    rows = 12
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='staff', email='staff@example.com', password='pass', is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+        self.created = timezone.now()
+
+    def assert_switches(self, url, key):
+        numbered = self.client.get(url)
+        self.assertEqual(numbered.status_code, 200)
+        self.assertEqual(numbered.data['count'], self.rows)
+        self.assertIn('page=2', numbered.data['next'])
+        ids = [row[key] for row in numbered.data['results']]
+        ids += [row[key] for row in self.client.get(numbered.data['next']).data['results']]
+
+        keyset = self.client.get(url, {'pagination': 'cursor', 'page_size': 5})
+        self.assertNotIn('count', keyset.data)
+        self.assertIn('cursor=', keyset.data['next'])
+        cursor_ids = [row[key] for row in keyset.data['results']]
+        while keyset.data['next']:
+            # Followed links carry only ?cursor=, which keeps the keyset pagination
+            keyset = self.client.get(keyset.data['next'])
+            cursor_ids += [row[key] for row in keyset.data['results']]
+        # Rows sharing a timestamp are neither repeated nor skipped
+        self.assertEqual(len(set(cursor_ids)), self.rows)
+        self.assertEqual(cursor_ids, ids)
+
+    def test_keyset_ordering_breaks_ties(self):
+        request = Request(RequestFactory().get('/'))
+        view = mock.Mock(ordering=['-visit_date'], ordering_fields=None, filter_backends=[OrderingFilter])
+        self.assertEqual(KeysetPagination().get_ordering(request, Visit.objects.all(), view), ('-visit_date', '-pk'))
+        view.ordering = ['created_at', 'id']
+        self.assertEqual(KeysetPagination().get_ordering(request, Contact.objects.all(), view), ('created_at', 'id'))
+
+    def test_bookings(self):
+        prop = create_property(self.user)
+        start = timezone.localdate() + timedelta(days=10)
+        for offset in range(self.rows):
+            Booking.objects.create(
+                guest=self.user, property=prop, check_in_date=start + timedelta(days=offset),
+                check_out_date=start + timedelta(days=offset + 1), num_guests=1, total_price=100,
+            )
+        self.assert_switches('/api/bookings/', 'booking_id')
+
+    def test_messages(self):
+        conversation = Conversation.objects.create()
+        ConversationParticipant.objects.create(conversation=conversation, user=self.user)
+        Message.objects.bulk_create([
+            Message(conversation=conversation, sender=self.user, content=f'Message {index}') for index in range(self.rows)
+        ])
+        self.assert_switches('/api/messages/', 'message_id')
+
+    def add_payments(self):
+        card = PaymentMethod.objects.create(name='Card', code='card')
+        rent = PaymentCategory.objects.create(name='Rent')
+        Payment.objects.bulk_create([
+            Payment(
+                transaction_id=f'tx-{index}', amount=Decimal('10.00'), payment_method=card,
+                payment_category=rent, payer_id='42', created_at=self.created,
+            )
+            for index in range(self.rows)
+        ])
+
+    def test_payments(self):
+        self.add_payments()
+        self.assert_switches('/api/financial/payments/', 'id')
+
+    def test_financial_logs(self):
+        self.add_payments()
+        self.assert_switches('/api/financial/financialLogs/', 'id')
+
+    def test_visits(self):
+        visitor = Visitor.objects.create(first_name='Ana', last_name='Silva', email='ana@example.com')
+        Visit.objects.bulk_create([Visit(visitor=visitor, visit_date=self.created) for _ in range(self.rows)])
+        self.assert_switches('/api/visits/', 'id')
+
+    def test_contacts(self):
+        Contact.objects.bulk_create([Contact(name=f'Contact {index}', contact_type='lead') for index in range(self.rows)])
+        Contact.objects.update(created_at=self.created)
+        self.assert_switches('/api/contacts/', 'id')
+
+
+class PricingTests(APITestCase):
+    """Stays are priced from weekend and seasonal rates, discounts and fees."""
+
+    def setUp(self):
+        self.guest = User.objects.create_user(username='guest', email='guest@example.com', password='pass')
+        self.property = create_property(self.guest, price_per_night=100, weekend_price_per_night=150)
+        self.other = create_property(self.guest, price_per_night=80)
+        # Monday 2030-07-01 to Monday 2030-07-08: five weekday and two weekend nights
+        self.check_in, self.check_out = date(2030, 7, 1), date(2030, 7, 8)
+        SeasonalRate.objects.create(
+            property=self.property, start_date=date(2030, 7, 3), end_date=date(2030, 7, 3), price_per_night=120
+        )
+        LengthOfStayDiscount.objects.create(property=self.property, min_nights=3, percent=5)
+        LengthOfStayDiscount.objects.create(property=self.property, min_nights=7, percent=10)
+        PropertyFee.objects.create(property=self.property, name='Cleaning', amount=40)
+        PropertyFee.objects.create(property=self.property, name='Linen', fee_type='per_guest', amount=5)
+
+    def test_batch_quotes(self):
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/properties/quotes/', {
+                'property_ids': f'{self.property.pk},{self.other.pk}', 'guests': 2,
+                'check_in_date': self.check_in, 'check_out_date': self.check_out,
+            })
+        first, second = response.data['results']
+        # 4 x 100 + 120 (season) + 2 x 150 (weekend) = 820, 10% off, 40 + 2 x 5 fees
+        self.assertEqual(first['subtotal'], Decimal('820.00'))
+        self.assertEqual(first['discount'], Decimal('82.00'))
+        self.assertEqual(first['total'], Decimal('788.00'))
+        self.assertEqual(second['total'], Decimal('560.00'))
+
+    def test_booking_uses_quote(self):
+        self.client.force_authenticate(self.guest)
+        response = self.client.post('/api/bookings/create_booking/', {
+            'property_id': self.property.pk, 'num_guests': 2,
+            'check_in_date': self.check_in, 'check_out_date': self.check_out,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Booking.objects.get().total_price, Decimal('788.00'))
+
+    def test_dated_search_shows_totals(self):
+        response = self.client.get('/api/properties/search/', {
+            'check_in_date': self.check_in, 'check_out_date': self.check_out,
+        })
+        totals = {item['property_id']: item['quote']['total'] for item in response.data['results']}
+        self.assertEqual(totals, {self.property.pk: Decimal('783.00'), self.other.pk: Decimal('560.00')})
+
+
+class RatingAggregateTests(APITestCase):
+    """Review changes keep the property's rating aggregates current."""
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.guest = User.objects.create_user(username='guest', email='guest@example.com', password='pass')
+        self.property = create_property(self.host)
+        self.other = create_property(self.host, title='Mountain hut')
+
+    def review(self, prop, rating):
+        today = timezone.localdate()
+        booking = Booking.objects.create(
+            guest=self.guest, property=prop, num_guests=2, total_price=200, status='confirmed',
+            check_in_date=today - timedelta(days=Booking.objects.count() * 3 + 5),
+            check_out_date=today - timedelta(days=Booking.objects.count() * 3 + 3),
+        )
+        self.client.force_authenticate(self.guest)
+        response = self.client.post('/api/reviews/create_review/', {
+            'booking_id': booking.pk, 'rating': rating, 'comment': 'Stayed here',
+        })
+        self.assertEqual(response.status_code, 201)
+        return Review.objects.get(pk=response.data['review_id'])
+
+    def test_created_and_deleted_reviews(self):
+        self.review(self.property, 5)
+        review = self.review(self.property, 4)
+        self.review(self.property, 4)
+        response = self.client.get(f'/api/properties/{self.property.pk}/')
+        self.assertEqual(response.data['rating_count'], 3)
+        self.assertEqual(response.data['rating_avg'], '4.33')
+        self.assertEqual(response.data['rating_histogram'], {'1': 0, '2': 0, '3': 0, '4': 2, '5': 1})
+
+        self.client.delete(f'/api/reviews/{review.pk}/')
+        self.property.refresh_from_db()
+        self.assertEqual((self.property.rating_count, self.property.rating_avg), (2, Decimal('4.50')))
+
+        Review.objects.all().delete()
+        self.property.refresh_from_db()
+        self.assertEqual((self.property.rating_count, self.property.rating_avg), (0, None))
+
+    def test_rerated_review(self):
+        review = self.review(self.property, 2)
+        review.rating = 5
+        review.save()
+        self.property.refresh_from_db()
+        self.assertEqual((self.property.rating_avg, self.property.rating_2_count, self.property.rating_5_count),
+                         (Decimal('5.00'), 0, 1))
+
+    def test_repair(self):
+        self.review(self.property, 3)
+        Property.objects.filter(pk=self.property.pk).update(rating_count=7, rating_5_count=7)
+        self.assertEqual(repair_ratings(), [self.property.pk])
+        self.property.refresh_from_db()
+        self.assertEqual((self.property.rating_count, self.property.rating_5_count, self.property.rating_3_count),
+                         (1, 0, 1))
+        self.assertEqual(repair_ratings(), [])
+
+    def test_search_filters_and_sorts_by_rating(self):
+        self.review(self.property, 3)
+        self.review(self.other, 5)
+        self.review(self.other, 4)
+        third = create_property(self.host, title='Unrated')
+
+        response = self.client.get('/api/properties/search/', {'sort': 'rating'})
+        self.assertEqual([item['property_id'] for item in response.data['results']],
+                         [self.other.pk, self.property.pk, third.pk])
+        response = self.client.get('/api/properties/search/', {'min_rating': '4'})
+        self.assertEqual([item['property_id'] for item in response.data['results']], [self.other.pk])
+        response = self.client.get('/api/properties/search/', {'min_reviews': 2, 'compact': 'true'})
+        self.assertEqual(response.data['results'][0]['rating_avg'], '4.50')
+
+
+class RealtimeMessagingTests(TransactionTestCase):
+    """Conversation sockets receive new messages and read receipts."""
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.guest = User.objects.create_user(username='guest', email='guest@example.com', password='pass')
+        self.stranger = User.objects.create_user(username='stranger', email='stranger@example.com', password='pass')
+        self.conversation = Conversation.objects.create()
+        ConversationParticipant.objects.create(conversation=self.conversation, user=self.host)
+        ConversationParticipant.objects.create(conversation=self.conversation, user=self.guest)
+
+    def connect(self, user, path=None, query=''):
+        from inorental.asgi import application
+        path = path or f'/ws/conversations/{self.conversation.pk}/'
+        return WebsocketCommunicator(application, f'{path}?token={AccessToken.for_user(user)}{query}')
+
+    async def test_participants_receive_messages_and_receipts(self):
+        host_socket, guest_inbox = self.connect(self.host), self.connect(self.guest, path='/ws/conversations/')
+        self.assertTrue((await host_socket.connect())[0])
+        self.assertTrue((await guest_inbox.connect())[0])
+
+        message = await sync_to_async(Message.objects.create)(
+            conversation=self.conversation, sender=self.guest, content='When is check-in?'
+        )
+        for socket in (host_socket, guest_inbox):
+            event = await socket.receive_json_from()
+            self.assertEqual((event['type'], event['message']['message_id']), ('message.new', message.pk))
+            self.assertEqual(event['message']['sender']['id'], self.guest.pk)
+
+        await host_socket.send_json_to({'type': 'read', 'message_id': message.pk})
+        for socket in (host_socket, guest_inbox):
+            event = await socket.receive_json_from()
+            self.assertEqual((event['type'], event['reader'], event['up_to']), ('message.read', self.host.pk, message.pk))
+        await host_socket.disconnect()
+        await guest_inbox.disconnect()
+
+        await sync_to_async(message.refresh_from_db)()
+        self.assertIsNotNone(message.read_at)
+
+    async def test_reconnecting_clients_catch_up(self):
+        first = await sync_to_async(Message.objects.create)(conversation=self.conversation, sender=self.guest, content='One')
+        second = await sync_to_async(Message.objects.create)(conversation=self.conversation, sender=self.guest, content='Two')
+        socket = self.connect(self.host, query=f'&after={first.pk}')
+        await socket.connect()
+        event = await socket.receive_json_from()
+        self.assertEqual(event['message']['message_id'], second.pk)
+        self.assertTrue(await socket.receive_nothing())
+        await socket.disconnect()
+
+    async def test_outsiders_are_refused(self):
+        socket = self.connect(self.stranger)
+        self.assertEqual(await socket.connect(), (False, 4403))
+        from inorental.asgi import application
+        socket = WebsocketCommunicator(application, f'/ws/conversations/{self.conversation.pk}/?token=invalid')
+        self.assertEqual(await socket.connect(), (False, 4401))
+
+
+class InboxTests(APITestCase):
+    """The inbox lists conversations without their histories."""
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.guest = User.objects.create_user(username='guest', email='guest@example.com', password='pass')
+        self.property = create_property(self.host)
+        self.conversations = []
+        for number in range(3):
+            conversation = Conversation.objects.create(property=self.property)
+            ConversationParticipant.objects.create(conversation=conversation, user=self.host)
+            ConversationParticipant.objects.create(conversation=conversation, user=self.guest)
+            self.conversations.append(conversation)
+        self.client.force_authenticate(self.host)
+
+    def send(self, conversation, sender, content):
+        return Message.objects.create(conversation=conversation, sender=sender, content=content)
+
+    def test_inbox_rows(self):
+        first, second, third = self.conversations
+        self.send(second, self.guest, 'Hello')
+        self.send(first, self.guest, 'Is the flat free in May? ' * 20)
+        self.send(first, self.host, 'Yes')
+        self.send(first, self.guest, 'Great')
+
+        response = self.client.get('/api/conversations/inbox/')
+        results = response.data['results']
+        # Latest activity first
+        self.assertEqual([row['conversation_id'] for row in results], [first.pk, second.pk, third.pk])
+        self.assertEqual(results[0]['last_message']['preview'], 'Great')
+        self.assertEqual(results[0]['unread_count'], 2)
+        self.assertEqual(results[1]['unread_count'], 1)
+        self.assertEqual((results[2]['last_message'], results[2]['unread_count']), (None, 0))
+        self.assertEqual({user['id'] for user in results[0]['participants']}, {self.host.pk, self.guest.pk})
+        self.assertEqual(results[0]['property'], {'property_id': self.property.pk, 'title': 'Seaside flat'})
+        self.assertNotIn('messages', results[0])
+
+    def test_query_count_does_not_grow_with_page(self):
+        for conversation in self.conversations:
+            self.send(conversation, self.guest, 'x' * 500)
+        # Conversations, participants, last messages
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/conversations/inbox/')
+        self.assertEqual(len(response.data['results'][0]['last_message']['preview']), 140)
+
+    def test_cursor_pages(self):
+        for conversation in self.conversations:
+            self.send(conversation, self.guest, 'Hi')
+        response = self.client.get('/api/conversations/inbox/', {'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['conversation_id'] for row in response.data['results']], [self.conversations[0].pk])
+
+
+class MessageHistoryTests(APITestCase):
+    """Conversation histories are paged by (sent_at, message_id) cursors."""
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.guest = User.objects.create_user(username='guest', email='guest@example.com', password='pass')
+        self.conversation = Conversation.objects.create()
+        ConversationParticipant.objects.create(conversation=self.conversation, user=self.host)
+        ConversationParticipant.objects.create(conversation=self.conversation, user=self.guest)
+        self.messages = [
+            Message.objects.create(conversation=self.conversation, sender=self.guest, content=f'Message {number}')
+            for number in range(25)
+        ]
+        # Same timestamp as its predecessor: ties are broken by message id
+        Message.objects.filter(pk=self.messages[10].pk).update(sent_at=self.messages[9].sent_at)
+        self.url = f'/api/conversations/{self.conversation.pk}/messages/'
+        self.client.force_authenticate(self.host)
+
+    def ids(self, response):
+        return [message['message_id'] for message in response.data['results']]
+
+    def test_walk_back_and_forward(self):
+        pks = [message.pk for message in self.messages]
+        response = self.client.get(self.url, {'limit': 10})
+        self.assertEqual(self.ids(response), pks[15:])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(self.ids(response), pks[5:15])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(self.ids(response), pks[:5])
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self.ids(response), pks[5:15])
+
+    def test_constant_queries(self):
+        # Participant check, cursor message, page
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, {'before': self.messages[20].pk, 'limit': 5})
+        self.assertEqual(self.ids(response), [message.pk for message in self.messages[15:20]])
+
+    def test_outsiders_get_404(self):
+        stranger = User.objects.create_user(username='stranger', email='stranger@example.com', password='pass')
+        self.client.force_authenticate(stranger)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get('/api/messages/').data['results'], [])
+
+    def test_conversations_without_messages(self):
+        response = self.client.get(f'/api/conversations/{self.conversation.pk}/', {'messages': 'false'})
+        self.assertNotIn('messages', response.data)
+        response = self.client.get(f'/api/conversations/{self.conversation.pk}/')
+        self.assertEqual(len(response.data['messages']), 25)
+
+
+class MarkReadTests(APITestCase):
+    """A whole thread is marked read with one statement and one receipt."""
+
+    def setUp(self):
+        self.host = User.objects.create_user(username='host', email='host@example.com', password='pass')
+        self.guest = User.objects.create_user(username='guest', email='guest@example.com', password='pass')
+        self.conversation = Conversation.objects.create()
+        ConversationParticipant.objects.create(conversation=self.conversation, user=self.host)
+        ConversationParticipant.objects.create(conversation=self.conversation, user=self.guest)
+        self.messages = [
+            Message.objects.create(conversation=self.conversation, sender=sender, content='Hi')
+            for sender in (self.guest, self.guest, self.host, self.guest, self.guest)
+        ]
+        self.url = f'/api/conversations/{self.conversation.pk}/read/'
+        self.client.force_authenticate(self.host)
+
+    def test_mark_read_up_to(self):
+        with mock.patch('core.realtime.publish_read') as publish_read:
+            # Participant check, UPDATE
+            with self.assertNumQueries(2):
+                response = self.client.post(self.url, {'up_to': self.messages[3].pk})
+        self.assertEqual(response.data, {'updated': 3})
+        publish_read.assert_called_once()
+        self.assertEqual(publish_read.call_args.kwargs['up_to'], self.messages[3].pk)
+
+        unread = Message.objects.filter(read_at__isnull=True).values_list('pk', flat=True)
+        # The host's own message is left for the guest to read
+        self.assertEqual(sorted(unread), [self.messages[2].pk, self.messages[4].pk])
+        response = self.client.get('/api/conversations/inbox/')
+        self.assertEqual(response.data['results'][0]['unread_count'], 1)
+
+    def test_mark_everything_read(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response.data, {'updated': 4})
+        with mock.patch('core.realtime.publish_read') as publish_read:
+            response = self.client.post(self.url)
+        self.assertEqual(response.data, {'updated': 0})
+        publish_read.assert_not_called()
+
+    def test_outsiders_get_404(self):
+        stranger = User.objects.create_user(username='stranger', email='stranger@example.com', password='pass')
+        self.client.force_authenticate(stranger)
+        self.assertEqual(self.client.post(self.url).status_code, 404)
 
-# Create your tests here.
@@ -10,19 +10,37 @@ import stripe
 from atlassian import Jira
 from djstripe.models import Customer
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.db.models import F, Q, Count, Max, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce, Substr
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+import hashlib
+from base64 import b64encode
 
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 # Import permissions first to avoid circular imports
 from .permissions import IsAdminOrReadOnly, IsHostOrReadOnly
+from .pagination import KeysetPagination, KeysetOrPageNumberPagination
+from .catalog_cache import CachedCatalogMixin
+from .availability import filter_bookable
+from .calendars import build_calendar, runs, window_bits, without_lapsed_holds
+from .reservations import DatesUnavailable, renew_hold, reserve
+from .realtime import mark_read
+from .pricing import quote_many, to_minor_units
+from . import geo
+from .search import search as keyword_search, filter_facets, facet_counts
 
 # Import models
 from .models import (
     Property, Amenity, PropertyAmenity, Facility, PropertyFacility,
     HouseRule, PropertyHouseRule, Booking, Review, Conversation,
-    ConversationParticipant, Message, Photo, Availability
+    ConversationParticipant, Message, Photo, Availability, PropertyCalendar
 )
 
 # Import serializers
@@ -31,7 +49,10 @@ from .serializers import (
     FacilitySerializer, PropertyFacilitySerializer, HouseRuleSerializer,
     PropertyHouseRuleSerializer, BookingSerializer, ReviewSerializer,
     ConversationSerializer, ConversationParticipantSerializer, MessageSerializer,
-    PhotoSerializer, AvailabilitySerializer, CreateBookingSerializer
+    PhotoSerializer, AvailabilitySerializer, CreateBookingSerializer, CreateReviewSerializer,
+    PropertySearchSerializer, NearbySearchSerializer, CalendarQuerySerializer, QuoteRequestSerializer, NearbyPropertySerializer,
+    InboxConversationSerializer, MessageHistorySerializer, MarkReadSerializer,
+    property_field_selection
 )
 
 # Get the user model
@@ -103,22 +124,235 @@ class PropertyViewSet(viewsets.ModelViewSet):
         if getattr(self, 'swagger_fake_view', False):
             return Property.objects.none()
 
-        queryset = Property.objects.all()
+        queryset = PropertySerializer.setup_eager_loading(Property.objects.all(), **self.get_field_selection())
         if self.request.user.is_authenticated:
             # If user is requesting their own properties
             if self.request.query_params.get('my_properties') == 'true':
                 queryset = queryset.filter(host=self.request.user)
         return queryset
 
+    def get_serializer_class(self):
+        if self.action == 'nearby':
+            return NearbyPropertySerializer
+        return PropertySerializer
+
+    def get_field_selection(self):
+        # Sparse fieldsets (?fields=, ?expand=, ?compact=true) apply to reads only
+        if self.request.method != 'GET':
+            return {}
+        return property_field_selection(self.request.query_params)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(self.get_field_selection())
+        return super().get_serializer(*args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save(host=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # Page contents are unchanged while the row count and newest edit are
+        state = queryset.prefetch_related(None).order_by().aggregate(
+            last_modified=Max('updated_at'), count=Count('pk')
+        )
+        validators = self.get_validators(state['last_modified'], state['count'], request.user.pk)
+        # Last-Modified alone can't see deletions, so lists only revalidate on the ETag
+        return self.conditional_response(request, validators, lambda: super(PropertyViewSet, self).list(
+            request, *args, **kwargs
+        ), use_last_modified=False)
+
+    def retrieve(self, request, *args, **kwargs):
+        validators = self.get_object_validators()
+        return self.conditional_response(request, validators, lambda: super(PropertyViewSet, self).retrieve(
+            request, *args, **kwargs
+        ))
+
+    def update(self, request, *args, **kwargs):
+        # If-Match / If-Unmodified-Since: refuse to overwrite a newer version with 412
+        with transaction.atomic():
+            validators = self.get_object_validators(lock=True)
+            if validators is not None:
+                etag, last_modified = validators
+                failed = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if failed is not None:
+                    return Response(status=failed.status_code)
+            response = super().update(request, *args, **kwargs)
+        validators = self.get_object_validators()
+        if validators is not None:
+            self.set_validators(response, *validators)
+        return response
+
+    def get_object_validators(self, lock=False):
+        """ETag and Last-Modified of the requested property from one indexed lookup."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.get_queryset().prefetch_related(None).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        if lock:
+            queryset = queryset.select_for_update(of=('self',))
+        updated_at = queryset.values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None
+        return self.get_validators(updated_at, self.kwargs[lookup_url_kwarg])
+
+    def get_validators(self, last_modified, *variant):
+        """
+        Related photos, availabilities, bookings and hosts move
+        ``Property.updated_at`` forward (see core.signals). The current booking
+        also changes with the calendar day, so the ETag includes today's date.
+        """
+        if last_modified is None:
+            return None
+        version = ':'.join(str(part) for part in (last_modified.isoformat(), *variant, timezone.localdate()))
+        etag = '"%s"' % hashlib.md5(version.encode()).hexdigest()
+        return etag, int(last_modified.timestamp())
+
+    def conditional_response(self, request, validators, render, use_last_modified=True):
+        if validators is None:
+            return render()
+        etag, last_modified = validators
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified if use_last_modified else None
+        )
+        response = Response(status=not_modified.status_code) if not_modified is not None else render()
+        if response.status_code in (200, 304):
+            self.set_validators(response, etag, last_modified)
+        return response
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Clients may keep the body but must revalidate before using it
+        patch_cache_control(response, no_cache=True)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        # Keyword, location and date search; dated searches only return bookable properties
+        params = PropertySearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+
+        queryset = self.get_queryset()
+        if filters.get('city'):
+            queryset = queryset.filter(address_city__iexact=filters['city'])
+        if filters.get('guests'):
+            queryset = queryset.filter(max_guests__gte=filters['guests'])
+        if filters.get('check_in_date'):
+            queryset = filter_bookable(queryset, filters['check_in_date'], filters['check_out_date'])
+        queryset = filter_facets(
+            queryset,
+            amenities=filters.get('amenities'),
+            facilities=filters.get('facilities'),
+            house_rules=filters.get('house_rules'),
+        )
+        if filters.get('min_rating') is not None:
+            queryset = queryset.filter(rating_avg__gte=filters['min_rating'])
+        if filters.get('min_reviews'):
+            queryset = queryset.filter(rating_count__gte=filters['min_reviews'])
+        if filters.get('q'):
+            queryset = keyword_search(queryset, filters['q'])
+        if filters['sort'] == 'rating':
+            queryset = queryset.order_by(F('rating_avg').desc(nulls_last=True), '-rating_count', 'pk')
+        elif filters['sort'] == 'reviews':
+            queryset = queryset.order_by('-rating_count', F('rating_avg').desc(nulls_last=True), 'pk')
+        elif filters.get('q'):
+            queryset = queryset.order_by('-search_score', 'pk')
+        else:
+            queryset = queryset.order_by('pk')
+
+        # Feature counts over the whole result set, not just this page
+        facets = facet_counts(queryset)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            response = self.get_paginated_response(self.serialize_with_quotes(page, filters))
+            response.data['facets'] = facets
+            return response
+        return Response({'results': self.serialize_with_quotes(queryset, filters), 'facets': facets})
+
+    def serialize_with_quotes(self, properties, filters):
+        # Dated searches show the stay total of every result, priced in one batch
+        properties = list(properties)
+        data = self.get_serializer(properties, many=True).data
+        if filters.get('check_in_date'):
+            quotes = quote_many(
+                properties, filters['check_in_date'], filters['check_out_date'], filters.get('guests') or 1
+            )
+            for prop, item in zip(properties, data):
+                item['quote'] = quotes[prop.pk]
+        return data
+
+    @action(detail=False, methods=['get'])
+    def quotes(self, request):
+        # Price one stay at up to 100 properties: ?property_ids=1,2&check_in_date=&check_out_date=&guests=
+        params = QuoteRequestSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+
+        properties = Property.objects.filter(pk__in=data['property_ids']).only(
+            'pk', 'price_per_night', 'weekend_price_per_night'
+        )
+        quotes = quote_many(properties, data['check_in_date'], data['check_out_date'], data['guests'])
+        return Response({'results': [quotes[pk] for pk in data['property_ids'] if pk in quotes]})
+
+    @action(detail=True, methods=['get'])
+    def calendar(self, request, pk=None):
+        # Day-level availability for calendar widgets, read from the stored bitmap
+        params = CalendarQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        start, end = params.validated_data['start'], params.validated_data['end']
+
+        if not str(pk).isdigit():
+            raise Http404
+        calendar = PropertyCalendar.objects.filter(property_id=pk).first()
+        if calendar is None:
+            get_object_or_404(Property.objects.only('pk'), pk=pk)
+            calendar = build_calendar(pk)
+        # Lapsed holds are released by the release_expired_holds command
+        calendar = without_lapsed_holds(calendar, start, end)
+
+        data = {'property_id': int(pk), 'start': start, 'end': end}
+        if params.validated_data['encoding'] == 'bitmap':
+            # Bit n (LSB first) of each base64 bitmap is day start + n
+            data['booked'] = b64encode(window_bits(calendar.booked_days, calendar.origin, start, end)).decode('ascii')
+            data['blocked'] = b64encode(window_bits(calendar.blocked_days, calendar.origin, start, end)).decode('ascii')
+        else:
+            data['runs'] = runs(calendar, start, end)
+        return Response(data)
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        # Radius (lat, lng, radius_km) or map viewport (bbox) search, nearest first
+        params = NearbySearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+
+        if 'bbox' in filters:
+            bounds = filters['bbox']
+        else:
+            bounds = geo.radius_bounds(filters['lat'], filters['lng'], filters['radius_km'])
+
+        queryset = self.get_queryset().filter(geo.within_bounds_q(*bounds)).annotate(
+            distance_km=geo.distance_km_expression(filters['lat'], filters['lng'])
+        )
+        if 'bbox' not in filters:
+            queryset = queryset.filter(distance_km__lte=filters['radius_km'])
+        queryset = queryset.order_by('distance_km', 'pk')
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
 class HostPropertyViewSet(PropertyViewSet):
     def get_queryset(self):
-        self.queryset = self.queryset.filter(host=self.request.user).all()
-        return super().get_queryset()
+        if getattr(self, 'swagger_fake_view', False) or not self.request.user.is_authenticated:
+            return Property.objects.none()
+        return super().get_queryset().filter(host=self.request.user)
 
-class AmenityViewSet(viewsets.ModelViewSet):
+class AmenityViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
+    catalog_name = 'amenities'
     queryset = Amenity.objects.all()
     serializer_class = AmenitySerializer
     permission_classes = (IsAdminOrReadOnly,) # Only admin can manage amenities
@@ -128,7 +362,8 @@ class PropertyAmenityViewSet(viewsets.ModelViewSet):
     serializer_class = PropertyAmenitySerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
 
-class FacilityViewSet(viewsets.ModelViewSet):
+class FacilityViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
+    catalog_name = 'facilities'
     queryset = Facility.objects.all()
     serializer_class = FacilitySerializer
     permission_classes = (IsAdminOrReadOnly,) # Only admin can manage facilities
@@ -138,7 +373,8 @@ class PropertyFacilityViewSet(viewsets.ModelViewSet):
     serializer_class = PropertyFacilitySerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
 
-class HouseRuleViewSet(viewsets.ModelViewSet):
+class HouseRuleViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
+    catalog_name = 'house_rules'
     queryset = HouseRule.objects.all()
     serializer_class = HouseRuleSerializer
     permission_classes = (IsAdminOrReadOnly,) # Only admin can manage house rules
@@ -153,6 +389,8 @@ class BookingViewSet(viewsets.ModelViewSet):
     queryset = Booking.objects.all()
     serializer_class = BookingSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    pagination_class = KeysetOrPageNumberPagination
+    ordering = ('-booking_id',)
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
@@ -161,24 +399,38 @@ class BookingViewSet(viewsets.ModelViewSet):
         if not self.request.user.is_authenticated:
             return Booking.objects.none()
             
+        queryset = Booking.objects.select_related('guest', 'property__host').prefetch_related(
+            'property__photos', 'property__availabilities'
+        )
         if self.request.user.is_staff: # Admin can see all bookings
-            return Booking.objects.all()
-            
-        return Booking.objects.filter(guest=self.request.user) | \
-               Booking.objects.filter(property__host=self.request.user)
+            return queryset
+
+        return queryset.filter(Q(guest=self.request.user) | Q(property__host=self.request.user))
 
     def get_serializer_class(self):
         if self.action == 'create_booking':
             return CreateBookingSerializer
         return BookingSerializer
 
+    def perform_create(self, serializer):
+        try:
+            serializer.save()
+        except IntegrityError:
+            raise DatesUnavailable()
+
+    def perform_update(self, serializer):
+        try:
+            serializer.save()
+        except IntegrityError:
+            raise DatesUnavailable()
+
     @action(detail=False, methods=['post'])
     def create_booking(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        # Create booking with validated data
-        booking = Booking.objects.create(
+        # Booking and nights are inserted atomically; overlapping stays get a 409
+        booking = reserve(
             guest=request.user,
             property=serializer.validated_data['property'],
             check_in_date=serializer.validated_data['check_in_date'],
@@ -195,7 +447,13 @@ class BookingViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["get"])
     def payment(self, request, pk=None):
         booking = Booking.objects.get(pk=pk)
-        amount = int((booking.check_out_date - booking.check_in_date).days * booking.property.price_per_night * 100)
+        if booking.status not in ('pending', 'expired'):
+            raise ValidationError({'status': f'A {booking.status} booking cannot be paid'})
+        # The nights are held (again) for as long as the checkout session lives,
+        # so a guest can never pay for nights another booking has taken
+        renew_hold(booking)
+        # Charge the total quoted when the booking was made
+        amount = to_minor_units(booking.total_price)
         customer, created = Customer.get_or_create(subscriber=request.user)
         session = stripe.checkout.Session.create(
             line_items=[{
@@ -211,6 +469,7 @@ class BookingViewSet(viewsets.ModelViewSet):
                 'quantity': 1,
             }],
             mode='payment',
+            expires_at=int(booking.held_until.timestamp()),
             success_url=self.reverse_action("payment-confirm", args=[booking.booking_id]),
             cancel_url=self.reverse_action("payment-cancle", args=[booking.booking_id]),
         )
@@ -227,7 +486,11 @@ class BookingViewSet(viewsets.ModelViewSet):
         )
         if checkout_session.payment_status == 'paid':            
             booking.status = 'paid'
-            booking.save()
+            try:
+                booking.save()
+            except IntegrityError:
+                # The hold expired and another guest took the nights meanwhile
+                raise DatesUnavailable()
         return Response({"status": checkout_session.payment_status}, status=status.HTTP_200_OK)
     
     @action(detail=True, methods=["get"], name="booking-payment-cancle", permission_classes=[IsAdminOrReadOnly])
@@ -246,6 +509,10 @@ class ConversationViewSet(viewsets.ModelViewSet):
     queryset = Conversation.objects.all()
     serializer_class = ConversationSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    # Most recently active first
+    ordering = ('-last_message_at', '-conversation_id')
+    # Characters of the last message shown in the inbox
+    PREVIEW_LENGTH = 140
 
     def get_queryset(self):
         # Handle schema generation for Swagger
@@ -258,7 +525,112 @@ class ConversationViewSet(viewsets.ModelViewSet):
         # Handle unauthenticated users during schema generation
         if not self.request.user.is_authenticated:
             return Conversation.objects.none()
-        return Conversation.objects.filter(conversationparticipant__user=self.request.user).distinct()
+        queryset = Conversation.objects.filter(conversationparticipant__user=self.request.user).distinct().select_related(
+            'property__host', 'booking__guest', 'booking__property__host'
+        ).prefetch_related(
+            'property__photos', 'property__availabilities',
+            'booking__property__photos', 'booking__property__availabilities'
+        )
+        if self.include_messages():
+            queryset = queryset.prefetch_related('messages__sender')
+        return queryset
+
+    def include_messages(self):
+        # ?messages=false leaves the (unbounded) histories out of conversation payloads
+        return self.request.query_params.get('messages') != 'false'
+
+    def get_serializer(self, *args, **kwargs):
+        if self.get_serializer_class() is ConversationSerializer:
+            kwargs.setdefault('include_messages', self.include_messages())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_inbox_queryset(self):
+        # One row per conversation of the user, with the last message id and unread count as subqueries
+        user = self.request.user
+        last_message = Message.objects.filter(conversation=OuterRef('pk')).order_by('-sent_at', '-message_id')
+        unread = Message.objects.filter(
+            conversation=OuterRef('pk'), read_at__isnull=True
+        ).exclude(sender=user).order_by().values('conversation').annotate(count=Count('pk')).values('count')
+        return Conversation.objects.filter(conversationparticipant__user=user).annotate(
+            property_title=F('property__title'),
+            last_message_id=Subquery(last_message.values('message_id')[:1]),
+            unread_count=Coalesce(Subquery(unread), 0),
+        ).prefetch_related(
+            Prefetch('conversationparticipant_set', queryset=ConversationParticipant.objects.select_related('user'))
+        )
+
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        # One page of history, oldest first: the latest messages, or those ?before= / ?after= a message id.
+        # Keyset on (sent_at, message_id), so any page of a long thread costs the same.
+        params = MessageHistorySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        if not str(pk).isdigit() or not ConversationParticipant.objects.filter(
+            conversation_id=pk, user=request.user
+        ).exists():
+            raise Http404
+
+        history = Message.objects.filter(conversation_id=pk)
+        cursor_id = query.get('before') or query.get('after')
+        if cursor_id:
+            cursor = get_object_or_404(history.only('sent_at'), pk=cursor_id)
+            if 'before' in query:
+                history = history.filter(
+                    Q(sent_at__lt=cursor.sent_at) | Q(sent_at=cursor.sent_at, message_id__lt=cursor_id)
+                )
+            else:
+                history = history.filter(
+                    Q(sent_at__gt=cursor.sent_at) | Q(sent_at=cursor.sent_at, message_id__gt=cursor_id)
+                )
+
+        history = history.select_related('sender')
+        limit = query['limit']
+        if 'after' in query:
+            messages = list(history.order_by('sent_at', 'message_id')[:limit + 1])
+            has_newer, has_older = len(messages) > limit, True
+            messages = messages[:limit]
+        else:
+            messages = list(history.order_by('-sent_at', '-message_id')[:limit + 1])
+            has_older, has_newer = len(messages) > limit, 'before' in query
+            messages = messages[:limit][::-1]
+
+        data = {
+            'previous': None,
+            'next': None,
+            'results': MessageSerializer(messages, many=True).data,
+        }
+        if messages and has_older:
+            data['previous'] = request.build_absolute_uri(f'{request.path}?before={messages[0].pk}&limit={limit}')
+        if messages and has_newer:
+            data['next'] = request.build_absolute_uri(f'{request.path}?after={messages[-1].pk}&limit={limit}')
+        return Response(data)
+
+    @action(detail=True, methods=['post'])
+    def read(self, request, pk=None):
+        # Mark everything others sent up to ?up_to= (or all of it) as read in one UPDATE, with one receipt
+        params = MarkReadSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        if not str(pk).isdigit() or not ConversationParticipant.objects.filter(
+            conversation_id=pk, user=request.user
+        ).exists():
+            raise Http404
+        updated = mark_read(int(pk), request.user.pk, params.validated_data.get('up_to'))
+        return Response({'updated': updated})
+
+    @action(detail=False, methods=['get'])
+    def inbox(self, request):
+        # Conversation list without histories: participants, last message preview and unread count,
+        # in three queries per page, paginated by ?cursor= on last_message_at
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(self.filter_queryset(self.get_inbox_queryset()), request, view=self)
+        last_messages = Message.objects.filter(
+            message_id__in=[conversation.last_message_id for conversation in page if conversation.last_message_id]
+        ).annotate(preview=Substr('content', 1, self.PREVIEW_LENGTH)).only(
+            'message_id', 'sender_id', 'sent_at', 'read_at'
+        ).in_bulk()
+        serializer = InboxConversationSerializer(page, many=True, context={'last_messages': last_messages})
+        return paginator.get_paginated_response(serializer.data)
 
 class ConversationParticipantViewSet(viewsets.ModelViewSet):
     queryset = ConversationParticipant.objects.all()
@@ -269,6 +641,8 @@ class MessageViewSet(viewsets.ModelViewSet):
     queryset = Message.objects.all()
     serializer_class = MessageSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    pagination_class = KeysetOrPageNumberPagination
+    ordering = ('-message_id',)
 
     def get_queryset(self):
         # Handle schema generation for Swagger
@@ -281,8 +655,11 @@ class MessageViewSet(viewsets.ModelViewSet):
         # Handle unauthenticated users during schema generation
         if not self.request.user.is_authenticated:
             return Message.objects.none()
-        # Users can only see messages in conversations they are part of
-        return Message.objects.filter(conversation__conversationparticipant__user=self.request.user).distinct()
+        # Users can only see messages in conversations they are part of; a subquery
+        # instead of the participant join, so no DISTINCT is needed
+        return Message.objects.filter(
+            conversation__in=ConversationParticipant.objects.filter(user=self.request.user).values('conversation')
+        ).select_related('sender')
 
     def perform_create(self, serializer):
         serializer.save(sender=self.request.user)
@@ -297,7 +674,12 @@ class ReviewViewSet(viewsets.ModelViewSet):
         if getattr(self, 'swagger_fake_view', False):
             return Review.objects.none()
 
-        queryset = Review.objects.all().select_related('guest', 'property', 'booking')
+        queryset = Review.objects.all().select_related(
+            'guest', 'property__host', 'booking__guest', 'booking__property__host'
+        ).prefetch_related(
+            'property__photos', 'property__availabilities',
+            'booking__property__photos', 'booking__property__availabilities'
+        )
         
         # Filter by property if property_id is provided
         property_id = self.request.query_params.get('property_id')
@@ -319,19 +701,29 @@ class ReviewViewSet(viewsets.ModelViewSet):
             return CreateReviewSerializer
         return ReviewSerializer
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+
     @action(detail=False, methods=['post'])
     def create_review(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        # Create review with validated data
-        review = Review.objects.create(
-            guest=request.user,
-            property=serializer.validated_data['property'],
-            booking=serializer.validated_data['booking'],
-            rating=serializer.validated_data['rating'],
-            comment=serializer.validated_data['comment']
-        )
+        # Create review with validated data; the property's rating aggregates
+        # are updated by core.signals in the same transaction
+        with transaction.atomic():
+            review = Review.objects.create(
+                guest=request.user,
+                property=serializer.validated_data['property'],
+                booking=serializer.validated_data['booking'],
+                rating=serializer.validated_data['rating'],
+                comment=serializer.validated_data['comment']
+            )
 
         # Return the created review using the main serializer
         response_serializer = ReviewSerializer(review)
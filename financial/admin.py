@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Payment, PaymentCategory, PaymentMethod
+from .models import Payment, PaymentCategory, PaymentMethod, PaymentLedgerEntry, PaymentMonthlyRollup, QuickBooksSyncRun
 
 
 @admin.register(PaymentMethod)
@@ -72,6 +72,10 @@ class PaymentAdmin(admin.ModelAdmin):
             'fields': (
                 'synced_to_quickbooks',
                 'quickbooks_ref',
+                'quickbooks_attempts',
+                'quickbooks_error',
+                'quickbooks_retry_at',
+                'quickbooks_claimed_until',
             ),
             'classes': ('collapse',)
         }),
@@ -89,3 +93,50 @@ class PaymentAdmin(admin.ModelAdmin):
         if not obj.pk:  # Only set created_by during the first save
             obj.created_by = request.user
         super().save_model(request, obj, form, change)
+
+
+@admin.register(PaymentLedgerEntry)
+class PaymentLedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'payment', 'recorded_at')
+    list_filter = ('recorded_at',)
+    readonly_fields = ('payment', 'row', 'recorded_at')
+
+    # The ledger is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(QuickBooksSyncRun)
+class QuickBooksSyncRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'started_at', 'client', 'batch_size', 'concurrency', 'synced', 'failed', 'retries', 'throughput')
+    list_filter = ('client', 'started_at')
+    readonly_fields = (
+        'started_at', 'finished_at', 'client', 'batch_size', 'concurrency', 'batches', 'synced', 'failed', 'retries'
+    )
+
+    # Runs are recorded by financial.sync
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PaymentMonthlyRollup)
+class PaymentMonthlyRollupAdmin(admin.ModelAdmin):
+    list_display = ('month', 'currency', 'status', 'payment_category', 'payment_method', 'property_id', 'count', 'amount')
+    list_filter = ('month', 'currency', 'status')
+
+    # Maintained from payments; see financial.reports
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
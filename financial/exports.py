@@ -0,0 +1,82 @@
+"""
+Streaming payment exports.
+
+Payments are read with their method, category and creator joined, in keyset
+windows of ``CHUNK_SIZE`` rows (``WHERE (ordering, pk) > last row ... LIMIT``)
+rather than with ``QuerySet.iterator()``, which MySQL drivers cannot stream:
+they load the whole result set. Memory stays bounded whatever the number of
+payments. CSV is streamed to the client as rows are read. XLSX is
+written with xlsxwriter's constant-memory mode to an anonymous temporary
+file, which is then streamed and deleted when the response is closed.
+"""
+import csv
+import tempfile
+
+from django.db.models import Q
+
+from .ledger import COLUMNS, payment_row, write_workbook
+
+CHUNK_SIZE = 2000
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def keyset_windows(queryset, size=None):
+    """
+    Yield the rows of a queryset, in its ordering, ``size`` at a time. Each
+    window starts after the last row of the previous one, so it is an index
+    range scan however deep into the results. Ordering fields must be
+    non-null columns of the model; the primary key breaks ties.
+    """
+    size = size or CHUNK_SIZE
+    ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+    tie_breaker = next((name for name in ordering if name.lstrip('-') in ('pk', 'id')), 'pk')
+    ordering = [name for name in ordering if name.lstrip('-') not in ('pk', 'id')] + [tie_breaker]
+    keys = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+    queryset = queryset.order_by(*ordering)
+    after = None
+    while True:
+        window = list((queryset.filter(after) if after is not None else queryset)[:size])
+        yield from window
+        if len(window) < size:
+            return
+        # (a, b, pk) > (x, y, z), spelled out per ordering direction
+        last, after, equal = window[-1], Q(), {}
+        for name, descending in keys:
+            value = getattr(last, name)
+            after |= Q(**equal, **{f"{name}__{'lt' if descending else 'gt'}": value})
+            equal[name] = value
+
+
+def payment_rows(queryset):
+    queryset = queryset.select_related('payment_method', 'payment_category', 'created_by')
+    for payment in keyset_windows(queryset):
+        yield payment_row(payment)
+
+
+class Echo:
+    """File-like object handing back what csv.writer writes, for streaming."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in payment_rows(queryset):
+        yield writer.writerow(row)
+
+
+def xlsx_file(queryset):
+    """An open temporary file holding the workbook, positioned at its start."""
+    output = tempfile.TemporaryFile(suffix='.xlsx')
+    try:
+        write_workbook(payment_rows(queryset), output)
+    except BaseException:
+        output.close()
+        raise
+    output.seek(0)
+    return output
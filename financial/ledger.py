@@ -0,0 +1,171 @@
+"""
+Append-only payment ledger and the financial records workbook built from it.
+
+Creating a payment inserts one ``PaymentLedgerEntry`` holding its workbook row,
+in the payment's transaction: a constant cost whatever the history size, with
+no file shared between workers. ``financial_records.xlsx`` is built from the
+ledger in a single streaming pass (xlsxwriter's constant-memory mode), when it
+is downloaded after new entries arrived, or ahead of time by the
+``build_financial_records`` command. Builds write a temporary file and move it
+into place, so readers never see a partial workbook.
+"""
+import json
+import os
+import tempfile
+
+import xlsxwriter
+from django.conf import settings
+from django.db.models import Max
+
+from .models import Payment, PaymentLedgerEntry
+
+COLUMNS = (
+    'Transaction ID', 'Date', 'Amount', 'Currency', 'Status', 'Payment Method', 'Payment Category',
+    'Payer ID', 'Property ID', 'Notes', 'Synced to QuickBooks', 'QuickBooks Reference', 'Created By',
+    'Last Updated',
+)
+COLUMN_WIDTHS = {'Transaction ID': 20, 'Date': 20, 'Notes': 30, 'QuickBooks Reference': 20}
+# Entries read from the database per round trip while building
+BATCH_SIZE = 2000
+# Data rows per worksheet: Excel's limit of 1,048,576 rows less the header
+SHEET_ROWS = 1048575
+
+
+def records_path():
+    return getattr(settings, 'FINANCIAL_RECORDS_PATH', os.path.join(settings.BASE_DIR, 'financial_records.xlsx'))
+
+
+def build_state_path():
+    return records_path() + '.json'
+
+
+def payment_row(payment):
+    """The workbook row of a payment, as it stands now."""
+    return [
+        payment.transaction_id,
+        payment.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+        float(payment.amount),
+        payment.currency,
+        payment.get_status_display(),
+        payment.payment_method.name,
+        payment.payment_category.name,
+        payment.payer_id,
+        payment.property_id or '',
+        payment.notes or '',
+        'Yes' if payment.synced_to_quickbooks else 'No',
+        payment.quickbooks_ref or '',
+        payment.created_by.get_full_name() if payment.created_by else '',
+        payment.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
+    ]
+
+
+def record_payment(payment):
+    """Append a new payment to the ledger."""
+    return PaymentLedgerEntry.objects.create(payment=payment, row=payment_row(payment))
+
+
+def backfill_ledger():
+    """Record payments created before the ledger existed; returns how many."""
+    missing = Payment.objects.filter(ledger_entries__isnull=True).select_related(
+        'payment_method', 'payment_category', 'created_by'
+    ).order_by('pk')
+    count, last_pk = 0, 0
+    while True:
+        # Keyset windows: MySQL drivers cannot stream a single large result
+        window = list(missing.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not window:
+            return count
+        PaymentLedgerEntry.objects.bulk_create(
+            PaymentLedgerEntry(payment=payment, row=payment_row(payment)) for payment in window
+        )
+        count += len(window)
+        last_pk = window[-1].pk
+
+
+def ledger_rows(last_entry_id):
+    """Rows of the ledger entries up to ``last_entry_id``, read in keyset windows of ``BATCH_SIZE``."""
+    last_pk = 0
+    while True:
+        window = list(PaymentLedgerEntry.objects.filter(
+            pk__gt=last_pk, pk__lte=last_entry_id
+        ).order_by('pk').values_list('pk', 'row')[:BATCH_SIZE])
+        for _, row in window:
+            yield row
+        if len(window) < BATCH_SIZE:
+            return
+        last_pk = window[-1][0]
+
+
+def write_workbook(rows, target):
+    """
+    Write rows (lists in ``COLUMNS`` order) to an .xlsx path or file object;
+    returns the row count. Rows beyond one sheet's capacity continue on
+    further sheets ("Payments 2", ...).
+    """
+    workbook = xlsxwriter.Workbook(target, {'constant_memory': True, 'in_memory': False})
+    header_format = workbook.add_format({
+        'bold': True,
+        'text_wrap': True,
+        'valign': 'top',
+        'bg_color': '#D9E1F2',
+        'border': 1
+    })
+
+    def add_sheet(number):
+        worksheet = workbook.add_worksheet('Payments' if number == 1 else f'Payments {number}')
+        for col_num, name in enumerate(COLUMNS):
+            worksheet.set_column(col_num, col_num, COLUMN_WIDTHS.get(name, 15))
+            worksheet.write(0, col_num, name, header_format)
+        return worksheet
+
+    # Constant-memory mode flushes each row once the next one starts
+    sheets, worksheet, sheet_row, count = 1, add_sheet(1), 0, 0
+    for row in rows:
+        if sheet_row == SHEET_ROWS:
+            worksheet.autofilter(0, 0, sheet_row, len(COLUMNS) - 1)
+            sheets += 1
+            worksheet, sheet_row = add_sheet(sheets), 0
+        sheet_row += 1
+        count += 1
+        worksheet.write_row(sheet_row, 0, row)
+    worksheet.autofilter(0, 0, sheet_row, len(COLUMNS) - 1)
+    workbook.close()
+    return count
+
+
+def built_up_to():
+    """Id of the last ledger entry in the current workbook, or None when there is none."""
+    if not os.path.exists(records_path()):
+        return None
+    try:
+        with open(build_state_path()) as state:
+            return json.load(state)['last_entry_id']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def build_records():
+    """Rebuild the workbook from the whole ledger; returns the number of rows."""
+    last_entry_id = PaymentLedgerEntry.objects.aggregate(last=Max('pk'))['last'] or 0
+
+    path = records_path()
+    directory = os.path.dirname(path) or '.'
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.xlsx')
+    os.close(descriptor)
+    try:
+        count = write_workbook(ledger_rows(last_entry_id), temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    with open(build_state_path(), 'w') as state:
+        json.dump({'last_entry_id': last_entry_id, 'rows': count}, state)
+    return count
+
+
+def ensure_records():
+    """Path of an up-to-date workbook, rebuilding it only if entries were added since the last build."""
+    last_entry_id = PaymentLedgerEntry.objects.aggregate(last=Max('pk'))['last'] or 0
+    if built_up_to() != last_entry_id:
+        build_records()
+    return records_path()
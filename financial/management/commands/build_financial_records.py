@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from financial.ledger import backfill_ledger, build_records, records_path
+
+class Command(BaseCommand):
+    help = 'Builds financial_records.xlsx from the payment ledger, e.g. from cron so downloads never wait for a build.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backfill', action='store_true',
+            help='First record payments created before the ledger existed.'
+        )
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.stdout.write(self.style.SUCCESS(f'Recorded {backfill_ledger()} earlier payments in the ledger.'))
+
+        self.stdout.write(self.style.SUCCESS('Building financial records workbook...'))
+        count = build_records()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} payments to {records_path()}.'))
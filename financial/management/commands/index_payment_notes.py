@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from financial.search import index_all_notes
+
+class Command(BaseCommand):
+    help = 'Rebuilds the payment notes search index, e.g. for payments recorded before it existed.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Indexing payment notes...'))
+        count = index_all_notes()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} note tokens.'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from financial.reports import rebuild_rollups
+
+class Command(BaseCommand):
+    help = 'Rebuilds the monthly payment rollups used by the payment reports.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Rebuilding payment rollups...'))
+        count = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} rollup rows.'))
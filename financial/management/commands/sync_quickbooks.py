@@ -0,0 +1,21 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from financial.sync import sync_payments
+
+class Command(BaseCommand):
+    help = 'Pushes unsynced successful payments to QuickBooks, e.g. from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Payments per batch request (at most 30).')
+        parser.add_argument('--concurrency', type=int, help='Batches pushed in parallel.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Syncing payments to QuickBooks...'))
+        try:
+            run = sync_payments(batch_size=options['batch_size'], concurrency=options['concurrency'])
+        except ImproperlyConfigured as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(
+            f'Synced {run.synced} payments in {run.batches} batches, {run.failed} failed '
+            f'({run.retries} retries, {run.throughput or 0} payments/s).'
+        ))
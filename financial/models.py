@@ -1,7 +1,7 @@
 from django.db import models
 from django.utils import timezone
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 
@@ -80,6 +80,13 @@ class Payment(models.Model):
     notes = models.TextField(blank=True, null=True)
     synced_to_quickbooks = models.BooleanField(default=False)
     quickbooks_ref = models.CharField(max_length=100, blank=True, null=True)
+    # Sync bookkeeping, maintained by financial.sync
+    quickbooks_attempts = models.PositiveIntegerField(default=0)
+    quickbooks_error = models.TextField(blank=True, default='')
+    quickbooks_retry_at = models.DateTimeField(null=True, blank=True, help_text='Not retried before this time')
+    quickbooks_claimed_until = models.DateTimeField(
+        null=True, blank=True, help_text='Being pushed by a sync run until this time'
+    )
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
@@ -90,6 +97,14 @@ class Payment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            # The QuickBooks sync queue
+            models.Index(fields=['synced_to_quickbooks', 'status', 'id']),
+            # Exact and prefix lookups (see financial.search), newest first
+            models.Index(fields=['payer_id', 'created_at']),
+            models.Index(fields=['property_id', 'created_at']),
+        ]
         verbose_name = 'Payment'
         verbose_name_plural = 'Payments'
 
@@ -97,13 +112,146 @@ class Payment(models.Model):
         return f"{self.transaction_id} - {self.amount} {self.currency}"
 
 
+class QuickBooksSyncRun(models.Model):
+    """
+    One pass of financial.sync over the QuickBooks queue.
+    """
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    client = models.CharField(max_length=50)
+    batch_size = models.PositiveIntegerField()
+    concurrency = models.PositiveIntegerField()
+    batches = models.PositiveIntegerField(default=0)
+    synced = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    retries = models.PositiveIntegerField(default=0, help_text='Batch pushes repeated after transient errors')
+
+    class Meta:
+        ordering = ['-started_at']
+        verbose_name = 'QuickBooks Sync Run'
+        verbose_name_plural = 'QuickBooks Sync Runs'
+
+    def __str__(self):
+        return f"Sync run #{self.id} - {self.synced} synced, {self.failed} failed"
+
+    @property
+    def duration(self):
+        if self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    @property
+    def throughput(self):
+        """Payments synced per second."""
+        duration = self.duration
+        if not duration:
+            return None
+        return round(self.synced / duration, 2)
+
+
+class PaymentLedgerEntry(models.Model):
+    """
+    Append-only journal of created payments, one row each, from which the
+    financial records workbook is built. Rows keep the payment as it was
+    recorded, even after the payment changes or is deleted.
+    """
+    payment = models.ForeignKey(
+        Payment,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='ledger_entries'
+    )
+    row = models.JSONField(help_text='Workbook cells, in financial.ledger.COLUMNS order')
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = 'Payment Ledger Entry'
+        verbose_name_plural = 'Payment Ledger Entries'
+
+    def __str__(self):
+        return f"Ledger entry #{self.id} - {self.row[0] if self.row else ''}"
+
+
+class PaymentNoteToken(models.Model):
+    """Inverted index entry: a token of a payment's notes."""
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='note_tokens')
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ('payment', 'token')
+        indexes = [
+            # Covers term lookups without touching the table
+            models.Index(fields=['token', 'payment']),
+        ]
+
+    def __str__(self):
+        return f"{self.token} for payment {self.payment_id}"
+
+
+class PaymentMonthlyRollup(models.Model):
+    """
+    Count and amount of the payments sharing a month, currency, status,
+    category, method and property, maintained by financial.reports.
+    """
+    month = models.DateField(help_text='First day of the month')
+    currency = models.CharField(max_length=3)
+    status = models.CharField(max_length=10, choices=Payment.StatusChoices.choices)
+    payment_category = models.ForeignKey(PaymentCategory, on_delete=models.CASCADE, related_name='monthly_rollups')
+    payment_method = models.ForeignKey(PaymentMethod, on_delete=models.CASCADE, related_name='monthly_rollups')
+    property_id = models.CharField(max_length=100, blank=True, default='')
+    count = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('month', 'currency', 'status', 'payment_category', 'payment_method', 'property_id')
+        verbose_name = 'Payment Monthly Rollup'
+        verbose_name_plural = 'Payment Monthly Rollups'
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.currency} {self.status}: {self.count} payments"
+
+
 def payment_post_save(sender, instance, created, **kwargs):
     """
-    Signal handler to append payment to Excel file after save
+    Signal handler to record a new payment in the ledger
+    """
+    if created:  # Only record when a new payment is created
+        from .ledger import record_payment
+        record_payment(instance)
+
+
+def index_saved_payment_notes(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Signal handler to reindex the notes of a payment when they may have changed
+    """
+    if update_fields is None or 'notes' in update_fields:
+        from .search import index_notes
+        index_notes(instance, created)
+
+
+def remember_rollup_key(sender, instance, **kwargs):
+    """
+    Keep the rollup row a payment counted towards before this save.
+    """
+    from .reports import stored_rollup
+    instance._stored_rollup = stored_rollup(instance.pk) if instance.pk else None
+
+
+def roll_up_saved_payment(sender, instance, **kwargs):
+    """
+    Move a saved payment's count and amount to its current rollup row.
+    """
+    from .reports import roll_up_payment
+    roll_up_payment(getattr(instance, '_stored_rollup', None), instance)
+
+
+def roll_up_deleted_payment(sender, instance, **kwargs):
+    """
+    Take a deleted payment out of the rollups.
     """
-    if created:  # Only append when a new payment is created
-        from .utils import append_payment_to_excel
-        append_payment_to_excel(instance)
+    from .reports import roll_up_payment, payment_rollup
+    roll_up_payment(payment_rollup(instance), None)
 
 
 class RentRequest(models.Model):
@@ -154,3 +302,7 @@ class RentRequest(models.Model):
 
 # Connect the signal
 post_save.connect(payment_post_save, sender=Payment)
+post_save.connect(index_saved_payment_notes, sender=Payment)
+pre_save.connect(remember_rollup_key, sender=Payment)
+post_save.connect(roll_up_saved_payment, sender=Payment)
+post_delete.connect(roll_up_deleted_payment, sender=Payment)
@@ -0,0 +1,170 @@
+"""
+Clients pushing payments to the accounting system.
+
+``financial.sync`` talks to the accounting system only through
+``get_client()``, which instantiates ``settings.QUICKBOOKS_CLIENT``. A client
+implements ``push_batch(items)``: each item is a dict with an
+``idempotency_key``, the ``doc_number`` the payment is booked under and the
+payment fields, and the result maps every key to either ``{'ref': <id in the
+accounting system>}`` or ``{'error': <reason>}``. Pushing a payment twice, in
+whatever batch, must return the first ref rather than book it again.
+Whole-batch problems worth retrying (timeouts, throttling, 5xx) are raised as
+``TransientAccountingError``.
+
+``QuickBooksClient`` calls the QuickBooks Online batch API and is the
+default. ``FakeQuickBooksClient`` is an in-process stand-in for tests: its
+refs only live in the memory of one process, so it must never be used to
+mark real payments as synced.
+"""
+import hashlib
+import itertools
+import random
+import threading
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+# QuickBooks Online accepts at most 30 operations per batch request
+MAX_BATCH_SIZE = 30
+
+
+class AccountingError(Exception):
+    pass
+
+
+class TransientAccountingError(AccountingError):
+    """The batch may succeed if retried later."""
+
+
+def client_class():
+    return import_string(getattr(settings, 'QUICKBOOKS_CLIENT', 'financial.quickbooks.QuickBooksClient'))
+
+
+def get_client():
+    """The configured client; raises ``ImproperlyConfigured`` when it cannot be used."""
+    return client_class()()
+
+
+class FakeQuickBooksClient:
+    """
+    Local stand-in for QuickBooks: books each idempotency key once, in memory
+    and shared by all instances of the process. ``failure_rate`` makes that
+    share of batches fail transiently, and ``reject`` maps transaction ids to
+    errors, to exercise retries and per-payment failures.
+    """
+    name = 'fake'
+    booked = {}
+    batches = []
+    _ids = itertools.count(1)
+    _lock = threading.Lock()
+    failure_rate = 0.0
+    reject = {}
+
+    @classmethod
+    def reset(cls, failure_rate=0.0, reject=None):
+        with cls._lock:
+            cls.booked, cls.batches = {}, []
+            cls.failure_rate, cls.reject = failure_rate, dict(reject or {})
+
+    def push_batch(self, items):
+        if len(items) > MAX_BATCH_SIZE:
+            raise AccountingError(f'At most {MAX_BATCH_SIZE} items per batch')
+        with self._lock:
+            self.batches.append([item['idempotency_key'] for item in items])
+            if random.random() < self.failure_rate:
+                raise TransientAccountingError('Service unavailable')
+            results = {}
+            for item in items:
+                key = item['idempotency_key']
+                if item['transaction_id'] in self.reject:
+                    results[key] = {'error': self.reject[item['transaction_id']]}
+                    continue
+                if key not in self.booked:
+                    self.booked[key] = f'FAKE-{next(self._ids)}'
+                results[key] = {'ref': self.booked[key]}
+            return results
+
+
+class QuickBooksClient:
+    """
+    QuickBooks Online: each payment becomes a SalesReceipt, sent through the
+    batch endpoint with the idempotency key as the operation's ``bId``.
+
+    QuickBooks only de-duplicates whole requests (``requestid``), so before
+    creating receipts the client looks up the batch's doc numbers and answers
+    payments already booked, perhaps by an earlier batch whose answer was
+    lost, with the existing receipt.
+    """
+    name = 'quickbooks'
+
+    def __init__(self):
+        if not (getattr(settings, 'QUICKBOOKS_REALM_ID', '') and getattr(settings, 'QUICKBOOKS_ACCESS_TOKEN', '')):
+            raise ImproperlyConfigured('Set QUICKBOOKS_REALM_ID and QUICKBOOKS_ACCESS_TOKEN to sync with QuickBooks')
+        self.url = f"{settings.QUICKBOOKS_API_URL}/v3/company/{settings.QUICKBOOKS_REALM_ID}"
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {settings.QUICKBOOKS_ACCESS_TOKEN}',
+            'Accept': 'application/json',
+        })
+        self.timeout = getattr(settings, 'QUICKBOOKS_TIMEOUT', 30)
+
+    def receipt(self, item):
+        return {
+            'TxnDate': item['date'],
+            'DocNumber': item['doc_number'],
+            'CurrencyRef': {'value': item['currency']},
+            'PrivateNote': f"{item['transaction_id']} {item['notes']}".strip()[:4000],
+            'Line': [{
+                'Amount': item['amount'],
+                'DetailType': 'SalesItemLineDetail',
+                'Description': item['category'],
+                'SalesItemLineDetail': {},
+            }],
+        }
+
+    def send(self, method, endpoint, **kwargs):
+        """JSON answer of an API call; raises ``TransientAccountingError`` for errors worth retrying."""
+        try:
+            response = self.session.request(method, f'{self.url}/{endpoint}', timeout=self.timeout, **kwargs)
+        except requests.RequestException as error:
+            raise TransientAccountingError(str(error))
+        if response.status_code == 429 or response.status_code >= 500:
+            raise TransientAccountingError(f'QuickBooks answered {response.status_code}')
+        if response.status_code >= 400:
+            raise AccountingError(f'QuickBooks answered {response.status_code}: {response.text[:500]}')
+        return response.json()
+
+    def booked_receipts(self, items):
+        """Ids of the receipts already booked under the items' doc numbers, by doc number."""
+        numbers = ', '.join(f"'{item['doc_number']}'" for item in items)
+        answer = self.send('GET', 'query', params={
+            'query': f'select Id, DocNumber from SalesReceipt where DocNumber in ({numbers})',
+        })
+        receipts = answer.get('QueryResponse', {}).get('SalesReceipt', [])
+        return {receipt['DocNumber']: receipt['Id'] for receipt in receipts}
+
+    def push_batch(self, items):
+        booked = self.booked_receipts(items)
+        results = {
+            item['idempotency_key']: {'ref': booked[item['doc_number']]} for item in items if item['doc_number'] in booked
+        }
+        items = [item for item in items if item['doc_number'] not in booked]
+        if not items:
+            return results
+
+        body = {'BatchItemRequest': [
+            {'bId': item['idempotency_key'], 'operation': 'create', 'SalesReceipt': self.receipt(item)}
+            for item in items
+        ]}
+        # Same items, same request id: a retried batch is answered from QuickBooks' record of the first
+        request_id = hashlib.sha1('|'.join(item['idempotency_key'] for item in items).encode()).hexdigest()
+        response = self.send('POST', 'batch', json=body, params={'requestid': request_id})
+        for answer in response.get('BatchItemResponse', []):
+            if 'Fault' in answer:
+                errors = answer['Fault'].get('Error', [])
+                results[answer['bId']] = {'error': '; '.join(error.get('Message', '') for error in errors) or 'Fault'}
+            else:
+                results[answer['bId']] = {'ref': answer['SalesReceipt']['Id']}
+        return results
@@ -0,0 +1,177 @@
+"""
+Payment reporting, aggregated in SQL.
+
+``PaymentMonthlyRollup`` holds, per month, currency, status, category, method
+and property, the count and amount of the payments sharing them. The signal
+handlers move a payment between rows as it is created, changed or deleted,
+with one ``UPDATE ... SET count = count + 1`` in the payment's transaction,
+so the table is exact without ever rescanning payments.
+
+``payment_report`` groups whole-month ranges from the rollups: a year is at
+most a few thousand rows whatever the number of payments. Ranges starting or
+ending mid-month are grouped directly over ``Payment`` (using the
+``created_at`` index). Either way the grouping runs in the database; only the
+groups reach Python.
+"""
+from calendar import monthrange
+from datetime import datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import Payment, PaymentMonthlyRollup
+
+KEY_FIELDS = ('month', 'currency', 'status', 'payment_category_id', 'payment_method_id', 'property_id')
+GROUP_BY = ('month', 'category', 'method', 'currency', 'property')
+SUCCESS, FAILED, PENDING = Payment.StatusChoices.SUCCESS, Payment.StatusChoices.FAILED, Payment.StatusChoices.PENDING
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def rollup_key(created_at, currency, status, payment_category_id, payment_method_id, property_id):
+    return (
+        month_start(timezone.localdate(created_at)), currency, status,
+        payment_category_id, payment_method_id, property_id or '',
+    )
+
+
+def payment_rollup(payment):
+    """The rollup row of a payment and the amount it adds there."""
+    key = rollup_key(
+        payment.created_at, payment.currency, payment.status,
+        payment.payment_category_id, payment.payment_method_id, payment.property_id,
+    )
+    return key, payment.amount
+
+
+def stored_rollup(pk):
+    """``payment_rollup`` of a payment as currently stored, or None."""
+    stored = Payment.objects.filter(pk=pk).values_list(
+        'created_at', 'currency', 'status', 'payment_category_id', 'payment_method_id', 'property_id', 'amount'
+    ).first()
+    if stored is None:
+        return None
+    return rollup_key(*stored[:-1]), stored[-1]
+
+
+def _bump(key, amount, sign):
+    rows = PaymentMonthlyRollup.objects.filter(**dict(zip(KEY_FIELDS, key)))
+    changes = {'count': F('count') + sign, 'amount': F('amount') + sign * amount}
+    if rows.update(**changes) or sign < 0:
+        return
+    try:
+        with transaction.atomic():
+            PaymentMonthlyRollup.objects.create(count=1, amount=amount, **dict(zip(KEY_FIELDS, key)))
+    except IntegrityError:
+        # Created concurrently
+        rows.update(**changes)
+
+
+def roll_up_payment(before, payment):
+    """
+    Move a payment from its previous rollup (``payment_rollup`` result, or
+    None when new) to its current one (None when deleted).
+    """
+    after = payment_rollup(payment) if payment is not None else None
+    if before == after:
+        return
+    if before is not None:
+        _bump(*before, -1)
+    if after is not None:
+        _bump(*after, 1)
+
+
+def rebuild_rollups():
+    """Recompute the rollups from all payments in one grouped query; returns the number of rows."""
+    groups = Payment.objects.values(
+        'currency', 'status', 'payment_category_id', 'payment_method_id',
+        rollup_month=TruncMonth('created_at', output_field=DateField()),
+        rollup_property=Coalesce('property_id', Value('')),
+    ).annotate(payments=Count('pk'), total=Sum('amount')).order_by()
+    rows = [
+        PaymentMonthlyRollup(
+            month=group['rollup_month'], currency=group['currency'], status=group['status'],
+            payment_category_id=group['payment_category_id'], payment_method_id=group['payment_method_id'],
+            property_id=group['rollup_property'], count=group['payments'], amount=group['total'],
+        )
+        for group in groups.iterator()
+    ]
+    with transaction.atomic():
+        PaymentMonthlyRollup.objects.all().delete()
+        PaymentMonthlyRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def covers_whole_months(start, end):
+    """Whether rollups can answer ``[start, end]``: it starts on a 1st and ends on a month's last day or later than today."""
+    return start.day == 1 and (end.day == monthrange(end.year, end.month)[1] or end >= timezone.localdate())
+
+
+def _groups(group_by, from_rollups):
+    """Field names and expressions the rows are grouped on, besides currency."""
+    if group_by == 'month':
+        if from_rollups:
+            return ['month'], {}
+        return [], {'month': TruncMonth('created_at', output_field=DateField())}
+    if group_by == 'category':
+        return ['payment_category'], {'category_name': F('payment_category__name')}
+    if group_by == 'method':
+        return ['payment_method'], {'method_name': F('payment_method__name')}
+    if group_by == 'property':
+        return ['property_id'], {}
+    return [], {}
+
+
+def payment_report(group_by, start, end, currency=None, property_id=None):
+    """
+    Payments between two days (inclusive), grouped by ``group_by`` and
+    currency: counts per status, revenue (successful amounts) and rates.
+    """
+    from_rollups = covers_whole_months(start, end)
+    names, expressions = _groups(group_by, from_rollups)
+    if from_rollups:
+        rows = PaymentMonthlyRollup.objects.filter(month__gte=start, month__lte=end, count__gt=0)
+        count, amount = 'count', 'amount'
+        totals = {
+            'payments': Sum(count),
+            'successful': Sum(count, filter=Q(status=SUCCESS)),
+            'failed': Sum(count, filter=Q(status=FAILED)),
+            'pending': Sum(count, filter=Q(status=PENDING)),
+        }
+    else:
+        rows = Payment.objects.filter(
+            created_at__gte=timezone.make_aware(datetime.combine(start, time.min)),
+            created_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+        )
+        amount = 'amount'
+        totals = {
+            'payments': Count('pk'),
+            'successful': Count('pk', filter=Q(status=SUCCESS)),
+            'failed': Count('pk', filter=Q(status=FAILED)),
+            'pending': Count('pk', filter=Q(status=PENDING)),
+        }
+    if currency:
+        rows = rows.filter(currency=currency)
+    if property_id:
+        rows = rows.filter(property_id=property_id)
+
+    order = names + list(expressions) + ['currency']
+    rows = rows.values(*names, 'currency', **expressions).annotate(
+        revenue=Sum(amount, filter=Q(status=SUCCESS)), **totals
+    ).order_by(*order)
+
+    results = []
+    for row in rows:
+        for status in ('successful', 'failed', 'pending'):
+            row[status] = row[status] or 0
+        row['revenue'] = row['revenue'] or 0
+        row['success_rate'] = round(row['successful'] / row['payments'], 4) if row['payments'] else None
+        row['failure_rate'] = round(row['failed'] / row['payments'], 4) if row['payments'] else None
+        if 'property_id' in row:
+            row['property_id'] = row['property_id'] or None
+        results.append(row)
+    return results
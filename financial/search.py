@@ -0,0 +1,104 @@
+"""
+Payment lookup for support staff.
+
+Transaction, payer and property ids are matched exactly or by prefix. A
+prefix is searched as the range ``prefix <= id < next prefix``, which every
+database answers from the column's index, where ``icontains`` scanned the
+whole table.
+
+Notes are tokenized (``core.search.tokenize``) into ``PaymentNoteToken`` rows
+whenever they change, and matched word by word through that index.
+"""
+from django.db import transaction
+from django.db.models import Count, Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from core.search import MAX_QUERY_TERMS, tokenize
+from .models import Payment, PaymentNoteToken
+
+IDENTIFIER_FIELDS = ('transaction_id', 'payer_id', 'property_id')
+LOOKUP_MODES = ('prefix', 'exact')
+BATCH_SIZE = 2000
+
+
+def index_notes(payment, created=False):
+    """(Re)build the note tokens of one payment."""
+    tokens = [PaymentNoteToken(payment=payment, token=token) for token in set(tokenize(payment.notes))]
+    if created:
+        PaymentNoteToken.objects.bulk_create(tokens)
+        return
+    with transaction.atomic():
+        PaymentNoteToken.objects.filter(payment=payment).delete()
+        PaymentNoteToken.objects.bulk_create(tokens)
+
+
+def index_all_notes():
+    """Rebuild the note tokens of every payment; returns the number of tokens."""
+    count, last_pk = 0, 0
+    payments = Payment.objects.exclude(notes__isnull=True).exclude(notes='').order_by('pk').values_list('pk', 'notes')
+    with transaction.atomic():
+        PaymentNoteToken.objects.all().delete()
+        while True:
+            # Keyset windows: MySQL drivers cannot stream a single large result
+            window = list(payments.filter(pk__gt=last_pk)[:BATCH_SIZE])
+            if not window:
+                return count
+            tokens = [
+                PaymentNoteToken(payment_id=pk, token=token)
+                for pk, notes in window for token in set(tokenize(notes))
+            ]
+            PaymentNoteToken.objects.bulk_create(tokens)
+            count += len(tokens)
+            last_pk = window[-1][0]
+
+
+def prefix_range(prefix):
+    """Bounds of the strings starting with ``prefix``: ``[prefix, upper)``."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def match_identifiers(queryset, term, mode='prefix'):
+    """Payments whose transaction, payer or property id equals or starts with ``term``."""
+    condition = Q()
+    for field in IDENTIFIER_FIELDS:
+        if mode == 'exact':
+            condition |= Q(**{field: term})
+        else:
+            lower, upper = prefix_range(term)
+            condition |= Q(**{f'{field}__gte': lower, f'{field}__lt': upper})
+    return queryset.filter(condition)
+
+
+def match_notes(queryset, text):
+    """Payments whose notes contain every word of ``text``."""
+    terms = list(dict.fromkeys(tokenize(text)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return queryset.none()
+    matching = PaymentNoteToken.objects.filter(token__in=terms).values('payment').annotate(
+        matched=Count('token')
+    ).filter(matched=len(terms)).values('payment')
+    return queryset.filter(pk__in=matching)
+
+
+class PaymentSearchFilter(BaseFilterBackend):
+    """
+    ``?search=`` matches transaction, payer and property ids by prefix, or
+    exactly with ``?lookup=exact``; ``?notes=`` matches words of the notes.
+    """
+    search_param = 'search'
+    lookup_param = 'lookup'
+    notes_param = 'notes'
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').strip()
+        mode = request.query_params.get(self.lookup_param, 'prefix')
+        if mode not in LOOKUP_MODES:
+            raise ValidationError({self.lookup_param: f'Must be one of: {", ".join(LOOKUP_MODES)}'})
+        if term:
+            queryset = match_identifiers(queryset, term, mode)
+
+        notes = request.query_params.get(self.notes_param, '').strip()
+        if notes:
+            queryset = match_notes(queryset, notes)
+        return queryset
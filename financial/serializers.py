@@ -1,5 +1,9 @@
+from datetime import date
+
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Payment
+from .models import Payment, QuickBooksSyncRun
+from .reports import GROUP_BY
 
 
 class PaymentSerializer(serializers.ModelSerializer):
@@ -50,6 +54,18 @@ class PaymentSyncSerializer(serializers.Serializer):
     )
 
 
+class QuickBooksSyncRunSerializer(serializers.ModelSerializer):
+    duration = serializers.FloatField(read_only=True)
+    throughput = serializers.FloatField(read_only=True, help_text="Payments synced per second")
+
+    class Meta:
+        model = QuickBooksSyncRun
+        fields = [
+            'id', 'started_at', 'finished_at', 'client', 'batch_size', 'concurrency',
+            'batches', 'synced', 'failed', 'retries', 'duration', 'throughput',
+        ]
+
+
 class QuickBooksAccountSerializer(serializers.Serializer):
     id = serializers.CharField()
     name = serializers.CharField()
@@ -69,3 +85,20 @@ class JournalEntrySerializer(serializers.Serializer):
         ),
         min_length=2
     )
+
+
+class PaymentReportQuerySerializer(serializers.Serializer):
+    """Query parameters of the payment reports."""
+    group_by = serializers.ChoiceField(choices=GROUP_BY, required=False, default='month')
+    start = serializers.DateField(required=False, help_text='First day (defaults to January 1st of the end year)')
+    end = serializers.DateField(required=False, help_text='Last day (defaults to today)')
+    currency = serializers.CharField(required=False, max_length=3)
+    property_id = serializers.CharField(required=False, max_length=100)
+
+    def validate(self, data):
+        data['end'] = data.get('end') or timezone.localdate()
+        data['start'] = data.get('start') or date(data['end'].year, 1, 1)
+        if data['start'] > data['end']:
+            raise serializers.ValidationError({'end': 'End must not be before start'})
+        return data
+
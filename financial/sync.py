@@ -0,0 +1,195 @@
+"""
+Pushing payments to the accounting system.
+
+The queue is every successful payment not yet synced whose retry time, if any,
+has passed. ``sync_payments`` reads it in windows of ``batch_size *
+concurrency`` payments and pushes each window as ``concurrency`` batches in
+parallel threads; the threads only talk to the client, while reading and
+recording results stays on the calling thread's database connection.
+
+Each window is claimed before it is pushed: its rows are locked with ``SKIP
+LOCKED`` just long enough to lease them to the run (``quickbooks_claimed_until``),
+so overlapping runs push disjoint payments, and payments of a run that died
+are picked up again once the lease ends. Every payment is pushed under the
+idempotency key ``inorental-payment-<id>`` and booked under its own doc
+number, so a payment retried after a timeout, in whatever batch, is booked
+once. Whole-batch transient errors are retried with
+exponential backoff and jitter; payments still failing afterwards, or rejected
+individually, keep their error and are requeued with a growing delay.
+"""
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Payment, QuickBooksSyncRun
+from .quickbooks import MAX_BATCH_SIZE, AccountingError, TransientAccountingError, get_client
+
+logger = logging.getLogger(__name__)
+
+# Longest a failed payment waits before it is retried
+MAX_REQUEUE_DELAY = timedelta(days=1)
+# How long a run owns the payments it claimed; longer than a window can take to push
+CLAIM_LEASE = timedelta(minutes=15)
+
+
+def setting(name, default):
+    return getattr(settings, f'QUICKBOOKS_{name}', default)
+
+
+def idempotency_key(payment):
+    return f'inorental-payment-{payment.pk}'
+
+
+def doc_number(payment):
+    # Unique per payment and within QuickBooks' 21 characters
+    return f'INO-{payment.pk}'
+
+
+def payment_item(payment):
+    return {
+        'idempotency_key': idempotency_key(payment),
+        'doc_number': doc_number(payment),
+        'transaction_id': payment.transaction_id,
+        'date': payment.created_at.date().isoformat(),
+        'amount': str(payment.amount),
+        'currency': payment.currency,
+        'category': payment.payment_category.name,
+        'method': payment.payment_method.name,
+        'notes': payment.notes or '',
+    }
+
+
+def sync_queue(now=None):
+    """Payments waiting to be pushed now."""
+    now = now or timezone.now()
+    return Payment.objects.filter(
+        synced_to_quickbooks=False, status=Payment.StatusChoices.SUCCESS
+    ).filter(Q(quickbooks_retry_at__isnull=True) | Q(quickbooks_retry_at__lte=now))
+
+
+def claim_window(pending, last_pk, size):
+    """
+    Lease the next ``size`` pending payments after ``last_pk`` to this run.
+    Rows another run is claiming are skipped rather than waited for, and rows
+    it already claimed are excluded.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        window = list(
+            pending.filter(pk__gt=last_pk)
+            .filter(Q(quickbooks_claimed_until__isnull=True) | Q(quickbooks_claimed_until__lte=now))
+            .select_for_update(skip_locked=True, of=('self',))[:size]
+        )
+        Payment.objects.filter(pk__in=[payment.pk for payment in window]).update(
+            quickbooks_claimed_until=now + CLAIM_LEASE
+        )
+    return window
+
+
+def push_batch(client, items, max_retries, retry_base):
+    """
+    Push one batch, retrying transient errors; returns the client's results,
+    the number of retries, and the error that failed the whole batch, if any.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return client.push_batch(items), attempt, None
+        except TransientAccountingError as error:
+            if attempt == max_retries:
+                return {}, attempt, str(error)
+            # Full backoff plus up to as much again of jitter, so parallel batches spread out
+            time.sleep(retry_base * 2 ** attempt * (1 + random.random()))
+        except AccountingError as error:
+            return {}, attempt, str(error)
+
+
+def requeue_delay(attempts):
+    delay = timedelta(seconds=setting('REQUEUE_SECONDS', 60) * 2 ** (attempts - 1))
+    return min(delay, MAX_REQUEUE_DELAY)
+
+
+def sync_payments(payment_ids=None, batch_size=None, concurrency=None, client=None):
+    """
+    Push the queue, or the given unsynced payments whatever their status or
+    retry time, to the accounting system. Returns the ``QuickBooksSyncRun``.
+    Raises ``ImproperlyConfigured`` before touching anything when no usable
+    client is configured.
+    """
+    batch_size = max(1, min(batch_size or setting('BATCH_SIZE', MAX_BATCH_SIZE), MAX_BATCH_SIZE))
+    concurrency = max(1, concurrency or setting('CONCURRENCY', 4))
+    max_retries = setting('MAX_RETRIES', 3)
+    retry_base = setting('RETRY_BASE_SECONDS', 0.5)
+    client = client or get_client()
+
+    if payment_ids is None:
+        pending = sync_queue()
+    else:
+        pending = Payment.objects.filter(id__in=payment_ids, synced_to_quickbooks=False)
+    pending = pending.select_related('payment_method', 'payment_category').order_by('pk')
+
+    run = QuickBooksSyncRun.objects.create(client=client.name, batch_size=batch_size, concurrency=concurrency)
+    last_pk = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            # Keyset windows: payments that failed in this run are not read again
+            window = claim_window(pending, last_pk, batch_size * concurrency)
+            if not window:
+                break
+            last_pk = window[-1].pk
+            batches = [window[start:start + batch_size] for start in range(0, len(window), batch_size)]
+            futures = [
+                executor.submit(push_batch, client, [payment_item(payment) for payment in batch], max_retries, retry_base)
+                for batch in batches
+            ]
+
+            now = timezone.now()
+            synced, failed = [], []
+            for batch, future in zip(batches, futures):
+                try:
+                    results, retries, batch_error = future.result()
+                except Exception as error:
+                    # A client bug must not end the run with its other batches unrecorded
+                    logger.exception('QuickBooks batch push failed')
+                    results, retries, batch_error = {}, 0, f'Unexpected error: {error}'
+                run.batches += 1
+                run.retries += retries
+                for payment in batch:
+                    result = results.get(idempotency_key(payment), {})
+                    payment.updated_at, payment.quickbooks_claimed_until = now, None
+                    if 'ref' in result:
+                        payment.synced_to_quickbooks = True
+                        payment.quickbooks_ref = result['ref']
+                        payment.quickbooks_error = ''
+                        payment.quickbooks_retry_at = None
+                        synced.append(payment)
+                    else:
+                        payment.quickbooks_attempts += 1
+                        payment.quickbooks_error = batch_error or result.get('error') or 'No result returned'
+                        payment.quickbooks_retry_at = now + requeue_delay(payment.quickbooks_attempts)
+                        failed.append(payment)
+
+            Payment.objects.bulk_update(
+                synced, [
+                    'synced_to_quickbooks', 'quickbooks_ref', 'quickbooks_error', 'quickbooks_retry_at',
+                    'quickbooks_claimed_until', 'updated_at',
+                ]
+            )
+            Payment.objects.bulk_update(
+                failed, [
+                    'quickbooks_attempts', 'quickbooks_error', 'quickbooks_retry_at',
+                    'quickbooks_claimed_until', 'updated_at',
+                ]
+            )
+            run.synced += len(synced)
+            run.failed += len(failed)
+
+    run.finished_at = timezone.now()
+    run.save()
+    return run
@@ -1,3 +1,559 @@
-from django.test import TestCase
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from account.models import User
+from .ledger import build_records, build_state_path, records_path
+from .models import (
+    Payment, PaymentCategory, PaymentLedgerEntry, PaymentMethod, PaymentMonthlyRollup, PaymentNoteToken,
+    QuickBooksSyncRun,
+)
+from .reports import payment_report
+from .search import prefix_range
+from .quickbooks import AccountingError, FakeQuickBooksClient, QuickBooksClient, TransientAccountingError
+from .sync import payment_item, sync_payments
+
+
+def sheet_xml(path):
+    with zipfile.ZipFile(path) as workbook:
+        return workbook.read('xl/worksheets/sheet1.xml').decode()
+
+
+class PaymentLedgerTests(APITestCase):
+    """New payments are journaled in O(1); the workbook is built from the journal."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            FINANCIAL_RECORDS_PATH=os.path.join(self.directory, 'financial_records.xlsx')
+        )
+        self.settings_override.enable()
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass', is_staff=True
+        )
+        self.method = PaymentMethod.objects.create(name='Card', code='card')
+        self.category = PaymentCategory.objects.create(name='Rent')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+    def pay(self, number, **kwargs):
+        return Payment.objects.create(
+            transaction_id=f'tx-{number}', amount=Decimal('120.50'), payment_method=self.method,
+            payment_category=self.category, payer_id='42', created_by=self.admin, **kwargs
+        )
+
+    def test_recording_cost_does_not_grow_with_history(self):
+        self.pay(1)
+        # Payment insert, ledger insert, rollup update: the workbook is not touched
+        with self.assertNumQueries(3):
+            self.pay(2)
+        for number in range(3, 50):
+            self.pay(number)
+        with self.assertNumQueries(3):
+            self.pay(50)
+        entry = PaymentLedgerEntry.objects.last()
+        self.assertEqual(entry.row[0], 'tx-50')
+        self.assertEqual(entry.row[2], 120.5)
+        self.assertFalse(os.path.exists(records_path()))
+
+    def test_download_builds_only_when_stale(self):
+        self.pay(1, notes='Deposit')
+        self.client.force_authenticate(self.admin)
+
+        response = self.client.get('/api/financial/payments/download-records/')
+        self.assertEqual(response.status_code, 200)
+        b''.join(response.streaming_content)
+        self.assertIn('tx-1', sheet_xml(records_path()))
+        built = os.stat(records_path()).st_mtime_ns
+
+        # Up to date: served as is
+        response = self.client.get('/api/financial/payments/download-records/')
+        b''.join(response.streaming_content)
+        self.assertEqual(os.stat(records_path()).st_mtime_ns, built)
+
+        self.pay(2)
+        response = self.client.get('/api/financial/payments/download-records/')
+        b''.join(response.streaming_content)
+        self.assertIn('tx-2', sheet_xml(records_path()))
+        with open(build_state_path()) as state:
+            self.assertEqual(json.load(state)['rows'], 2)
+
+    def test_build_reads_the_ledger_in_windows(self):
+        for number in range(5):
+            self.pay(number)
+        with mock.patch('financial.ledger.BATCH_SIZE', 2):
+            # Last entry id, then windows of 2, 2 and 1 entries
+            with self.assertNumQueries(4):
+                self.assertEqual(build_records(), 5)
+        self.assertIn('tx-4', sheet_xml(records_path()))
+
+    def test_ledger_keeps_recorded_rows(self):
+        payment = self.pay(1)
+        payment.notes = 'Changed later'
+        payment.save()
+        payment.delete()
+        self.assertEqual(PaymentLedgerEntry.objects.get().row[0], 'tx-1')
+
+    def test_command_backfills_older_payments(self):
+        self.pay(1)
+        PaymentLedgerEntry.objects.all().delete()
+        call_command('build_financial_records', '--backfill', stdout=StringIO())
+        self.assertEqual(PaymentLedgerEntry.objects.count(), 1)
+        self.assertIn('tx-1', sheet_xml(records_path()))
+
+
+class PaymentExportTests(APITestCase):
+    """Exports stream the filtered payments with their relations joined."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass', is_staff=True
+        )
+        card = PaymentMethod.objects.create(name='Card', code='card')
+        rent = PaymentCategory.objects.create(name='Rent')
+        for number in range(5):
+            Payment.objects.create(
+                transaction_id=f'tx-{number}', amount=Decimal(100 + number), payment_method=card,
+                payment_category=rent, payer_id='42', created_by=self.admin,
+                status=Payment.StatusChoices.SUCCESS if number % 2 else Payment.StatusChoices.PENDING,
+            )
+        self.client.force_authenticate(self.admin)
+
+    def test_csv(self):
+        response = self.client.get('/api/financial/payments/export/csv/', {'ordering': 'amount'})
+        # Rows are read in a single joined query while streaming
+        with self.assertNumQueries(1):
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertTrue(lines[0].startswith('Transaction ID,Date,Amount'))
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [f'tx-{number}' for number in range(5)])
+
+    def test_rows_are_read_in_keyset_windows(self):
+        Payment.objects.filter(transaction_id__in=['tx-1', 'tx-2']).update(amount=Decimal('500'))
+        with mock.patch('financial.exports.CHUNK_SIZE', 2):
+            response = self.client.get('/api/financial/payments/export/csv/', {'ordering': '-amount'})
+            # Windows of two, two and one rows, each starting after the last row read
+            with self.assertNumQueries(3):
+                lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], ['tx-1', 'tx-2', 'tx-4', 'tx-3', 'tx-0'])
+
+    def test_filters_match_the_list(self):
+        response = self.client.get('/api/financial/payments/export/csv/', {'status': 'success', 'amount__gte': 102})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(sorted(line.split(',')[0] for line in lines[1:]), ['tx-3'])
+
+    def test_xlsx_continues_on_further_sheets(self):
+        with mock.patch('financial.ledger.SHEET_ROWS', 2):
+            response = self.client.get('/api/financial/payments/export/xlsx/', HTTP_ACCEPT='application/vnd.ms-excel')
+            content = b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(BytesIO(content)) as workbook:
+            sheets = sorted(name for name in workbook.namelist() if name.startswith('xl/worksheets/sheet'))
+            self.assertEqual(len(sheets), 3)
+            self.assertIn('tx-4', workbook.read('xl/worksheets/sheet1.xml').decode())
+
+    def test_unknown_type_and_non_admins(self):
+        self.assertEqual(self.client.get('/api/financial/payments/export/pdf/').status_code, 404)
+        self.client.force_authenticate(User.objects.create_user(username='guest', email='guest@example.com', password='pass'))
+        self.assertEqual(self.client.get('/api/financial/payments/export/csv/').status_code, 403)
+
+
+@override_settings(
+    QUICKBOOKS_CLIENT='financial.quickbooks.FakeQuickBooksClient', QUICKBOOKS_RETRY_BASE_SECONDS=0,
+    QUICKBOOKS_MAX_RETRIES=3, QUICKBOOKS_BATCH_SIZE=3, QUICKBOOKS_CONCURRENCY=2,
+)
+class QuickBooksSyncTests(APITestCase):
+    """Payments are pushed in batches under stable idempotency keys."""
+
+    def setUp(self):
+        FakeQuickBooksClient.reset()
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass', is_staff=True
+        )
+        card = PaymentMethod.objects.create(name='Card', code='card')
+        rent = PaymentCategory.objects.create(name='Rent')
+        self.payments = [
+            Payment.objects.create(
+                transaction_id=f'tx-{number}', amount=Decimal('100.00'), payment_method=card,
+                payment_category=rent, payer_id='42', status=Payment.StatusChoices.SUCCESS,
+            )
+            for number in range(8)
+        ]
+        Payment.objects.filter(pk=self.payments[0].pk).update(status=Payment.StatusChoices.PENDING)
+        self.client.force_authenticate(self.admin)
+
+    def test_queue_is_pushed_in_batches(self):
+        run = sync_payments()
+        self.assertEqual((run.synced, run.failed, run.batches), (7, 0, 3))
+        self.assertEqual([len(batch) for batch in FakeQuickBooksClient.batches], [3, 3, 1])
+        self.assertFalse(Payment.objects.get(pk=self.payments[0].pk).synced_to_quickbooks)
+        refs = set(Payment.objects.filter(synced_to_quickbooks=True).values_list('quickbooks_ref', flat=True))
+        self.assertEqual(refs, set(FakeQuickBooksClient.booked.values()))
+        # Nothing left: the next run pushes nothing
+        self.assertEqual(sync_payments().batches, 0)
+
+    def test_transient_failures_are_retried_without_double_booking(self):
+        calls = []
+        push = FakeQuickBooksClient.push_batch
+
+        def flaky(client, items):
+            calls.append(len(items))
+            results = push(client, items)
+            if len(calls) == 1:
+                # Booked, but the answer is lost
+                raise TransientAccountingError('Timed out')
+            return results
+
+        with mock.patch.object(FakeQuickBooksClient, 'push_batch', flaky):
+            run = sync_payments(concurrency=1)
+        self.assertEqual((run.synced, run.retries), (7, 1))
+        self.assertEqual(len(FakeQuickBooksClient.booked), 7)
+
+    def test_failures_are_recorded_and_requeued(self):
+        FakeQuickBooksClient.reset(reject={'tx-3': 'Invalid customer'})
+        run = sync_payments()
+        self.assertEqual((run.synced, run.failed), (6, 1))
+        rejected = Payment.objects.get(transaction_id='tx-3')
+        self.assertEqual((rejected.quickbooks_attempts, rejected.quickbooks_error), (1, 'Invalid customer'))
+        self.assertIsNotNone(rejected.quickbooks_retry_at)
+
+        response = self.client.get('/api/financial/quickbooks/status/')
+        self.assertEqual(response.data['queue_depth'], 0)
+        self.assertEqual(response.data['awaiting_retry'], 1)
+        self.assertEqual(response.data['last_sync']['synced'], 6)
+
+        FakeQuickBooksClient.reset(failure_rate=1.0)
+        Payment.objects.filter(pk=rejected.pk).update(quickbooks_retry_at=None)
+        run = sync_payments()
+        self.assertEqual((run.failed, run.retries), (1, 3))
+        rejected.refresh_from_db()
+        self.assertEqual((rejected.quickbooks_attempts, rejected.quickbooks_error), (2, 'Service unavailable'))
+
+    def test_payments_claimed_by_another_run_are_skipped(self):
+        claimed = [payment.pk for payment in self.payments[1:4]]
+        Payment.objects.filter(pk__in=claimed).update(quickbooks_claimed_until=timezone.now() + timedelta(minutes=5))
+        run = sync_payments()
+        self.assertEqual(run.synced, 4)
+        self.assertFalse(Payment.objects.filter(pk__in=claimed, synced_to_quickbooks=True).exists())
+        self.assertFalse(Payment.objects.filter(quickbooks_claimed_until__isnull=False).exclude(pk__in=claimed).exists())
+
+        # The lease of a run that died runs out
+        Payment.objects.filter(pk__in=claimed).update(quickbooks_claimed_until=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(sync_payments().synced, 3)
+
+    def test_endpoint_syncs_the_given_payments(self):
+        ids = [self.payments[0].pk, self.payments[1].pk]
+        response = self.client.post('/api/financial/payments/sync/', {'payment_ids': ids}, format='json')
+        self.assertEqual(response.data['synced_count'], 2)
+        self.assertEqual(set(response.data['refs']), set(ids))
+        self.assertEqual(QuickBooksSyncRun.objects.count(), 1)
+
+    def test_unexpected_errors_are_recorded_as_failures(self):
+        with mock.patch.object(FakeQuickBooksClient, 'push_batch', side_effect=KeyError('Id')):
+            with self.assertLogs('financial.sync', level='ERROR'):
+                run = sync_payments()
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual((run.synced, run.failed), (0, 7))
+        self.assertTrue(Payment.objects.get(pk=self.payments[1].pk).quickbooks_error.startswith('Unexpected error'))
+
+    @override_settings(QUICKBOOKS_CLIENT='financial.quickbooks.QuickBooksClient', QUICKBOOKS_ACCESS_TOKEN='')
+    def test_unconfigured_quickbooks_refuses_to_sync(self):
+        response = self.client.post('/api/financial/payments/sync/', {'payment_ids': [self.payments[1].pk]}, format='json')
+        self.assertEqual(response.status_code, 503)
+        with self.assertRaises(CommandError):
+            call_command('sync_quickbooks', stdout=StringIO())
+        self.assertFalse(Payment.objects.filter(synced_to_quickbooks=True).exists())
+        self.assertFalse(QuickBooksSyncRun.objects.exists())
+        self.assertEqual(self.client.get('/api/financial/quickbooks/status/').data['client'], 'quickbooks')
+
+    def test_command(self):
+        out = StringIO()
+        call_command('sync_quickbooks', '--batch-size', '5', stdout=out)
+        self.assertIn('Synced 7 payments in 2 batches', out.getvalue())
+
+
+class StubQuickBooksHandler(BaseHTTPRequestHandler):
+    """QuickBooks Online's query and batch endpoints, backed by ``server.receipts`` (doc number to id)."""
+
+    def log_message(self, *args):
+        pass
+
+    def answer(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)['query'][0]
+        self.server.requests.append(('GET', url.path, query, self.headers['Authorization']))
+        numbers = re.findall(r"'([^']*)'", query)
+        receipts = self.server.receipts
+        found = [{'Id': receipts[number], 'DocNumber': number} for number in numbers if number in receipts]
+        self.answer(200, {'QueryResponse': {'SalesReceipt': found} if found else {}})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append(('POST', url.path, parse_qs(url.query)['requestid'][0], body))
+        if self.server.status != 200:
+            return self.answer(self.server.status, {'Fault': {'Error': [{'Message': 'Unavailable'}]}})
+        answers = []
+        for operation in body['BatchItemRequest']:
+            number = operation['SalesReceipt']['DocNumber']
+            if number in self.server.faults:
+                answers.append({'bId': operation['bId'], 'Fault': {'Error': [{'Message': self.server.faults[number]}]}})
+                continue
+            self.server.receipts[number] = str(100 + len(self.server.receipts))
+            answers.append({'bId': operation['bId'], 'SalesReceipt': {'Id': self.server.receipts[number]}})
+        self.answer(200, {'BatchItemResponse': answers})
+
+
+class QuickBooksClientTests(APITestCase):
+    """The QuickBooks Online client against a local stub of its API."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubQuickBooksHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings_override = override_settings(
+            QUICKBOOKS_CLIENT='financial.quickbooks.QuickBooksClient',
+            QUICKBOOKS_API_URL=f'http://127.0.0.1:{cls.server.server_port}',
+            QUICKBOOKS_REALM_ID='4620816365', QUICKBOOKS_ACCESS_TOKEN='token', QUICKBOOKS_MAX_RETRIES=0,
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests, self.server.receipts, self.server.faults, self.server.status = [], {}, {}, 200
+        card = PaymentMethod.objects.create(name='Card', code='card')
+        rent = PaymentCategory.objects.create(name='Rent')
+        self.payments = [
+            Payment.objects.create(
+                transaction_id=f'pi_{number:024d}', amount=Decimal('100.50'), payment_method=card,
+                payment_category=rent, payer_id='42', status=Payment.StatusChoices.SUCCESS, notes='May rent',
+            )
+            for number in range(3)
+        ]
+
+    def test_receipts_are_created_through_the_batch_endpoint(self):
+        run = sync_payments()
+        self.assertEqual((run.client, run.synced, run.failed), ('quickbooks', 3, 0))
+        method, path, query, authorization = self.server.requests[0]
+        self.assertEqual((method, path, authorization), ('GET', '/v3/company/4620816365/query', 'Bearer token'))
+        self.assertIn(f"'INO-{self.payments[0].pk}'", query)
+
+        method, path, request_id, body = self.server.requests[1]
+        self.assertEqual((method, path), ('POST', '/v3/company/4620816365/batch'))
+        self.assertTrue(request_id)
+        operation = body['BatchItemRequest'][0]
+        self.assertEqual(operation['bId'], f'inorental-payment-{self.payments[0].pk}')
+        self.assertEqual(operation['operation'], 'create')
+        self.assertEqual(operation['SalesReceipt']['DocNumber'], f'INO-{self.payments[0].pk}')
+        self.assertEqual(operation['SalesReceipt']['Line'][0]['Amount'], '100.50')
+        self.assertEqual(operation['SalesReceipt']['PrivateNote'], f'{self.payments[0].transaction_id} May rent')
+
+        refs = dict(Payment.objects.values_list('pk', 'quickbooks_ref'))
+        self.assertEqual(refs, {payment.pk: self.server.receipts[f'INO-{payment.pk}'] for payment in self.payments})
+
+    def test_payments_already_booked_are_not_booked_again(self):
+        # Booked by an earlier, differently composed batch whose answer was lost
+        self.server.receipts[f'INO-{self.payments[1].pk}'] = '77'
+        run = sync_payments()
+        self.assertEqual(run.synced, 3)
+        created = [operation['bId'] for operation in self.server.requests[1][3]['BatchItemRequest']]
+        self.assertNotIn(f'inorental-payment-{self.payments[1].pk}', created)
+        self.assertEqual(Payment.objects.get(pk=self.payments[1].pk).quickbooks_ref, '77')
+
+    def test_faults_fail_their_payment_only(self):
+        self.server.faults[f'INO-{self.payments[2].pk}'] = 'Duplicate Document Number Error'
+        run = sync_payments()
+        self.assertEqual((run.synced, run.failed), (2, 1))
+        rejected = Payment.objects.get(pk=self.payments[2].pk)
+        self.assertEqual(rejected.quickbooks_error, 'Duplicate Document Number Error')
+        self.assertFalse(rejected.synced_to_quickbooks)
+
+    def test_error_statuses(self):
+        payments = Payment.objects.select_related('payment_method', 'payment_category')
+        items = [payment_item(payment) for payment in payments]
+        client = QuickBooksClient()
+        self.server.status = 503
+        with self.assertRaises(TransientAccountingError):
+            client.push_batch(items)
+        self.server.status = 400
+        with self.assertRaisesMessage(AccountingError, 'QuickBooks answered 400'):
+            client.push_batch(items)
+
+
+class PaymentReportTests(APITestCase):
+    """Reports are grouped in SQL, from the rollups for whole months."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass', is_staff=True
+        )
+        self.card = PaymentMethod.objects.create(name='Card', code='card')
+        self.transfer = PaymentMethod.objects.create(name='Transfer', code='transfer')
+        self.rent = PaymentCategory.objects.create(name='Rent')
+        self.deposit = PaymentCategory.objects.create(name='Deposit')
+        self.count = 0
+        self.client.force_authenticate(self.admin)
+
+    def pay(self, day, amount, status=Payment.StatusChoices.SUCCESS, **kwargs):
+        self.count += 1
+        data = {'payment_method': self.card, 'payment_category': self.rent, 'payer_id': '42'}
+        data.update(kwargs)
+        return Payment.objects.create(
+            transaction_id=f'tx-{self.count}', amount=Decimal(amount), status=status,
+            created_at=timezone.make_aware(datetime.combine(day, datetime.min.time())), **data
+        )
+
+    def rollups(self):
+        return sorted(PaymentMonthlyRollup.objects.filter(count__gt=0).values_list(
+            'month', 'currency', 'status', 'payment_category', 'payment_method', 'property_id', 'count', 'amount'
+        ))
+
+    def test_rollups_follow_changes(self):
+        first = self.pay(date(2030, 1, 5), '100.00')
+        self.pay(date(2030, 1, 20), '50.00', property_id='apt-7')
+        failed = self.pay(date(2030, 2, 1), '70.00', status=Payment.StatusChoices.FAILED)
+        first.amount = Decimal('120.00')
+        first.save()
+        failed.status = Payment.StatusChoices.SUCCESS
+        failed.payment_category = self.deposit
+        failed.save()
+        self.pay(date(2030, 3, 1), '10.00').delete()
+
+        maintained = self.rollups()
+        call_command('rebuild_payment_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), maintained)
+        self.assertEqual(len(maintained), 3)
+
+    def test_yearly_report_reads_the_rollups(self):
+        self.pay(date(2030, 1, 5), '100.00')
+        self.pay(date(2030, 1, 9), '40.00', status=Payment.StatusChoices.FAILED)
+        self.pay(date(2030, 3, 2), '60.00', payment_method=self.transfer)
+        self.pay(date(2030, 3, 2), '9.00', currency='EUR')
+        self.pay(date(2031, 1, 1), '500.00')
+        with self.assertNumQueries(1):
+            rows = payment_report('month', date(2030, 1, 1), date(2030, 12, 31))
+        self.assertEqual([(row['month'], row['currency']) for row in rows], [
+            (date(2030, 1, 1), 'USD'), (date(2030, 3, 1), 'EUR'), (date(2030, 3, 1), 'USD'),
+        ])
+        january = rows[0]
+        self.assertEqual((january['payments'], january['successful'], january['failed']), (2, 1, 1))
+        self.assertEqual(january['revenue'], Decimal('100.00'))
+        self.assertEqual((january['success_rate'], january['failure_rate']), (0.5, 0.5))
+
+    def test_partial_months_are_grouped_over_payments(self):
+        self.pay(date(2030, 1, 5), '100.00')
+        self.pay(date(2030, 1, 20), '50.00', payment_category=self.deposit)
+        self.pay(date(2030, 2, 3), '30.00', status=Payment.StatusChoices.PENDING)
+        rows = payment_report('category', date(2030, 1, 10), date(2030, 2, 10))
+        self.assertEqual(
+            [(row['category_name'], row['payments'], row['pending'], row['revenue']) for row in rows],
+            [('Deposit', 1, 0, Decimal('50.00')), ('Rent', 1, 1, 0)]
+        )
+        # Both sources agree over whole months
+        months = payment_report('month', date(2030, 1, 1), date(2030, 1, 31))
+        days = payment_report('month', date(2030, 1, 1), date(2030, 1, 30))
+        self.assertEqual(months[0]['revenue'], Decimal('150.00'))
+        self.assertEqual(days[0]['month'], months[0]['month'])
+        self.assertEqual(days[0]['revenue'], months[0]['revenue'])
+
+    def test_endpoint(self):
+        self.pay(date(2030, 6, 1), '80.00', property_id='apt-7')
+        self.pay(date(2030, 6, 2), '20.00')
+        response = self.client.get('/api/financial/payments/reports/', {
+            'group_by': 'property', 'start': '2030-01-01', 'end': '2030-12-31',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['property_id'], row['revenue']) for row in response.data['results']],
+            [(None, Decimal('20.00')), ('apt-7', Decimal('80.00'))]
+        )
+        response = self.client.get('/api/financial/payments/reports/', {'start': '2030-02-01', 'end': '2030-01-01'})
+        self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(User.objects.create_user(username='guest', email='guest@example.com', password='pass'))
+        self.assertEqual(self.client.get('/api/financial/payments/reports/').status_code, 403)
+
+
+class PaymentLookupTests(APITestCase):
+    """Ids are matched exactly or by prefix range; notes through their token index."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass', is_staff=True
+        )
+        card = PaymentMethod.objects.create(name='Card', code='card')
+        rent = PaymentCategory.objects.create(name='Rent')
+        rows = [
+            ('TX-1001', 'payer-42', 'apt-7', 'Deposit refunded after checkout'),
+            ('TX-1002', 'payer-421', None, 'Late fee waived'),
+            ('TX-2001', 'payer-9', 'apt-70', ''),
+        ]
+        self.payments = {
+            transaction_id: Payment.objects.create(
+                transaction_id=transaction_id, amount=Decimal('10.00'), payment_method=card,
+                payment_category=rent, payer_id=payer_id, property_id=property_id, notes=notes,
+            )
+            for transaction_id, payer_id, property_id, notes in rows
+        }
+        self.client.force_authenticate(self.admin)
+
+    def found(self, **params):
+        response = self.client.get('/api/financial/payments/', params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(payment['transaction_id'] for payment in response.data['results'])
+
+    def test_prefix_and_exact_lookups(self):
+        self.assertEqual(self.found(search='TX-100'), ['TX-1001', 'TX-1002'])
+        self.assertEqual(self.found(search='payer-42'), ['TX-1001', 'TX-1002'])
+        self.assertEqual(self.found(search='payer-42', lookup='exact'), ['TX-1001'])
+        self.assertEqual(self.found(search='apt-7', lookup='exact'), ['TX-1001'])
+        self.assertEqual(self.found(search='1001'), [])
+        self.assertEqual(self.client.get('/api/financial/payments/', {'lookup': 'fuzzy'}).status_code, 400)
+        self.assertEqual(prefix_range('ab'), ('ab', 'ac'))
+
+    def test_notes_index_follows_changes(self):
+        self.assertEqual(self.found(notes='deposit refunded'), ['TX-1001'])
+        self.assertEqual(self.found(notes='deposit waived'), [])
+
+        payment = self.payments['TX-1002']
+        payment.notes = 'Deposit kept'
+        payment.save()
+        self.assertEqual(self.found(notes='DEPOSIT'), ['TX-1001', 'TX-1002'])
+        self.assertEqual(self.found(notes='waived'), [])
+        self.assertEqual(self.found(notes='the'), [])
+
+        PaymentNoteToken.objects.all().delete()
+        call_command('index_payment_notes', stdout=StringIO())
+        self.assertEqual(self.found(notes='kept', search='TX-1'), ['TX-1002'])
 
-# Create your tests here.
@@ -6,7 +6,8 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from . import views
 
-app_name = 'financial'
+# No app_name: NamespaceVersioning would read a 'financial' namespace as an
+# (invalid) API version and 404 every endpoint below.
 
 # Schema view for Swagger/OpenAPI
 docs_schema_view = get_schema_view(
@@ -32,6 +33,8 @@ api_urlpatterns = [
     path('payments/<int:id>/', views.PaymentRetrieveUpdateDestroyView.as_view(), name='payment-detail'),
     path('payments/sync/', views.SyncPaymentsView.as_view(), name='payment-sync'),
     path('payments/download-records/', views.DownloadFinancialRecordsView.as_view(), name='download-records'),
+    path('payments/export/<str:file_type>/', views.PaymentExportView.as_view(), name='payment-export'),
+    path('payments/reports/', views.PaymentReportView.as_view(), name='payment-reports'),
     
     # Rent request endpoints
     path('payments/<int:request_id>/rent-request/status/', views.RentRequestStatusView.as_view(), name='rent-request-status'),
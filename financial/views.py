@@ -2,21 +2,31 @@ from rest_framework import status, filters, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.generics import (
+    GenericAPIView,
     ListCreateAPIView,
     RetrieveUpdateDestroyAPIView,
     ListAPIView
 )
 from rest_framework.permissions import IsAuthenticated, BasePermission
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import FileResponse, JsonResponse
-import os
-from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from core.models import Property
-from .models import Payment, RentRequest
+from core.serializers import PropertySerializer, property_field_selection
+from core.pagination import KeysetOrPageNumberPagination
+from .models import Payment, QuickBooksSyncRun, RentRequest
+from .ledger import ensure_records
+from .exports import CONTENT_TYPES, csv_lines, xlsx_file
+from .quickbooks import client_class
+from .sync import sync_payments, sync_queue
+from .reports import payment_report
+from .search import PaymentSearchFilter
 from .serializers import (
     PaymentSerializer,
     PaymentSyncSerializer,
+    PaymentReportQuerySerializer,
     QuickBooksAccountSerializer,
+    QuickBooksSyncRunSerializer,
     JournalEntrySerializer
 )
 from datetime import timedelta
@@ -28,11 +38,15 @@ class UserPropertiesView(APIView):
     get:
     Returns a list of all properties a user has put up for rent (hosted).
     - **user_id**: The user id (host) whose properties you want to see.
+    - **fields** / **expand** / **compact**: Optional sparse fieldset, as on `/api/properties/`.
     - **Response**: List of property objects.
     """
     def get(self, request, user_id):
-        properties = Property.objects.filter(host_id=user_id)
-        serializer = PropertySerializer(properties, many=True)
+        selection = property_field_selection(request.query_params)
+        properties = PropertySerializer.setup_eager_loading(
+            Property.objects.filter(host_id=user_id), **selection
+        )
+        serializer = PropertySerializer(properties, many=True, context={'request': request}, **selection)
         return Response(serializer.data)
 
 class UserPropertiesByOwnerIdView(APIView):
@@ -68,14 +82,13 @@ class IsAdminUser(BasePermission):
     def has_permission(self, request, view):
         return request.user and request.user.is_staff
 
-class PaymentListCreateView(ListCreateAPIView):
+class PaymentFilterMixin:
     """
-    API endpoint to list all payments or create a new payment.
+    Payment filtering, search and ordering shared by the list and the exports.
     """
     queryset = Payment.objects.all()
-    serializer_class = PaymentSerializer
     permission_classes = [IsAdminUser]
-    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, PaymentSearchFilter]
     filterset_fields = {
         'status': ['exact'],
         'payment_method': ['exact'],
@@ -83,14 +96,76 @@ class PaymentListCreateView(ListCreateAPIView):
         'created_at': ['date__gte', 'date__lte', 'exact'],
         'amount': ['gte', 'lte', 'exact'],
     }
-    search_fields = ['transaction_id', 'payer_id', 'property_id', 'notes']
     ordering_fields = ['created_at', 'amount', 'updated_at']
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
+
+
+class PaymentListCreateView(PaymentFilterMixin, ListCreateAPIView):
+    """
+    API endpoint to list all payments or create a new payment.
+    - **search**: transaction, payer or property id prefix; with `lookup=exact`, the whole id.
+    - **notes**: words the notes must all contain.
+    """
+    serializer_class = PaymentSerializer
+    pagination_class = KeysetOrPageNumberPagination
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
 
+class PaymentExportView(PaymentFilterMixin, GenericAPIView):
+    """
+    get:
+    Downloads the payments matching the list filters (status, payment_method,
+    payment_category, created_at, amount, search, lookup, notes, ordering) as
+    CSV or XLSX.
+    - **file_type**: `csv` or `xlsx`.
+    - Memory use does not depend on the number of payments exported.
+    """
+    pagination_class = None
+
+    def perform_content_negotiation(self, request, force=False):
+        # The file type comes from the URL, so Accept: text/csv must not get a 406
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, file_type):
+        if file_type not in CONTENT_TYPES:
+            raise Http404
+        queryset = self.filter_queryset(self.get_queryset())
+        filename = f"payments_{timezone.localdate():%Y%m%d}.{file_type}"
+
+        if file_type == 'csv':
+            response = StreamingHttpResponse(csv_lines(queryset), content_type=CONTENT_TYPES['csv'])
+            response['Content-Disposition'] = f'attachment; filename={filename}'
+            return response
+        return FileResponse(xlsx_file(queryset), as_attachment=True, filename=filename,
+                            content_type=CONTENT_TYPES['xlsx'])
+
+
+class PaymentReportView(APIView):
+    """
+    get:
+    Payment counts, revenue and success/failure rates between two days,
+    grouped by month, category, method, currency or property, and currency.
+    - **group_by**: `month` (default), `category`, `method`, `currency` or `property`.
+    - **start** / **end**: days, inclusive (default: this year to date).
+    - **currency**, **property_id**: optional filters.
+    Whole months are read from the monthly rollups.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        params = PaymentReportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        query = params.validated_data
+        return Response({
+            'group_by': query['group_by'],
+            'start': query['start'],
+            'end': query['end'],
+            'results': payment_report(**query),
+        })
+
+
 class PaymentRetrieveUpdateDestroyView(RetrieveUpdateDestroyAPIView):
     """
     API endpoint to retrieve, update or delete a payment.
@@ -105,8 +180,8 @@ class PaymentRetrieveUpdateDestroyView(RetrieveUpdateDestroyAPIView):
 class SyncPaymentsView(APIView):
     """
     API endpoint to sync payments with QuickBooks.
-    Currently, this just marks payments as synced.
-    In the future, this will integrate with QuickBooks API.
+    Pushes the given unsynced payments through financial.sync, in batches,
+    and reports the payments booked and those left to retry.
     """
     permission_classes = [IsAuthenticated]
 
@@ -114,19 +189,18 @@ class SyncPaymentsView(APIView):
         serializer = PaymentSyncSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        
-        payment_ids = serializer.validated_data['payment_ids']
-        updated = Payment.objects.filter(
-            id__in=payment_ids,
-            synced_to_quickbooks=False
-        ).update(
-            synced_to_quickbooks=True,
-            quickbooks_ref=f"QB-{timezone.now().strftime('%Y%m%d%H%M%S')}"
-        )
-        
+
+        try:
+            run = sync_payments(payment_ids=serializer.validated_data['payment_ids'])
+        except ImproperlyConfigured as error:
+            return Response({'message': str(error)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         return Response({
-            'message': f'Successfully synced {updated} payments to QuickBooks',
-            'synced_count': updated
+            'message': f'Successfully synced {run.synced} payments to QuickBooks',
+            'synced_count': run.synced,
+            'failed_count': run.failed,
+            'refs': dict(Payment.objects.filter(
+                id__in=serializer.validated_data['payment_ids'], synced_to_quickbooks=True
+            ).values_list('id', 'quickbooks_ref')),
         })
 
 
@@ -137,6 +211,7 @@ class FinancialLogsView(ListAPIView):
     """
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetOrPageNumberPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = {
         'status': ['exact'],
@@ -144,7 +219,7 @@ class FinancialLogsView(ListAPIView):
         'created_at': ['date__gte', 'date__lte', 'exact'],
     }
     ordering_fields = ['created_at', 'amount']
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
 
     def get_queryset(self):
         # In a real implementation, you might want to include more than just payments
@@ -153,18 +228,21 @@ class FinancialLogsView(ListAPIView):
 
 class QuickBooksStatusView(APIView):
     """
-    API endpoint to check QuickBooks connection status.
-    Currently returns a mock response.
+    API endpoint to check the QuickBooks sync: the client in use, payments
+    waiting to be pushed and the last sync run with its throughput.
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        # TODO: Implement actual QuickBooks connection check
+        client = client_class()
+        unsynced = Payment.objects.filter(synced_to_quickbooks=False, status=Payment.StatusChoices.SUCCESS)
+        last_run = QuickBooksSyncRun.objects.filter(finished_at__isnull=False).first()
         return Response({
-            'connected': False,
-            'last_sync': None,
-            'quickbooks_online': False,
-            'message': 'QuickBooks integration is not yet implemented. Currently using mock data.'
+            'client': client.name,
+            'quickbooks_online': client.name == 'quickbooks',
+            'queue_depth': sync_queue().count(),
+            'awaiting_retry': unsynced.filter(quickbooks_retry_at__gt=timezone.now()).count(),
+            'last_sync': QuickBooksSyncRunSerializer(last_run).data if last_run else None,
         })
 
 
@@ -237,20 +315,14 @@ class QuickBooksJournalEntriesView(APIView):
 class DownloadFinancialRecordsView(APIView):
     """
     API endpoint to download the financial records Excel file.
-    Only accessible by admin users.
+    Only accessible by admin users. The workbook is rebuilt from the payment
+    ledger when payments were recorded since the last build.
     """
     permission_classes = [IsAuthenticated, IsAdminUser]
 
     def get(self, request):
-        excel_file_path = os.path.join(settings.BASE_DIR, 'financial_records.xlsx')
-        
-        if not os.path.exists(excel_file_path):
-            return Response(
-                {'error': 'Financial records file not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
-        
         try:
+            excel_file_path = ensure_records()
             response = FileResponse(
                 open(excel_file_path, 'rb'),
                 content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
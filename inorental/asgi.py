@@ -7,10 +7,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "inorental.settings")
 
+# Set up Django before importing consumers, which use the ORM
+django_asgi_app = get_asgi_application()
+
+from core.middleware import JWTAuthMiddleware  # noqa: E402
+from core.routing import websocket_urlpatterns  # noqa: E402
+
 application = ProtocolTypeRouter(
     {
-        "http": get_asgi_application(),
-        # Just for now, we will add websocket later
-        # "websocket": AllowedHostsOriginValidator(AuthMiddlewareStack(URLRouter([]))),
+        "http": django_asgi_app,
+        "websocket": AllowedHostsOriginValidator(
+            AuthMiddlewareStack(JWTAuthMiddleware(URLRouter(websocket_urlpatterns)))
+        ),
     }
 )
@@ -36,6 +36,7 @@ ALLOWED_HOSTS = ["*"]
 # Application definition
 
 INSTALLED_APPS = [
+    "daphne",  # runserver serves the ASGI application, WebSockets included
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -58,6 +59,7 @@ INSTALLED_APPS = [
     "contracts", # Contracts management app
     "cohosts",
     "regulations", # Regulations management
+    "analytics", # Host dashboard rollups
     "djstripe",
 ]
 
@@ -93,6 +95,20 @@ TEMPLATES = [
 WSGI_APPLICATION = "inorental.wsgi.application"
 ASGI_APPLICATION = "inorental.asgi.application"
 
+# WebSocket events are fanned out through Redis when CHANNEL_REDIS_URL is set;
+# the in-memory layer only reaches sockets served by the same process
+if os.environ.get('CHANNEL_REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.environ['CHANNEL_REDIS_URL']]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}
+    }
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -169,6 +185,31 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = 'account.User'
 
+# Cache shared by all workers; local memory unless a backend is configured.
+# Production needs a shared backend (Redis, Memcached): catalog version bumps
+# (core.catalog_cache) only reach the workers sharing the cache.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+
+# Amenity, facility and house-rule catalogs
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+CATALOG_CACHE_MAX_AGE = 300
+
+# Minutes an unpaid booking holds its nights (core.reservations), and how long
+# the hold runs once checkout starts. Checkout sessions expire with the hold;
+# Stripe needs them to last at least 30 minutes.
+BOOKING_HOLD_MINUTES = 30
+BOOKING_CHECKOUT_HOLD_MINUTES = 35
+
+# Property photo variants (core.images): rendered after upload on a thread pool
+PHOTO_VARIANTS_ASYNC = True
+PHOTO_VARIANT_WORKERS = 2
+PHOTO_VARIANT_SIZES = {'thumb': 320, 'medium': 960, 'large': 1920}
+
 # REST Framework settings for JWT
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -246,6 +287,19 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 CORS_ORIGIN_ALLOW_ALL = True
 
+# QuickBooks sync (financial.sync). Payments are booked in QuickBooks Online;
+# syncing refuses to run until the realm and access token are set. Tests use
+# financial.quickbooks.FakeQuickBooksClient through override_settings.
+QUICKBOOKS_CLIENT = os.environ.get('QUICKBOOKS_CLIENT', 'financial.quickbooks.QuickBooksClient')
+QUICKBOOKS_API_URL = os.environ.get('QUICKBOOKS_API_URL', 'https://sandbox-quickbooks.api.intuit.com')
+QUICKBOOKS_REALM_ID = os.environ.get('QUICKBOOKS_REALM_ID', '')
+QUICKBOOKS_ACCESS_TOKEN = os.environ.get('QUICKBOOKS_ACCESS_TOKEN', '')
+QUICKBOOKS_BATCH_SIZE = int(os.environ.get('QUICKBOOKS_BATCH_SIZE', 30))
+QUICKBOOKS_CONCURRENCY = int(os.environ.get('QUICKBOOKS_CONCURRENCY', 4))
+QUICKBOOKS_MAX_RETRIES = 3
+QUICKBOOKS_RETRY_BASE_SECONDS = 0.5
+QUICKBOOKS_REQUEUE_SECONDS = 60
+
 # dj-stripe settings
 STRIPE_LIVE_MODE = False  # Set to True in production
 STRIPE_LIVE_SECRET_KEY = os.environ.get("STRIPE_LIVE_SECRET_KEY", "sk_live_YOUR_LIVE_SECRET_KEY")
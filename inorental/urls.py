@@ -15,11 +15,14 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+import os
+
 from django.contrib import admin
 from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework import permissions
+from core.storage import CAS_PREFIX, serve_immutable
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework_simplejwt.views import (
@@ -68,6 +71,7 @@ urlpatterns = [
     path(settings.BASE_URL + "api/", include("contacts.urls")),  # Include contacts app URLs
     path(settings.BASE_URL + "api/", include("contracts.urls")),  # Include contracts app URLs
     path(settings.BASE_URL + "api/", include("regulations.urls")),  # Include regulations app URLs
+    path(settings.BASE_URL + "api/", include("analytics.urls")),  # Host analytics dashboard
     path(settings.BASE_URL + 'api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path(settings.BASE_URL +  'api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path(settings.BASE_URL +  "api/", include("visitors.urls")),
@@ -80,4 +84,7 @@ urlpatterns = [
     path('', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path(settings.BASE_URL + 'redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
     path("stripe/", include("djstripe.urls", namespace="djstripe")),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+] + static(
+    # Content-addressed media never changes under its URL
+    f'{settings.MEDIA_URL}{CAS_PREFIX}/', view=serve_immutable, document_root=os.path.join(settings.MEDIA_ROOT, CAS_PREFIX)
+) + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
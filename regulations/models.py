@@ -3,7 +3,8 @@ from django.conf import settings
 from django.utils import timezone
 from django.core.validators import FileExtensionValidator
 from enum import Enum
-import os
+
+from core.storage import media_storage
 
 class DocumentType(models.TextChoices):
     BUILDING_REGULATIONS = 'building', 'Building Regulations'
@@ -17,7 +18,7 @@ class RegulationStatus(models.TextChoices):
     ARCHIVED = 'archived', 'Archived'
 
 def regulation_document_path(instance, filename):
-    # File will be uploaded to MEDIA_ROOT/regulations/<id>/<filename>
+    # media_storage keeps only the extension: documents are stored by content hash
     return f'regulations/{instance.id}/{filename}'
 
 class Regulation(models.Model):
@@ -26,6 +27,7 @@ class Regulation(models.Model):
     description = models.TextField(blank=True, null=True)
     document = models.FileField(
         upload_to=regulation_document_path,
+        storage=media_storage,
         validators=[FileExtensionValidator(allowed_extensions=['pdf', 'doc', 'docx', 'txt', 'md'])]
     )
     document_type = models.CharField(
@@ -67,13 +69,6 @@ class Regulation(models.Model):
     def __str__(self):
         return f"{self.title} ({self.get_document_type_display()})"
 
-    def delete(self, *args, **kwargs):
-        """Delete the document file when the regulation is deleted."""
-        if self.document:
-            if os.path.isfile(self.document.path):
-                os.remove(self.document.path)
-        super().delete(*args, **kwargs)
-
 
 class RegulationRecipient(models.Model):
     """Model to track who has received which regulation."""
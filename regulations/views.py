@@ -2,6 +2,7 @@ import os
 from django.shortcuts import get_object_or_404
 from django.http import FileResponse, Http404
 from django.utils import timezone
+from django.utils.text import slugify
 from rest_framework import status, permissions, viewsets, mixins
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -69,7 +70,9 @@ class RegulationViewSet(
         
         try:
             response = FileResponse(regulation.document.open('rb'))
-            filename = os.path.basename(regulation.document.name)
+            # Stored names are content hashes; name the download after the regulation
+            extension = os.path.splitext(regulation.document.name)[1]
+            filename = f'{slugify(regulation.title) or "regulation"}{extension}'
             response['Content-Disposition'] = f'attachment; filename="{filename}"'
             return response
         except FileNotFoundError:
@@ -93,6 +93,9 @@ class Visit(models.Model):
     
     class Meta:
         ordering = ['-visit_date']
+        indexes = [
+            models.Index(fields=['visit_date']),
+        ]
         verbose_name = 'Visit'
         verbose_name_plural = 'Visits'
     
@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from .models import Visitor, Visit
-from core.serializers import PropertySerializer, UserSerializer
+from core.serializers import PropertySerializer, UserSerializer, CurrentBookingListSerializer
 
 class VisitorSerializer(serializers.ModelSerializer):
     """
@@ -54,6 +54,11 @@ class VisitSerializer(serializers.ModelSerializer):
             'property': {'write_only': True},
             'assigned_to': {'write_only': True}
         }
+        list_serializer_class = CurrentBookingListSerializer
+    
+    def current_booking_property_ids(self, instance):
+        """Properties whose current booking is rendered for this visit."""
+        return [instance.property_id]
     
     def create(self, validated_data):
         """Create a new visit."""
@@ -1,3 +1,47 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from account.models import User
+from core.models import Booking, Photo
+from core.tests import create_property
+from .models import Visitor, Visit
+
+
+class VisitListQueryCountTests(APITestCase):
+    """The visit list must not issue per-visit property, booking or visitor queries."""
+
+    def setUp(self):
+        self.agent = User.objects.create_user(username='agent', email='agent@example.com', password='pass')
+        self.client.force_authenticate(self.agent)
+
+    def add_visits(self, count):
+        today = timezone.localdate()
+        for index in range(count):
+            prop = create_property(self.agent)
+            Photo.objects.create(property=prop, image='property_photos/cover.jpg')
+            Booking.objects.create(
+                guest=self.agent, property=prop, check_in_date=today - timedelta(days=1),
+                check_out_date=today + timedelta(days=1), num_guests=1, total_price=100,
+                status='confirmed'
+            )
+            visitor = Visitor.objects.create(
+                first_name='Visitor', last_name=str(index),
+                email=f'visitor{Visitor.objects.count()}@example.com', created_by=self.agent
+            )
+            Visit.objects.create(visitor=visitor, property=prop, assigned_to=self.agent)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/visits/')
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_visit_list(self):
+        self.add_visits(2)
+        small = self.count_queries()
+        self.add_visits(4)
+        self.assertEqual(small, self.count_queries())
@@ -1,12 +1,13 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Q
+from django.db.models import Prefetch, Q
 from django.utils import timezone
 
 from .models import Visitor, Visit
 from .serializers import VisitorSerializer, VisitSerializer
 from core.permissions import IsAdminOrReadOnly
+from core.pagination import KeysetOrPageNumberPagination
 
 
 class VisitorViewSet(viewsets.ModelViewSet):
@@ -68,12 +69,19 @@ class VisitViewSet(viewsets.ModelViewSet):
     """
     serializer_class = VisitSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetOrPageNumberPagination
+    ordering = ['-visit_date', '-id']
     
     def get_queryset(self):
         """
         Optionally filter visits by visitor, property, or upcoming follow-ups.
         """
-        queryset = Visit.objects.all()
+        queryset = Visit.objects.select_related(
+            'visitor__created_by', 'property__host', 'assigned_to'
+        ).prefetch_related(
+            'property__photos', 'property__availabilities',
+            Prefetch('visitor__visits', queryset=Visit.objects.only('id', 'visitor_id'))
+        )
         
         # Filter by visitor if provided
         visitor_id = self.request.query_params.get('visitor', None)